@@ -1,43 +1,214 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort, g, stream_with_context, make_response
 import os
 from datetime import datetime, timedelta
-from functools import wraps
-from pymongo import MongoClient
+from functools import lru_cache, wraps
 from bson.objectid import ObjectId
-import markdown
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError, DuplicateKeyError
 from markupsafe import Markup
 import tempfile
 import io
-from reportlab.lib.pagesizes import letter  # Added for PDF generation
-from reportlab.pdfgen import canvas  # Added for PDF generation
-from reportlab.lib import colors  # Added for PDF generation
-from reportlab.lib.units import inch  
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+import time
+from policy_pdf import PDFCache, PDF_LAYOUT_VERSION, pdf_download_name, preload as preload_pdf
+from policy_html import render_policy_html, html_cache, preload as preload_html
+from pdf_jobs import PDFJobQueue, default_job_dir, job_status, DONE
+from pdf_archive import PDFArchiver, PDF_PROJECTION
+from assessment import Assessor, assess_text
+from caching import TTLCache
+from mongo import LazyCollection, get_db, ensure_indexes, check_indexes, pool_stats
+from user_stats import STATS_PROJECTION, EMPTY_STATS, record_new_policies, record_flag_changes, rebuild_stats
+from policy_versions import edit_policy, list_versions, policy_version, EditConflict
+from passwords import PasswordHasher, HashingBusy
+import metrics
+from policy_store import policy_inputs, missing_fields, new_policy_document, new_shared_policy_document, bulk_create_policies, list_policies, policy_list_item, ndjson_descriptors
+from policy_storage import pack_policy, unpack_policy, html_update
+from policy_blobs import POLICY_DEDUP, attach_blob, attach_blobs, release_blob
+from policy_search import search_policies, flag_filters, backfill_search_keys
+from http_caching import StaticAssets, policy_etag, matching_etag, immutable, revalidate, response_coding, compress, set_compressed
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# Set SECRET_KEY when running several workers so they all accept each other's session cookies
+app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(24)
 app.permanent_session_lifetime = timedelta(days=7)
 
 # MongoDB connection
 # client = MongoClient('mongodb://localhost:27017/')
 ## Now this is for azure 
 
-client = MongoClient(os.environ.get("MONGO_URI"))
-
-db = client['privacy_policy_generator']
-users_collection = db['users']
-policies_collection = db['policies']
-
-# Ensure indexes
-users_collection.create_index("username", unique=True)
-users_collection.create_index("email", unique=True)
+# The client is created lazily in each worker from MONGO_URI (see mongo.py);
+# indexes are created once per deploy with 'flask init-db', and servers refuse to
+# start without them (check_indexes)
+users_collection = LazyCollection('users')
+policies_collection = LazyCollection('policies')
+policy_versions_collection = LazyCollection('policy_versions')
+user_stats_collection = LazyCollection('user_stats')
+# Text shared by identical policies when POLICY_DEDUP is set (see policy_blobs.py)
+policy_blobs_collection = LazyCollection('policy_blobs')
+
+# Rendered PDF cache (set PDF_CACHE_DIR to also keep PDFs on disk across restarts)
+pdf_cache = PDFCache(
+    max_entries=int(os.environ.get("PDF_CACHE_MAX_ENTRIES", 256)),
+    max_bytes=int(os.environ.get("PDF_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    disk_dir=os.environ.get("PDF_CACHE_DIR"),
+    max_item_bytes=int(os.environ.get("PDF_CACHE_MAX_ITEM_BYTES", 1024 * 1024)),
+    spool_threshold=int(os.environ.get("PDF_SPOOL_THRESHOLD", 256 * 1024)),
+    max_concurrent_renders=int(os.environ.get("PDF_MAX_CONCURRENT_RENDERS", 4))
+)
+
+# Background PDF rendering for /policy/<id>/download?async=1
+PDF_JOB_DIR = os.environ.get("PDF_JOB_DIR", default_job_dir())
+pdf_jobs = PDFJobQueue(
+    db_path=os.environ.get("PDF_JOB_DB", os.path.join(PDF_JOB_DIR, "jobs.sqlite3")),
+    artifact_dir=PDF_JOB_DIR,
+    workers=int(os.environ.get("PDF_JOB_WORKERS", 2)),
+    ttl_seconds=int(os.environ.get("PDF_JOB_TTL", 3600))
+)
+
+# ZIP exports render PDFs on their own process pool, a bounded number at a time; like
+# the assess pool it is per gunicorn worker, so it stays small unless configured
+pdf_archiver = PDFArchiver(
+    pdf_cache=pdf_cache,
+    workers=int(os.environ.get("PDF_EXPORT_WORKERS", 2)),
+    window=int(os.environ.get("PDF_EXPORT_WINDOW", 0)) or None
+)
+
+# Large /api/assess uploads are scored on a process pool; every gunicorn worker
+# spawns its own, so it stays small unless ASSESS_WORKERS says otherwise
+assessor = Assessor(workers=int(os.environ.get("ASSESS_WORKERS", 2)))
+ASSESS_MAX_BYTES = int(os.environ.get("ASSESS_MAX_BYTES", 16 * 1024 * 1024))
+
+# Dashboard counters are served from a short-lived per-worker cache
+dashboard_stats_cache = TTLCache(ttl_seconds=int(os.environ.get("DASHBOARD_STATS_TTL", 30)))
+
+# Password hashing runs on a bounded pool; PASSWORD_HASH_METHOD picks the KDF and its parameters
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", 2)),
+    queue_size=int(os.environ.get("PASSWORD_HASH_QUEUE", 16)),
+    admission_timeout=float(os.environ.get("PASSWORD_HASH_ADMISSION_TIMEOUT", 1.0))
+)
+
+# Projected user documents for the logged-in user; password hashes are never cached
+CURRENT_USER_PROJECTION = {"username": 1, "name": 1, "email": 1, "created_at": 1, "last_login": 1}
+current_user_cache = TTLCache(
+    ttl_seconds=int(os.environ.get("CURRENT_USER_TTL", 300)),
+    max_entries=int(os.environ.get("CURRENT_USER_CACHE_SIZE", 4096))
+)
+
+# Number of policies written per insert_many call by the bulk API
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 500))
+
+# Page size for policy listings
+POLICIES_PER_PAGE = 20
+MAX_POLICIES_PER_PAGE = 100
+
+# Query parameters that turn the policy listing into a search
+SEARCH_PARAMS = ('q', 'prefix', 'gdpr', 'ccpa', 'lgpd')
+
+# Static URLs carry a content fingerprint so browsers can cache them for good
+static_assets = StaticAssets(app.static_folder)
+app.url_defaults(static_assets.url_defaults)
+# Rendered pages embed template output and fingerprinted URLs, so their ETags include both
+PAGE_BUILD_ID = static_assets.build_id(os.path.join(app.root_path, app.template_folder))
+FAVICON_MAX_AGE = 24 * 3600
+
+# Log requests slower than this many milliseconds with their MongoDB breakdown (0 disables)
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 0))
+
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    'mongo_pool_connections', 'MongoDB connections in this worker', ('state',),
+    lambda: {("open",): pool_stats.snapshot()["open_connections"], ("in_use",): pool_stats.checked_out}
+))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    'cache_hits_total', 'In-process cache hits', ('cache',),
+    lambda: {(name,): cache.hits for name, cache in _metric_caches()}, kind='counter'
+))
+metrics.REGISTRY.register(metrics.CallbackMetric(
+    'cache_misses_total', 'In-process cache misses', ('cache',),
+    lambda: {(name,): cache.misses for name, cache in _metric_caches()}, kind='counter'
+))
+
+def warm_up():
+    """Import reportlab and markdown, which are otherwise loaded by the first PDF or markdown render.
+
+    Prefork servers that import the app once in the master (GUNICORN_PRELOAD, see
+    gunicorn.conf.py) call this before forking, so workers share the modules
+    copy-on-write instead of each importing them on first use.
+    """
+    preload_pdf()
+    preload_html()
+
+def _metric_caches():
+    return (("pdf", pdf_cache.memory), ("html", html_cache), ("current_user", current_user_cache),
+            ("dashboard_stats", dashboard_stats_cache))
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.current_request.start(request.endpoint or 'unmatched')
+
+@app.after_request
+def record_request_metrics(response):
+    _record_request(response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error):
+    # after_request is skipped when a view raises, so record those here as 500s
+    if error is not None and 'request_started' in g:
+        _record_request(500)
+
+@app.after_request
+def compress_html(response):
+    coding = response_coding(response, request.accept_encodings)
+    if coding:
+        set_compressed(response, compress(response.get_data(), coding), coding)
+    return response
+
+def serve_static(filename):
+    filename, pinned = static_assets.resolve(filename)
+    response = app.send_static_file(filename)
+    return immutable(response) if pinned else response
+
+app.view_functions['static'] = serve_static
+
+def _record_request(status):
+    elapsed = time.perf_counter() - g.pop('request_started')
+    endpoint = request.endpoint or 'unmatched'
+    queries = metrics.current_request.finish()
+    metrics.REQUEST_LATENCY.observe(elapsed, endpoint, request.method)
+    metrics.REQUESTS.inc(endpoint, request.method, str(status))
+    metrics.REQUEST_QUERIES.observe(len(queries), endpoint)
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        app.logger.warning(
+            "slow request %s %s (%s) %d in %.1f ms; %d queries in %.1f ms: %s",
+            request.method, request.path, endpoint, status, elapsed * 1000,
+            len(queries), sum(seconds for _, _, seconds in queries) * 1000,
+            metrics.query_breakdown(queries) or 'none'
+        )
 
 # Custom markdown filter
 @app.template_filter('markdown')
 def render_markdown(text):
-    return Markup(markdown.markdown(text))
+    return Markup(render_policy_html(text))
+
+def get_current_user():
+    """Return the logged-in user's projected document, loaded at most once per request"""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        user = None
+        if user_id:
+            user = current_user_cache.get(user_id)
+            if user is None:
+                user = users_collection.find_one({"_id": ObjectId(user_id)}, CURRENT_USER_PROJECTION)
+                if user is not None:
+                    current_user_cache.set(user_id, user)
+        g.current_user = user
+    return g.current_user
+
+def invalidate_current_user(user_id):
+    """Drop a user from the cache; call after anything that changes their document"""
+    current_user_cache.pop(user_id)
+    g.pop('current_user', None)
 
 # Login required decorator
 def login_required(f):
@@ -73,27 +244,32 @@ def signup():
             flash('Passwords do not match', 'error')
             return render_template('signup.html')
         
-        # Check if username exists
-        if users_collection.find_one({"username": username}):
-            flash('Username already exists', 'error')
-            return render_template('signup.html')
-        
-        # Check if email exists
-        if users_collection.find_one({"email": email}):
-            flash('Email already exists', 'error')
-            return render_template('signup.html')
+        # Hash on the bounded hashing pool so signup bursts can't starve other routes
+        try:
+            password_hash = password_hasher.hash(password)
+        except HashingBusy:
+            flash('We are handling a lot of sign-ups right now. Please try again in a moment.', 'error')
+            return render_template('signup.html'), 503
         
         # Create new user
         new_user = {
             "username": username,
-            "password": generate_password_hash(password),
+            "password": password_hash,
             "name": name,
             "email": email,
             "created_at": datetime.utcnow(),
             "last_login": datetime.utcnow()
         }
         
-        result = users_collection.insert_one(new_user)
+        # The unique indexes on username and email reject duplicates atomically, even for concurrent signups
+        try:
+            result = users_collection.insert_one(new_user)
+        except DuplicateKeyError as e:
+            if _duplicate_user_field(e, username, email) == 'username':
+                flash('Username already exists', 'error')
+            else:
+                flash('Email already exists', 'error')
+            return render_template('signup.html')
         
         if result.inserted_id:
             flash('Account created successfully! Please log in.', 'success')
@@ -103,6 +279,17 @@ def signup():
     
     return render_template('signup.html')
 
+def _duplicate_user_field(error, username, email):
+    """Work out whether a signup collided on username or email"""
+    key = (error.details or {}).get('keyPattern') or (error.details or {}).get('keyValue') or {}
+    if 'username' in key:
+        return 'username'
+    if 'email' in key:
+        return 'email'
+    # Servers that don't report the key get a single lookup covering both fields
+    existing = users_collection.find_one({"$or": [{"username": username}, {"email": email}]}, {"username": 1})
+    return 'username' if existing and existing.get('username') == username else 'email'
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -112,12 +299,25 @@ def login():
         
         user = users_collection.find_one({"username": username})
         
-        if user and check_password_hash(user["password"], password):
-            # Update last login
+        try:
+            valid, needs_rehash = password_hasher.verify(user["password"], password) if user else (False, False)
+        except HashingBusy:
+            flash('We are handling a lot of logins right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
+        
+        if valid:
+            # Update last login, upgrading the stored hash if the hashing parameters changed
+            update = {"last_login": datetime.utcnow()}
+            if needs_rehash:
+                try:
+                    update["password"] = password_hasher.hash(password)
+                except HashingBusy:
+                    pass
             users_collection.update_one(
                 {"_id": user["_id"]},
-                {"$set": {"last_login": datetime.utcnow()}}
+                {"$set": update}
             )
+            invalidate_current_user(str(user["_id"]))
             
             # Set session
             session.permanent = remember
@@ -134,7 +334,9 @@ def login():
 
 @app.route('/logout')
 def logout():
-    session.pop('user_id', None)
+    user_id = session.pop('user_id', None)
+    if user_id:
+        invalidate_current_user(user_id)
     session.pop('username', None)
     session.pop('name', None)
     flash('You have been logged out', 'success')
@@ -144,78 +346,171 @@ def logout():
 @login_required
 def dashboard():
     user_id = session.get('user_id')
-    user = users_collection.find_one({"_id": ObjectId(user_id)})
+    stats = dashboard_stats_cache.get(user_id)
     
-    # Get count of user's policies
-    policy_count = policies_collection.count_documents({"user_id": user_id})
+    if stats is None:
+        stats = user_stats_collection.find_one({"_id": user_id}, STATS_PROJECTION)
+        if stats is None:
+            # Counters predate this user's policies; build them once from the policies
+            rebuild_stats(policies_collection, user_stats_collection, user_id)
+            stats = user_stats_collection.find_one({"_id": user_id}, STATS_PROJECTION) or dict(EMPTY_STATS)
+        dashboard_stats_cache.set(user_id, stats)
     
-    return render_template('dashboard.html', user=user, policy_count=policy_count)
+    return render_template('dashboard.html', user=get_current_user(), stats=stats, policy_count=stats['policy_count'])
 
 @app.route('/create-policy', methods=['GET', 'POST'])
 @login_required
 def create_policy():
     if request.method == 'POST':
-        # Get form data
-        website_name = request.form.get('website_name')
-        website_url = request.form.get('website_url')
-        company_name = request.form.get('company_name')
-        contact_email = request.form.get('contact_email')
+        # Get form data (website info, compliance and data collection options)
+        inputs = policy_inputs(request.form, checkboxes=True)
         
-        # Compliance options
-        gdpr_compliant = request.form.get('gdpr_compliant') == 'on'
-        ccpa_compliant = request.form.get('ccpa_compliant') == 'on'
-        lgpd_compliant = request.form.get('lgpd_compliant') == 'on'
-        
-        # Data collection options
-        collects_personal_info = request.form.get('collects_personal_info') == 'on'
-        collects_cookies = request.form.get('collects_cookies') == 'on'
-        collects_location = request.form.get('collects_location') == 'on'
-        shares_data = request.form.get('shares_data') == 'on'
-        uses_analytics = request.form.get('uses_analytics') == 'on'
-        social_login = request.form.get('social_login') == 'on'
-        has_newsletter = request.form.get('has_newsletter') == 'on'
-        user_accounts = request.form.get('user_accounts') == 'on'
-        processes_payments = request.form.get('processes_payments') == 'on'
-        
-        # Create policy document
-        policy_content = generate_privacy_policy(
-            website_name, website_url, company_name, contact_email,
-            gdpr_compliant, ccpa_compliant, lgpd_compliant,
-            collects_personal_info, collects_cookies, collects_location,
-            shares_data, uses_analytics, social_login, has_newsletter,
-            user_accounts, processes_payments
-        )
-        
-        # Save policy to database
-        new_policy = {
-            "user_id": session.get('user_id'),
-            "website_name": website_name,
-            "website_url": website_url,
-            "company_name": company_name,
-            "content": policy_content,
-            "created_at": datetime.utcnow(),
-            "last_updated": datetime.utcnow(),
-            "gdpr_compliant": gdpr_compliant,
-            "ccpa_compliant": ccpa_compliant,
-            "lgpd_compliant": lgpd_compliant
-        }
-        
-        result = policies_collection.insert_one(new_policy)
+        # Create policy document; policies are immutable, so the HTML is rendered once and stored
+        if POLICY_DEDUP:
+            # Identical policies share one stored text, so this only renders for new text
+            new_policy = new_shared_policy_document(
+                policy_blobs_collection, session.get('user_id'), inputs, render_html=render_policy_html
+            )
+            try:
+                result = policies_collection.insert_one(new_policy)
+            except PyMongoError:
+                release_blob(policy_blobs_collection, new_policy['blob_key'])
+                raise
+        else:
+            new_policy = new_policy_document(session.get('user_id'), inputs)
+            new_policy['content_html'] = render_policy_html(new_policy['content'])
+            # Save policy to database, compacted if POLICY_STORAGE asks for it
+            result = policies_collection.insert_one(pack_policy(new_policy))
         
         if result.inserted_id:
+            record_new_policies(user_stats_collection, new_policy['user_id'], [new_policy])
+            dashboard_stats_cache.pop(new_policy['user_id'])
             flash('Privacy policy created successfully!', 'success')
             return redirect(url_for('view_policy', policy_id=str(result.inserted_id)))
         else:
             flash('Something went wrong. Please try again.', 'error')
     
-    return render_template('create_policy.html')
+    return render_template('create_policy.html', inputs={})
+
+@app.route('/api/policies/bulk', methods=['POST'])
+@login_required
+def bulk_create():
+    """Create many policies at once from a JSON list or an NDJSON stream of site descriptors"""
+    batch_size = request.args.get('batch_size', BULK_BATCH_SIZE, type=int)
+    if batch_size < 1:
+        return jsonify({"error": "batch_size must be positive"}), 400
+    
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        descriptors = ndjson_descriptors(request.stream)
+    else:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict):
+            payload = payload.get('policies')
+        if not isinstance(payload, list):
+            return jsonify({"error": "Expected a JSON list of policies or an NDJSON stream"}), 400
+        descriptors = payload
+    
+    user_id = session.get('user_id')
+    summary = bulk_create_policies(
+        policies_collection, user_id, descriptors, batch_size, user_stats_collection,
+        blobs=policy_blobs_collection if POLICY_DEDUP else None
+    )
+    dashboard_stats_cache.pop(user_id)
+    return jsonify(summary), 207 if summary['failed'] else 201
+
+@app.route('/api/assess', methods=['POST'])
+@login_required
+def assess_policies():
+    """Score third-party policy texts: {"text": ...}, a JSON list of texts or {"text": ...}
+    objects, or an NDJSON stream of them. Nothing is stored."""
+    # Checked before reading, as the whole upload is held in memory while it is scored
+    if request.content_length is None:
+        return jsonify({"error": "Content-Length is required"}), 411
+    if request.content_length > ASSESS_MAX_BYTES:
+        return jsonify({"error": f"Upload is larger than {ASSESS_MAX_BYTES} bytes"}), 413
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = list(ndjson_descriptors(request.stream))
+    else:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict) and 'text' in payload:
+            if not isinstance(payload['text'], str):
+                return jsonify({"error": "text must be a string"}), 400
+            return jsonify(assess_text(payload['text']))
+        if not isinstance(payload, list):
+            return jsonify({"error": "Expected {\"text\": ...}, a JSON list of policy texts or an NDJSON stream"}), 400
+        items = payload
+    
+    started = time.perf_counter()
+    results = []
+    texts = []
+    for index, item in enumerate(items):
+        text = item.get('text') if isinstance(item, dict) else item
+        if isinstance(text, str):
+            texts.append((index, text))
+        else:
+            results.append({"index": index, "error": "Expected a policy text"})
+    # Small uploads aren't worth the round trip to the pool
+    scored = assessor.map(texts) if len(texts) > assessor.chunk_size else ((index, assess_text(text)) for index, text in texts)
+    results.extend({"index": index, **result} for index, result in scored)
+    results.sort(key=lambda item: item["index"])
+    elapsed = time.perf_counter() - started
+    return jsonify({
+        "results": results,
+        "assessed": len(texts),
+        "failed": len(results) - len(texts),
+        "elapsed_seconds": round(elapsed, 4),
+        "policies_per_second": round(len(texts) / elapsed, 1) if elapsed else None
+    })
 
 @app.route('/my-policies')
 @login_required
 def my_policies():
     user_id = session.get('user_id')
-    policies = policies_collection.find({"user_id": user_id}).sort("created_at", -1)
-    return render_template('my_policies.html', policies=policies)
+    search = search_args(request.args)
+    try:
+        if search:
+            policies, next_cursor = search_policies(
+                policies_collection, user_id, search.get('q'), search.get('prefix'), flag_filters(search),
+                request.args.get('cursor'), POLICIES_PER_PAGE
+            )
+        else:
+            policies, next_cursor = list_policies(policies_collection, user_id, request.args.get('cursor'), POLICIES_PER_PAGE)
+    except ValueError:
+        return redirect(url_for('my_policies'))
+    return render_template('my_policies.html', policies=policies, next_cursor=next_cursor, search=search)
+
+def search_args(args):
+    """The non-empty search parameters of a request, kept on pagination links"""
+    return {name: args[name] for name in SEARCH_PARAMS if args.get(name)}
+
+@app.route('/api/policies')
+@login_required
+def api_policies():
+    user_id = session.get('user_id')
+    limit = min(max(request.args.get('limit', POLICIES_PER_PAGE, type=int), 1), MAX_POLICIES_PER_PAGE)
+    try:
+        policies, next_cursor = list_policies(policies_collection, user_id, request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    return jsonify({"policies": [policy_list_item(policy) for policy in policies], "next_cursor": next_cursor})
+
+@app.route('/api/policies/search')
+@login_required
+def api_search_policies():
+    """Ranked search: q matches terms in the name, company, URL and content, prefix the start of
+    the site name or URL, and gdpr/ccpa/lgpd=true|false filter on compliance flags"""
+    user_id = session.get('user_id')
+    limit = min(max(request.args.get('limit', POLICIES_PER_PAGE, type=int), 1), MAX_POLICIES_PER_PAGE)
+    try:
+        policies, next_cursor = search_policies(
+            policies_collection, user_id, request.args.get('q'), request.args.get('prefix'),
+            flag_filters(request.args), request.args.get('cursor'), limit
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"policies": [policy_list_item(policy) for policy in policies], "next_cursor": next_cursor})
 
 @app.route('/policy/<policy_id>')
 @login_required
@@ -227,348 +522,254 @@ def view_policy(policy_id):
         flash('Policy not found or you do not have permission to view it', 'error')
         return redirect(url_for('my_policies'))
     
-    return render_template('view_policy.html', policy=policy)
-
-@app.route('/policy/<policy_id>/download')
+    # Pending flash messages are part of the page, so those views are always rendered
+    etag = policy_etag(policy, PAGE_BUILD_ID)
+    cached = matching_etag(etag, request.if_none_match)
+    if cached and '_flashes' not in session:
+        response = app.response_class(status=304)
+        response.set_etag(cached)
+        return revalidate(response)
+    
+    unpack_policy(attach_blob(policy_blobs_collection, policy))
+    # Lazily backfill the rendered HTML for policies stored before it was kept alongside content
+    if 'content_html' not in policy:
+        policy['content_html'] = render_policy_html(policy['content'])
+        update = html_update(policy, policy['content_html'])
+        if update and 'blob_key' in policy:
+            policy_blobs_collection.update_one({"_id": policy['blob_key']}, {"$set": update})
+        elif update:
+            policies_collection.update_one({"_id": policy["_id"]}, {"$set": update})
+    
+    response = make_response(render_template('view_policy.html', policy=policy))
+    response.set_etag(etag)
+    return revalidate(response)
+
+@app.route('/policy/<policy_id>/edit', methods=['GET', 'POST'])
 @login_required
-def download_policy(policy_id):
+def edit_policy_view(policy_id):
     user_id = session.get('user_id')
     policy = policies_collection.find_one({"_id": ObjectId(policy_id), "user_id": user_id})
     
     if not policy:
-        flash('Policy not found or you do not have permission to access it', 'error')
+        flash('Policy not found or you do not have permission to edit it', 'error')
         return redirect(url_for('my_policies'))
     
-    # Create a PDF in memory using reportlab
-    buffer = io.BytesIO()
-    
-    # Create a SimpleDocTemplate with 2px border
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        leftMargin=inch,
-        rightMargin=inch,
-        topMargin=inch,
-        bottomMargin=inch
-    )
+    unpack_policy(attach_blob(policy_blobs_collection, policy))
+    form_action = url_for('edit_policy_view', policy_id=policy_id)
     
-    # Define styles
-    styles = getSampleStyleSheet()
-    
-    # Create custom styles
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Title'],
-        fontSize=18,
-        spaceAfter=12
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=8
-    )
-    
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceBefore=6
-    )
-    
-    heading1_style = ParagraphStyle(
-        'Heading1',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceBefore=12,
-        spaceAfter=6
-    )
-    
-    heading2_style = ParagraphStyle(
-        'Heading2',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceBefore=10,
-        spaceAfter=4
-    )
-    
-    heading3_style = ParagraphStyle(
-        'Heading3',
-        parent=styles['Heading3'],
-        fontSize=12,
-        spaceBefore=8,
-        spaceAfter=4
-    )
-    
-    # Prepare document elements
-    elements = []
-    
-    # Add main title
-    elements.append(Paragraph(f"{policy['website_name']} Privacy Policy", title_style))
-    elements.append(Spacer(1, 0.2 * inch))
-    
-    # Add metadata
-    info_data = [
-        ["Website:", policy['website_url']],
-        ["Company:", policy['company_name']],
-        ["Last Updated:", policy['last_updated'].strftime('%B %d, %Y')]
-    ]
-    
-    # Add compliance badges
-    compliance = []
-    if policy['gdpr_compliant']:
-        compliance.append("GDPR Compliant")
-    if policy['ccpa_compliant']:
-        compliance.append("CCPA Compliant")
-    if policy['lgpd_compliant']:
-        compliance.append("LGPD Compliant")
-    
-    if compliance:
-        info_data.append(["Compliance:", ", ".join(compliance)])
-    
-    # Create table with metadata
-    info_table = Table(info_data, colWidths=[2*inch, 4*inch])
-    info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
-    
-    elements.append(info_table)
-    elements.append(Spacer(1, 0.3 * inch))
-    
-    # Process policy content
-    policy_content = policy['content']
-    
-    # Split content by lines to process markdown headings
-    lines = policy_content.split('\n')
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
+    if request.method == 'POST':
+        inputs = policy_inputs(request.form, checkboxes=True)
+        if missing_fields(inputs):
+            flash('All website information fields are required', 'error')
+            return render_template('create_policy.html', inputs=inputs, form_action=form_action)
         
-        # Process headers
-        if line.startswith('# '):
-            elements.append(Paragraph(line[2:], heading1_style))
-        elif line.startswith('## '):
-            elements.append(Paragraph(line[3:], heading2_style))
-        elif line.startswith('### '):
-            elements.append(Paragraph(line[4:], heading3_style))
-        # Process bullet points
-        elif line.startswith('- '):
-            elements.append(Paragraph("• " + line[2:], normal_style))
-        # Process normal text
-        elif line:
-            # Remove markdown bold
-            cleaned_line = line.replace('**', '')
-            elements.append(Paragraph(cleaned_line, normal_style))
-        # Add a small spacer for empty lines to maintain paragraph breaks
-        elif i > 0 and lines[i-1].strip():
-            elements.append(Spacer(1, 0.1 * inch))
+        try:
+            update = edit_policy(
+                policies_collection, policy_versions_collection, policy, inputs, render_html=render_policy_html,
+                blobs=policy_blobs_collection, dedup=POLICY_DEDUP
+            )
+        except (EditConflict, DuplicateKeyError):
+            flash('This policy was changed by another request. Please review it and try again.', 'error')
+            return redirect(url_for('edit_policy_view', policy_id=policy_id))
         
-        i += 1
-    
-    # Build the PDF with a border
-    def add_border(canvas, doc):
-        canvas.saveState()
-        canvas.setStrokeColor(colors.black)
-        canvas.setLineWidth(2)
-        canvas.rect(
-            doc.leftMargin - 10,
-            doc.bottomMargin - 10,
-            doc.width + 20,
-            doc.height + 20,
-            stroke=1,
-            fill=0
-        )
-        canvas.restoreState()
-    
-    # Build PDF
-    doc.build(elements, onFirstPage=add_border, onLaterPages=add_border)
-    
-    # Prepare the buffer for sending
-    buffer.seek(0)
-    
-    # Send the PDF file for download
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f"{policy['website_name']}_Privacy_Policy.pdf",
-        mimetype='application/pdf'
+        if update is None:
+            flash('No changes to save.', 'success')
+        else:
+            record_flag_changes(user_stats_collection, user_id, policy, update)
+            dashboard_stats_cache.pop(user_id)
+            flash('Privacy policy updated successfully!', 'success')
+        return redirect(url_for('view_policy', policy_id=policy_id))
+    
+    # Policies created before inputs were stored are prefilled from what the document has
+    inputs = policy.get('inputs') or {
+        field: policy.get(field)
+        for field in ('website_name', 'website_url', 'company_name', 'gdpr_compliant', 'ccpa_compliant', 'lgpd_compliant')
+    }
+    return render_template('create_policy.html', inputs=inputs, form_action=form_action)
+
+@app.route('/policy/<policy_id>/versions')
+@login_required
+def policy_versions(policy_id):
+    user_id = session.get('user_id')
+    policy = policies_collection.find_one(
+        {"_id": ObjectId(policy_id), "user_id": user_id}, {"version": 1, "last_updated": 1}
     )
-
-@app.route('/favicon.ico')
-def favicon():
-    return send_file('static/img/favicon.png', mimetype='image/png')
-
-def generate_privacy_policy(website_name, website_url, company_name, contact_email,
-                          gdpr_compliant, ccpa_compliant, lgpd_compliant,
-                          collects_personal_info, collects_cookies, collects_location,
-                          shares_data, uses_analytics, social_login, has_newsletter,
-                          user_accounts, processes_payments):
-    """Generate a privacy policy based on provided information"""
-    
-    # Base policy content
-    policy = f"""# Privacy Policy for {website_name}
-
-## Last Updated: {datetime.now().strftime('%B %d, %Y')}
-
-### Introduction
-
-Welcome to {website_name}. This Privacy Policy explains how {company_name} ("we", "us", or "our") collects, uses, and discloses your information when you use our website {website_url} (the "Service").
-
-We respect your privacy and are committed to protecting your personal data. Please read this Privacy Policy carefully to understand how we handle your information.
-
-### Information We Collect
-
-"""
-    
-    # Add sections based on collected information
-    if collects_personal_info:
-        policy += """We may collect personal information that you provide directly to us, such as:
-- Name
-- Email address
-- Phone number
-- Billing and shipping address
-- Payment information
-- Any other information you choose to provide
-
-"""
-    else:
-        policy += """We do not collect personally identifiable information unless you voluntarily provide it to us.
-
-"""
+    if not policy:
+        abort(404)
+    versions = list_versions(policy, policy_versions_collection)
+    for version in versions:
+        version['last_updated'] = version['last_updated'].isoformat()
+        version['url'] = url_for('view_policy_version', policy_id=policy_id, version=version['version'])
+    return jsonify({"policy_id": policy_id, "versions": versions})
+
+@app.route('/policy/<policy_id>/versions/<int:version>')
+@login_required
+def view_policy_version(policy_id, version):
+    user_id = session.get('user_id')
+    policy = policies_collection.find_one({"_id": ObjectId(policy_id), "user_id": user_id})
+    if policy:
+        unpack_policy(attach_blob(policy_blobs_collection, policy))
+    old_policy = policy_version(policy, policy_versions_collection, version) if policy else None
     
-    if collects_cookies:
-        policy += """### Cookies and Tracking Technologies
-
-We use cookies and similar tracking technologies to track activity on our Service and hold certain information. Cookies are files with a small amount of data which may include an anonymous unique identifier.
-
-You can instruct your browser to refuse all cookies or to indicate when a cookie is being sent. However, if you do not accept cookies, you may not be able to use some portions of our Service.
-
-"""
+    if not old_policy:
+        flash('Policy version not found', 'error')
+        return redirect(url_for('my_policies'))
     
-    if collects_location:
-        policy += """### Location Data
+    old_policy['content_html'] = render_policy_html(old_policy['content'])
+    return render_template('view_policy.html', policy=old_policy, current_version=policy.get('version', 1))
 
-We may collect information about your location, such as through GPS, IP address, or other location-based technologies, to provide location-specific services or improve your experience.
-
-"""
+@app.route('/policy/<policy_id>/download')
+@login_required
+def download_policy(policy_id):
+    user_id = session.get('user_id')
+    policy = policies_collection.find_one({"_id": ObjectId(policy_id), "user_id": user_id})
     
-    if uses_analytics:
-        policy += """### Analytics
-
-We may use third-party Service Providers to monitor and analyze the use of our Service, such as:
-- Google Analytics
-- Facebook Pixel
-- Other analytics services
-
-"""
+    if not policy:
+        flash('Policy not found or you do not have permission to access it', 'error')
+        return redirect(url_for('my_policies'))
     
-    if social_login:
-        policy += """### Social Media Login
-
-We may offer login services through third-party social media platforms (e.g., Facebook, Google). When you use these services, we may collect information from your social media profile as permitted by your settings on those platforms.
-
-"""
+    # Optionally render in the background and let the client poll for the result
+    if request.args.get('async') == '1':
+        attach_blob(policy_blobs_collection, policy)
+        job = pdf_jobs.enqueue(unpack_policy(policy), user_id, pdf_download_name(policy))
+        return jsonify(job_status(job, url_for)), 202
     
-    if has_newsletter:
-        policy += """### Email Newsletters
-
-If you subscribe to our newsletter, we may collect your email address and other relevant information to send you marketing communications. You may unsubscribe from these communications at any time.
-
-"""
+    # Edits bump last_updated, so revalidation needs neither the content nor the PDF
+    etag = policy_etag(policy, f"pdf-{PDF_LAYOUT_VERSION}")
     
-    if user_accounts:
-        policy += """### User Accounts
-
-If you create an account with us, we collect information necessary to maintain your account, such as your username, password (encrypted), and any profile information you choose to provide.
-
-"""
+    cached = matching_etag(etag, request.if_none_match)
+    if cached:
+        response = app.response_class(status=304)
+        response.set_etag(cached)
+        return revalidate(response)
     
-    if processes_payments:
-        policy += """### Payment Processing
-
-We may collect payment information (e.g., credit card details) when you make purchases through our Service. This information is processed securely through third-party payment processors.
-
-"""
+    # The rendered PDF is cached by content hash
+    _, pdf_file, size = pdf_cache.open(unpack_policy(attach_blob(policy_blobs_collection, policy)))
     
-    if shares_data:
-        policy += """### Sharing Your Information
-
-We may share your personal information with:
-- Service providers who perform services on our behalf
-- Business partners with whom we jointly offer products or services
-- As required by law or to comply with legal process
-- To protect and defend our rights and property
+    # Stream the PDF file for download; large PDFs are read from disk in chunks
+    response = send_file(
+        pdf_file,
+        as_attachment=True,
+        download_name=pdf_download_name(policy),
+        mimetype='application/pdf',
+        etag=False
+    )
+    response.content_length = size
+    response.set_etag(etag)
+    return revalidate(response)
 
-"""
-    
-    # Add compliance sections
-    if gdpr_compliant:
-        policy += f"""### GDPR Compliance
-
-For users in the European Union (EU) and European Economic Area (EEA), we process your data in accordance with the General Data Protection Regulation (GDPR). You have the following rights:
-- Right to access your personal data
-- Right to rectification if your data is inaccurate or incomplete
-- Right to erasure (right to be forgotten)
-- Right to restrict processing
-- Right to data portability
-- Right to object to processing
-- Rights in relation to automated decision making and profiling
-
-To exercise these rights, please contact us at {contact_email}.
-
-"""
+@app.route('/policies/export', methods=['GET', 'POST'])
+@login_required
+def export_policies():
+    """Stream a ZIP of PDFs for the selected policies (policy_id values), or all of them"""
+    user_id = session.get('user_id')
+    payload = request.get_json(silent=True) if request.is_json else None
+    ids = payload.get('policy_ids', []) if isinstance(payload, dict) else request.values.getlist('policy_id')
+    
+    query = {"user_id": user_id}
+    if ids:
+        try:
+            query["_id"] = {"$in": [ObjectId(policy_id) for policy_id in ids]}
+        except (InvalidId, TypeError):
+            abort(400)
+    elif request.method == 'POST' and not request.values.get('all'):
+        flash('Select at least one policy to download', 'error')
+        return redirect(url_for('my_policies'))
     
-    if ccpa_compliant:
-        policy += f"""### CCPA Compliance
-
-For California residents, the California Consumer Privacy Act (CCPA) provides you with specific rights regarding your personal information. You have the right to:
-- Know what personal information is being collected about you
-- Know whether your personal information is sold or disclosed and to whom
-- Opt out of the sale of your personal information
-- Access your personal information
-- Request deletion of your personal information
-- Not be discriminated against for exercising your CCPA rights
-
-To exercise these rights, please contact us at {contact_email}.
+    policies = policies_collection.find(query, PDF_PROJECTION).sort([("created_at", -1), ("_id", -1)])
+    return app.response_class(
+        stream_with_context(pdf_archiver.stream(
+            unpack_policy(policy) for policy in attach_blobs(policy_blobs_collection, policies)
+        )),
+        mimetype='application/zip',
+        headers={"Content-Disposition": 'attachment; filename="Privacy_Policies.zip"'}
+    )
 
-"""
-    
-    if lgpd_compliant:
-        policy += f"""### LGPD Compliance
+def _user_job(job_id):
+    job = pdf_jobs.get(job_id)
+    if not job or job['user_id'] != session.get('user_id'):
+        abort(404)
+    return job
 
-For users in Brazil, we process your data in accordance with the Lei Geral de Proteção de Dados (LGPD). You have rights similar to those under GDPR, including:
-- Confirmation of the existence of data processing
-- Access to your personal data
-- Correction of incomplete, inaccurate, or outdated data
-- Anonymization, blocking, or deletion of unnecessary or non-compliant data
-- Data portability
-- Information about sharing of your data
+@app.route('/jobs/<job_id>')
+@login_required
+def pdf_job_status(job_id):
+    return jsonify(job_status(_user_job(job_id), url_for))
 
-To exercise these rights, please contact us at {contact_email}.
+@app.route('/jobs/<job_id>/artifact')
+@login_required
+def pdf_job_artifact(job_id):
+    job = _user_job(job_id)
+    if job['status'] != DONE:
+        return jsonify(job_status(job, url_for)), 409
+    return send_file(job['path'], as_attachment=True, download_name=job['download_name'], mimetype='application/pdf')
 
-"""
-    
-    # Contact information
-    policy += f"""### Contact Us
+@app.route('/pdf-cache/stats')
+@login_required
+def pdf_cache_stats():
+    return jsonify(pdf_cache.stats())
 
-If you have any questions about this Privacy Policy, please contact us at:
-- Email: {contact_email}
-- Website: {website_url}
-- Company: {company_name}
+@app.route('/cache/stats')
+@login_required
+def cache_stats():
+    return jsonify({
+        "pdf": pdf_cache.stats(),
+        "html": html_cache.stats(),
+        "current_user": current_user_cache.stats(),
+        "dashboard_stats": dashboard_stats_cache.stats()
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Counters are per worker process; Prometheus aggregates across the scraped instances
+    return metrics.REGISTRY.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the MongoDB indexes the app relies on."""
+    ensure_indexes(get_db())
+    print("Indexes created")
+
+@app.route('/healthz')
+def healthz():
+    try:
+        get_db().command('ping')
+        ok = True
+    except PyMongoError:
+        ok = False
+    return jsonify({"status": "ok" if ok else "unavailable", "mongo_pool": pool_stats.snapshot()}), 200 if ok else 503
+
+@app.cli.command('backfill-search')
+def backfill_search_command():
+    """Add the prefix search keys to policies created before search existed."""
+    count = backfill_search_keys(policies_collection)
+    print(f"Added search keys to {count} policies")
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute every user's dashboard counters from the policies collection."""
+    count = rebuild_stats(policies_collection, user_stats_collection)
+    print(f"Rebuilt dashboard stats for {count} users")
 
-"""
-    
-    return policy
+@app.route('/favicon.ico')
+def favicon():
+    # Browsers request this path directly, so it can't be fingerprinted; it's kept in memory instead
+    data, digest = _favicon()
+    response = app.response_class(data, mimetype='image/png')
+    response.set_etag(digest)
+    response.cache_control.public = True
+    response.cache_control.max_age = FAVICON_MAX_AGE
+    return response.make_conditional(request)
+
+@lru_cache(maxsize=1)
+def _favicon():
+    with app.open_resource('static/img/favicon.png') as f:
+        return f.read(), static_assets.digest('img/favicon.png')
 
 # if __name__ == '__main__':
 #     app.run(debug=True)
 if __name__ == '__main__':
     import os
     port = int(os.environ.get("PORT", 5000))
+    check_indexes(get_db())
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,372 @@
+"""Optional ASGI serving mode.
+
+The read-heavy routes (dashboard, my_policies, view_policy, download_policy, login
+and the JSON listing/search/job APIs) run as Quart coroutines over Motor, so a
+worker can hold many concurrent readers while Mongo round trips are in flight. PDF
+rendering, password hashing and SQLite job lookups run on a thread pool. Every other route
+is handed to the regular Flask app through a WSGI adapter, and both apps share
+the templates, caches, session cookie and policy generation code.
+
+    pip install -r requirements.txt
+    pip install --no-deps -r requirements-async.txt
+    hypercorn asgi:application --workers 4 --bind 0.0.0.0:8000
+"""
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial, wraps
+
+from bson.objectid import ObjectId
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient
+from quart import Quart, Response, abort, flash, g, jsonify, redirect, render_template, request, session, url_for
+from werkzeug.exceptions import HTTPException
+
+import app as wsgi
+import metrics
+from mongo import DB_NAME, check_indexes, client_options
+from passwords import HashingBusy
+from http_caching import attachment, immutable, matching_etag, policy_etag, revalidate, response_coding, compress, set_compressed
+from policy_blobs import attach_blob_async
+from pdf_jobs import job_status
+from policy_pdf import PDF_LAYOUT_VERSION, pdf_download_name
+from policy_search import flag_filters, search_policies_async
+from policy_store import list_policies_async, policy_list_item
+from policy_storage import html_update, unpack_policy
+from user_stats import EMPTY_STATS, STATS_PROJECTION, rebuild_stats
+
+# Threads for blocking work (KDF, PDF rendering, SQLite, stats rebuilds) in this worker
+ASGI_BLOCKING_WORKERS = int(os.environ.get("ASGI_BLOCKING_WORKERS", 16))
+PDF_CHUNK_SIZE = 64 * 1024
+
+async_app = Quart(__name__, template_folder=wsgi.app.template_folder, static_folder=wsgi.app.static_folder)
+# Same key and lifetime, so session cookies are interchangeable between the two apps
+async_app.secret_key = wsgi.app.secret_key
+async_app.permanent_session_lifetime = wsgi.app.permanent_session_lifetime
+async_app.add_template_filter(wsgi.render_markdown, 'markdown')
+async_app.url_defaults(wsgi.static_assets.url_defaults)
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_BLOCKING_WORKERS, thread_name_prefix='asgi-blocking')
+_motor = None
+
+
+def get_async_db():
+    """Motor database for this worker's event loop, created on first use"""
+    global _motor
+    if _motor is None:
+        _motor = AsyncIOMotorClient(os.environ.get("MONGO_URI"), **client_options())
+    return _motor[DB_NAME]
+
+
+async def run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, partial(func, *args))
+
+
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            await flash('Please log in to access this page', 'error')
+            return redirect(url_for('login'))
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+async def get_current_user():
+    """Async counterpart of app.get_current_user, sharing its per-worker cache"""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        user = None
+        if user_id:
+            user = wsgi.current_user_cache.get(user_id)
+            if user is None:
+                user = await get_async_db().users.find_one({"_id": ObjectId(user_id)}, wsgi.CURRENT_USER_PROJECTION)
+                if user is not None:
+                    wsgi.current_user_cache.set(user_id, user)
+        g.current_user = user
+    return g.current_user
+
+
+@async_app.before_request
+async def start_request_metrics():
+    g.request_started = time.perf_counter()
+
+
+@async_app.after_request
+async def record_request_metrics(response):
+    # Motor runs commands on its own threads, so queries aren't attributed per request here
+    if 'request_started' in g:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - g.request_started, endpoint, request.method)
+        metrics.REQUESTS.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+
+@async_app.after_request
+async def compress_html(response):
+    coding = response_coding(response, request.accept_encodings)
+    if coding:
+        set_compressed(response, compress(await response.get_data(), coding), coding)
+    return response
+
+
+async def serve_static(filename):
+    filename, pinned = wsgi.static_assets.resolve(filename)
+    response = await async_app.send_static_file(filename)
+    return immutable(response) if pinned else response
+
+async_app.view_functions['static'] = serve_static
+
+
+def _not_modified(etag):
+    response = Response(b'', status=304)
+    response.set_etag(etag)
+    return revalidate(response)
+
+
+@async_app.route('/login', methods=['GET', 'POST'])
+async def login():
+    if request.method == 'POST':
+        form = await request.form
+        username = form.get('username')
+        password = form.get('password')
+        remember = form.get('remember') == 'on'
+
+        users = get_async_db().users
+        user = await users.find_one({"username": username})
+
+        try:
+            valid, needs_rehash = (
+                await run_blocking(wsgi.password_hasher.verify, user["password"], password) if user else (False, False)
+            )
+        except HashingBusy:
+            await flash('We are handling a lot of logins right now. Please try again in a moment.', 'error')
+            return await render_template('login.html'), 503
+
+        if valid:
+            # Update last login, upgrading the stored hash if the hashing parameters changed
+            update = {"last_login": datetime.utcnow()}
+            if needs_rehash:
+                try:
+                    update["password"] = await run_blocking(wsgi.password_hasher.hash, password)
+                except HashingBusy:
+                    pass
+            await users.update_one({"_id": user["_id"]}, {"$set": update})
+            wsgi.current_user_cache.pop(str(user["_id"]))
+
+            session.permanent = remember
+            session['user_id'] = str(user["_id"])
+            session['username'] = user["username"]
+            session['name'] = user["name"]
+
+            await flash('Login successful!', 'success')
+            return redirect(url_for('dashboard'))
+        else:
+            await flash('Invalid username or password', 'error')
+
+    return await render_template('login.html')
+
+
+@async_app.route('/dashboard')
+@login_required
+async def dashboard():
+    user_id = session.get('user_id')
+    stats = wsgi.dashboard_stats_cache.get(user_id)
+
+    if stats is None:
+        user_stats = get_async_db().user_stats
+        stats = await user_stats.find_one({"_id": user_id}, STATS_PROJECTION)
+        if stats is None:
+            # Counters predate this user's policies; build them once from the policies
+            await run_blocking(rebuild_stats, wsgi.policies_collection, wsgi.user_stats_collection, user_id)
+            stats = await user_stats.find_one({"_id": user_id}, STATS_PROJECTION) or dict(EMPTY_STATS)
+        wsgi.dashboard_stats_cache.set(user_id, stats)
+
+    return await render_template(
+        'dashboard.html', user=await get_current_user(), stats=stats, policy_count=stats['policy_count']
+    )
+
+
+@async_app.route('/my-policies')
+@login_required
+async def my_policies():
+    user_id = session.get('user_id')
+    search = wsgi.search_args(request.args)
+    try:
+        if search:
+            policies, next_cursor = await search_policies_async(
+                get_async_db().policies, user_id, search.get('q'), search.get('prefix'), flag_filters(search),
+                request.args.get('cursor'), wsgi.POLICIES_PER_PAGE
+            )
+        else:
+            policies, next_cursor = await list_policies_async(
+                get_async_db().policies, user_id, request.args.get('cursor'), wsgi.POLICIES_PER_PAGE
+            )
+    except ValueError:
+        return redirect(url_for('my_policies'))
+    return await render_template('my_policies.html', policies=policies, next_cursor=next_cursor, search=search)
+
+
+@async_app.route('/api/policies')
+@login_required
+async def api_policies():
+    user_id = session.get('user_id')
+    limit = min(max(request.args.get('limit', wsgi.POLICIES_PER_PAGE, type=int), 1), wsgi.MAX_POLICIES_PER_PAGE)
+    try:
+        policies, next_cursor = await list_policies_async(
+            get_async_db().policies, user_id, request.args.get('cursor'), limit
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify({"policies": [policy_list_item(policy) for policy in policies], "next_cursor": next_cursor})
+
+
+@async_app.route('/api/policies/search')
+@login_required
+async def api_search_policies():
+    user_id = session.get('user_id')
+    limit = min(max(request.args.get('limit', wsgi.POLICIES_PER_PAGE, type=int), 1), wsgi.MAX_POLICIES_PER_PAGE)
+    try:
+        policies, next_cursor = await search_policies_async(
+            get_async_db().policies, user_id, request.args.get('q'), request.args.get('prefix'),
+            flag_filters(request.args), request.args.get('cursor'), limit
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"policies": [policy_list_item(policy) for policy in policies], "next_cursor": next_cursor})
+
+
+@async_app.route('/policy/<policy_id>')
+@login_required
+async def view_policy(policy_id):
+    user_id = session.get('user_id')
+    policies = get_async_db().policies
+    policy = await policies.find_one({"_id": ObjectId(policy_id), "user_id": user_id})
+
+    if not policy:
+        await flash('Policy not found or you do not have permission to view it', 'error')
+        return redirect(url_for('my_policies'))
+
+    # Pending flash messages are part of the page, so those views are always rendered
+    etag = policy_etag(policy, wsgi.PAGE_BUILD_ID)
+    cached = matching_etag(etag, request.if_none_match)
+    if cached and '_flashes' not in session:
+        return _not_modified(cached)
+
+    unpack_policy(await attach_blob_async(get_async_db().policy_blobs, policy))
+    # Lazily backfill the rendered HTML for policies stored before it was kept alongside content
+    if 'content_html' not in policy:
+        policy['content_html'] = await run_blocking(wsgi.render_policy_html, policy['content'])
+        update = html_update(policy, policy['content_html'])
+        if update and 'blob_key' in policy:
+            await get_async_db().policy_blobs.update_one({"_id": policy['blob_key']}, {"$set": update})
+        elif update:
+            await policies.update_one({"_id": policy["_id"]}, {"$set": update})
+
+    response = Response(await render_template('view_policy.html', policy=policy))
+    response.set_etag(etag)
+    return revalidate(response)
+
+
+async def _read_chunks(fileobj):
+    try:
+        while True:
+            chunk = await run_blocking(fileobj.read, PDF_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+@async_app.route('/policy/<policy_id>/download')
+@login_required
+async def download_policy(policy_id):
+    user_id = session.get('user_id')
+    policy = await get_async_db().policies.find_one({"_id": ObjectId(policy_id), "user_id": user_id})
+
+    if not policy:
+        await flash('Policy not found or you do not have permission to access it', 'error')
+        return redirect(url_for('my_policies'))
+
+    if request.args.get('async') == '1':
+        await attach_blob_async(get_async_db().policy_blobs, policy)
+        job = await run_blocking(
+            wsgi.pdf_jobs.enqueue, unpack_policy(policy), user_id, pdf_download_name(policy)
+        )
+        return jsonify(job_status(job, url_for)), 202
+
+    etag = policy_etag(policy, f"pdf-{PDF_LAYOUT_VERSION}")
+    cached = matching_etag(etag, request.if_none_match)
+    if cached:
+        return _not_modified(cached)
+
+    await attach_blob_async(get_async_db().policy_blobs, policy)
+    _, pdf_file, size = await run_blocking(wsgi.pdf_cache.open, unpack_policy(policy))
+    # Cached PDFs are already in memory; spooled or disk-backed ones are streamed in chunks
+    body = pdf_file.getvalue() if isinstance(pdf_file, io.BytesIO) else _read_chunks(pdf_file)
+    response = Response(body, mimetype='application/pdf')
+    response.headers['Content-Disposition'] = attachment(pdf_download_name(policy))
+    response.content_length = size
+    response.set_etag(etag)
+    return revalidate(response)
+
+
+@async_app.route('/jobs/<job_id>')
+@login_required
+async def pdf_job_status(job_id):
+    job = await run_blocking(wsgi.pdf_jobs.get, job_id)
+    if not job or job['user_id'] != session.get('user_id'):
+        abort(404)
+    return jsonify(job_status(job, url_for))
+
+
+# Endpoints served by the coroutines above; everything else goes to the Flask app
+ASYNC_ENDPOINTS = frozenset(async_app.view_functions)
+
+
+def _served_by_wsgi(**kwargs):
+    abort(404)
+
+
+# Register the Flask routes too, so url_for() in shared templates can build them
+for _rule in wsgi.app.url_map.iter_rules():
+    if _rule.endpoint not in async_app.view_functions:
+        async_app.add_url_rule(
+            _rule.rule, _rule.endpoint, _served_by_wsgi, methods=_rule.methods, provide_automatic_options=False
+        )
+
+
+@async_app.before_serving
+async def _check_indexes():
+    # Hypercorn's counterpart of the on_starting check in gunicorn.conf.py
+    await run_blocking(check_indexes, wsgi.get_db())
+
+
+class Dispatcher:
+    """ASGI app that routes each HTTP request to the Quart app or the wrapped Flask app"""
+
+    def __init__(self, async_app, wsgi_app):
+        self.async_app = async_app
+        self.wsgi_app = AsyncioWSGIMiddleware(wsgi_app)
+        self.adapter = async_app.url_map.bind('localhost')
+
+    def _is_async(self, scope):
+        try:
+            endpoint, _ = self.adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            # Redirects, 404s and 405s are answered the way the Flask app always has
+            return False
+        return endpoint in ASYNC_ENDPOINTS
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self._is_async(scope):
+            await self.wsgi_app(scope, receive, send)
+        else:
+            await self.async_app(scope, receive, send)
+
+
+application = Dispatcher(async_app, wsgi.app)
@@ -0,0 +1,92 @@
+import argparse
+import random
+import sys
+import time
+
+from pymongo import MongoClient
+
+from assessment import ASSESSMENT_VERSION, Assessor, assess_collection
+from policy_templates import POLICY_FLAGS, generate_privacy_policy
+
+# Sentences mixed into synthetic policies so they read like third-party texts, not only our templates
+EXTRA_CLAUSES = (
+    "We may sell your personal information to data brokers and marketing partners.",
+    "We do not sell your personal information.",
+    "Our advertising partners use cookies and pixels to show you targeted advertising across websites.",
+    "We collect biometric data such as face geometry to verify your identity.",
+    "We may collect your social security number or passport number for identity checks.",
+    "Health information you enter in the app is shared with our research affiliates.",
+    "We retain your information indefinitely unless you request deletion.",
+    "Your information may be transferred to other countries outside the European Economic Area.",
+    "We use device fingerprinting to track you across devices.",
+    "You have the right to access, the right to erasure and the right to data portability.",
+    "All data is encrypted in transit using TLS and at rest.",
+    "We never share your data with third parties.",
+    "We may access your contact list to help you find friends.",
+    "We do not knowingly collect information from children under 13.",
+    "California residents may opt out of the sale of personal information.",
+)
+
+
+def synthetic_policies(count, seed=0):
+    """Reproducible third-party policy texts of varied content, as documents with policy_text"""
+    for i in range(count):
+        rng = random.Random(seed * 1_000_003 + i)
+        flags = [rng.random() < 0.5 for _ in POLICY_FLAGS]
+        text = generate_privacy_policy(
+            f"Vendor {i}", f"https://vendor{i}.example.com", f"Vendor {i} Ltd", f"privacy@vendor{i}.example.com", *flags
+        )
+        extras = rng.sample(EXTRA_CLAUSES, rng.randint(0, 6))
+        yield {"website_name": f"Vendor {i}", "policy_text": text + "\n\n" + " ".join(extras)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score stored policies and save vulnerability_score on each")
+    parser.add_argument('--mongo-uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--db-name', default='privacy_policy_generator')
+    parser.add_argument('--collection', default='policies')
+    parser.add_argument('--blobs-collection', default='policy_blobs', help="Text shared by deduplicated policies")
+    parser.add_argument('--user-id', help="Only assess this user's policies")
+    parser.add_argument('--stale', action='store_true', help="Only assess policies not yet scored by this engine version")
+    parser.add_argument('--workers', type=int, help="Scoring processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=200, help="Texts sent to a worker at a time")
+    parser.add_argument('--batch-size', type=int, default=500, help="Results written per bulk_write")
+    parser.add_argument('--synthetic', type=int, metavar='N', help="Insert N synthetic third-party policies first")
+    parser.add_argument('--mongomock', action='store_true', help="Use an in-memory mongomock database")
+    args = parser.parse_args(argv)
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.mongo_uri)
+    collection = client[args.db_name][args.collection]
+    blobs = client[args.db_name][args.blobs_collection]
+
+    if args.synthetic:
+        collection.insert_many(synthetic_policies(args.synthetic))
+
+    query = {}
+    if args.user_id:
+        query["user_id"] = args.user_id
+    if args.stale:
+        query["assessment_version"] = {"$ne": ASSESSMENT_VERSION}
+
+    assessor = Assessor(workers=args.workers, chunk_size=args.chunk_size)
+    started = time.perf_counter()
+    try:
+        stats = assess_collection(collection, assessor, query, args.batch_size, blobs)
+    finally:
+        assessor.shutdown()
+    elapsed = time.perf_counter() - started
+    if not stats["documents"]:
+        print("No policies to assess")
+        return 0
+    megabytes = stats["bytes"] / 1e6
+    print(f"Assessed {stats['documents']} policies ({megabytes:.1f} MB) in {elapsed:.2f}s with {assessor.workers} "
+          f"workers: {stats['documents'] / elapsed:.0f} policies/sec, {megabytes / elapsed:.1f} MB/sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
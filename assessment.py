@@ -0,0 +1,384 @@
+"""Privacy policy assessment: detected data categories, third-party sharing and a vulnerability score.
+
+Policy text is tokenized once with a compiled regex and scanned in a single pass
+by an Aho-Corasick automaton built from every phrase in CATEGORIES, so the cost
+per document doesn't grow with the size of the dictionary. A match that follows
+a negation in the same clause ("we do not sell ...") doesn't count.
+"""
+import multiprocessing
+import os
+import string
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from policy_blobs import attach_blobs
+from policy_storage import CONTENT_PROJECTION, unpack_policy
+
+# Bump when CATEGORIES or the scoring changes so stored assessments can be redone
+ASSESSMENT_VERSION = 1
+
+# Category registry: (key, kind, weight, phrases). Weights add up to the score (0-100,
+# higher is riskier); protections have negative weights. 'data' categories are
+# reported as data_collected and 'sharing' ones set third_party_sharing.
+CATEGORIES = (
+    ('email', 'data', 4, (
+        'email address', 'email addresses', 'e-mail address', 'your email', 'contact details',
+    )),
+    ('name', 'data', 3, (
+        'your name', 'full name', 'first and last name', 'name and address', 'names',
+    )),
+    ('phone', 'data', 4, (
+        'phone number', 'telephone number', 'mobile number', 'mobile phone number', 'contact number',
+    )),
+    ('address', 'data', 4, (
+        'postal address', 'mailing address', 'shipping address', 'billing address', 'home address',
+        'street address',
+    )),
+    ('personal_identifiers', 'data', 6, (
+        'personal information', 'personal data', 'personally identifiable information',
+        'personal identifiers', 'identifiable information',
+    )),
+    ('government_id', 'data', 12, (
+        'social security number', 'passport number', "driver's license", 'drivers license',
+        'national identification number', 'government issued id', 'tax identification number',
+    )),
+    ('payment', 'data', 8, (
+        'payment information', 'credit card', 'debit card', 'card number', 'bank account',
+        'billing information', 'financial information', 'payment card',
+    )),
+    ('location', 'data', 8, (
+        'location data', 'precise location', 'geolocation', 'gps', 'location information',
+        'your location', 'location based', 'ip address',
+    )),
+    ('device', 'data', 4, (
+        'device identifiers', 'device information', 'browser type', 'operating system',
+        'unique device identifier', 'advertising id', 'mac address', 'imei',
+    )),
+    ('biometric', 'data', 15, (
+        'biometric data', 'biometric information', 'fingerprints', 'facial recognition', 'face geometry',
+        'voiceprint', 'retina scan', 'iris scan',
+    )),
+    ('health', 'data', 12, (
+        'health information', 'medical information', 'health data', 'medical records',
+        'fitness data', 'genetic information', 'genetic data',
+    )),
+    ('sensitive', 'data', 10, (
+        'sexual orientation', 'racial or ethnic origin', 'religious beliefs', 'political opinions',
+        'trade union membership', 'sensitive personal information', 'special categories of personal data',
+    )),
+    ('contacts', 'data', 6, (
+        'contact list', 'address book', 'your contacts', 'phone contacts',
+    )),
+    ('social_profile', 'data', 4, (
+        'social media profile', 'social media accounts', 'profile information', 'social login',
+        'sign in with', 'log in with',
+    )),
+    ('third_party_sharing', 'sharing', 15, (
+        'share your personal information', 'share your information', 'share your data',
+        'share personal information', 'disclose your information', 'disclose your personal information',
+        'with third parties', 'to third parties', 'third party service providers', 'our partners',
+        'business partners', 'affiliates', 'service providers',
+    )),
+    ('data_sale', 'sharing', 20, (
+        'sell your personal information', 'sell your information', 'sell your data', 'sell personal information',
+        'sale of personal information', 'rent your information', 'trade your information', 'monetize',
+    )),
+    ('advertising', 'sharing', 10, (
+        'advertising partners', 'targeted advertising', 'interest based advertising', 'personalized ads',
+        'behavioral advertising', 'ad networks', 'advertisers', 'retargeting',
+    )),
+    ('data_brokers', 'sharing', 15, (
+        'data brokers', 'data broker', 'marketing partners', 'lead generation',
+    )),
+    ('cookies', 'tracking', 5, (
+        'cookies', 'tracking technologies', 'web beacons', 'pixel tags', 'pixels', 'local storage',
+    )),
+    ('analytics', 'tracking', 4, (
+        'google analytics', 'analytics', 'usage data', 'log data', 'clickstream',
+    )),
+    ('cross_site_tracking', 'tracking', 10, (
+        'across websites', 'across different websites', 'cross device', 'cross site', 'device fingerprinting',
+        'browser fingerprinting', 'track you across',
+    )),
+    ('indefinite_retention', 'retention', 10, (
+        'retain indefinitely', 'indefinitely', 'as long as necessary', 'for as long as we deem',
+        'no longer than', 'retain your information',
+    )),
+    ('children', 'children', 8, (
+        'children under', 'under the age of 13', 'under 13', 'minors', 'from children',
+    )),
+    ('international_transfer', 'transfer', 6, (
+        'transferred to', 'international transfers', 'outside your country', 'outside the european economic area',
+        'cross border', 'other countries',
+    )),
+    ('legal_disclosure', 'sharing', 3, (
+        'law enforcement', 'comply with legal obligations', 'court order', 'subpoena', 'government requests',
+    )),
+    ('encryption', 'protection', -8, (
+        'encryption', 'encrypted', 'encrypt', 'ssl', 'tls', 'secure socket layer',
+    )),
+    ('security_measures', 'protection', -4, (
+        'security measures', 'appropriate technical and organizational measures', 'access controls',
+        'protect your personal information', 'protect your information',
+    )),
+    ('user_rights', 'protection', -8, (
+        'right to access', 'right to delete', 'right to erasure', 'right to rectification',
+        'right to data portability', 'right to object', 'request deletion', 'delete your account',
+        'access correct or delete', 'right to be forgotten',
+    )),
+    ('opt_out', 'protection', -6, (
+        'opt out', 'opt-out', 'unsubscribe', 'withdraw your consent', 'withdraw consent',
+        'do not track', 'manage your preferences',
+    )),
+    ('gdpr', 'protection', -5, (
+        'gdpr', 'general data protection regulation', 'lawful basis', 'legal basis for processing',
+        'data protection officer', 'supervisory authority',
+    )),
+    ('ccpa', 'protection', -5, (
+        'ccpa', 'california consumer privacy act', 'cpra', 'california residents',
+    )),
+    ('lgpd', 'protection', -5, (
+        'lgpd', 'lei geral de proteção de dados', 'brazilian general data protection law',
+    )),
+    ('contact_dpo', 'protection', -2, (
+        'contact us', 'privacy officer', 'questions about this privacy policy',
+    )),
+)
+
+NEGATIONS = frozenset({b'not', b'never', b'no', b"don't", b"doesn't", b"won't", b'without'})
+# Punctuation that ends a negation's scope; commas don't ("we do not sell, rent or trade ...")
+CLAUSE_BREAK = b'.'
+CLAUSE_BREAKS = frozenset({CLAUSE_BREAK})
+
+
+def _token_table():
+    """bytes.translate table: ASCII letters lowercased, digits and apostrophes kept,
+    clause punctuation turned into '.', everything else (including non-ASCII) into spaces"""
+    table = bytearray(b' ' * 256)
+    for char in string.ascii_lowercase + string.digits + "'":
+        table[ord(char)] = ord(char)
+    for char in string.ascii_uppercase:
+        table[ord(char)] = ord(char.lower())
+    for char in '.;:!?':
+        table[ord(char)] = ord(CLAUSE_BREAK)
+    return bytes(table)
+
+
+_TOKEN_TABLE = _token_table()
+
+
+def tokenize(text):
+    """Lowercase ASCII word tokens (as bytes) with clause breaks as separate '.' tokens.
+
+    One C-level translate and split instead of a regex: tokenizing is most of the
+    cost of an assessment.
+    """
+    data = text.replace('\u2019', "'").encode('utf-8').translate(_TOKEN_TABLE)
+    return data.replace(CLAUSE_BREAK, b' . ').split()
+
+
+class PhraseAutomaton:
+    """Aho-Corasick automaton over word tokens.
+
+    States are indexes into parallel lists: goto edges keyed by word, failure
+    links, and the (payload, phrase length) pairs that end in each state,
+    including those inherited through failure links.
+    """
+
+    def __init__(self, phrases):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [()]
+        for words, payload in phrases:
+            state = 0
+            for word in words:
+                next_state = self.goto[state].get(word)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][word] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(())
+                state = next_state
+            self.outputs[state] += ((payload, len(words)),)
+        self.vocabulary = frozenset(word for edges in self.goto for word in edges)
+
+        # Breadth-first, so every failure target is complete before it's inherited
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(word, 0)
+                self.fail[child] = target if target != child else 0
+                self.outputs[child] += self.outputs[self.fail[child]]
+
+    def scan(self, words, negations=frozenset(), breaks=frozenset()):
+        """Yield the payload of every phrase occurrence not preceded by a negation in its clause"""
+        goto, fail, outputs, vocabulary = self.goto, self.fail, self.outputs, self.vocabulary
+        state = 0
+        last_negation = -1
+        for position, word in enumerate(words):
+            if word in negations:
+                last_negation = position
+            elif word in breaks:
+                last_negation = -1
+            if word not in vocabulary:
+                # No phrase contains this word, so every partial match ends here
+                state = 0
+                continue
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for payload, length in outputs[state]:
+                start = position - length + 1
+                # Negations inside the phrase itself ("do not track") don't count
+                if not 0 <= last_negation < start:
+                    yield payload
+
+
+_CATEGORY_KEYS = tuple(key for key, _, _, _ in CATEGORIES)
+_CATEGORY_KINDS = tuple(kind for _, kind, _, _ in CATEGORIES)
+_CATEGORY_WEIGHTS = tuple(weight for _, _, weight, _ in CATEGORIES)
+
+# Built once per process at import time
+_automaton = PhraseAutomaton(
+    (tuple(tokenize(phrase)), index)
+    for index, (_, _, _, phrases) in enumerate(CATEGORIES)
+    for phrase in phrases
+)
+
+
+def assess_text(text):
+    """Score one policy text.
+
+    Returns the vulnerability score (0-100, higher is riskier), the detected
+    categories, the data categories collected and whether data is shared with
+    third parties.
+    """
+    found = set(_automaton.scan(tokenize(text), NEGATIONS, CLAUSE_BREAKS))
+    score = sum(_CATEGORY_WEIGHTS[index] for index in found)
+    return {
+        "vulnerability_score": max(0, min(100, score)),
+        "detected_categories": [_CATEGORY_KEYS[index] for index in sorted(found)],
+        "data_collected": [_CATEGORY_KEYS[index] for index in sorted(found) if _CATEGORY_KINDS[index] == 'data'],
+        "third_party_sharing": any(_CATEGORY_KINDS[index] == 'sharing' for index in found),
+        "assessment_version": ASSESSMENT_VERSION,
+    }
+
+
+def _assess_chunk(chunk):
+    """Runs in a pool process: [(key, text)] -> [(key, assessment)]"""
+    return [(key, assess_text(text)) for key, text in chunk]
+
+
+class Assessor:
+    """Scores many texts on a process pool, a bounded number of chunks at a time.
+
+    Texts are sent in chunks of `chunk_size` so inter-process overhead stays small
+    next to the scanning; at most `window` chunks are in flight, so iterating a
+    huge collection doesn't pull it all into memory.
+    """
+
+    def __init__(self, workers=None, chunk_size=200, window=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.window = window or self.workers * 2
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                # Spawned rather than forked, like the PDF pools
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _discard_pool(self, executor):
+        """Forget a pool that lost a process (OOM kill, segfault) so the next map starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def map(self, items):
+        """Yield (key, assessment) for an iterable of (key, text) pairs, in completion order"""
+        in_flight = set()
+        executor = self._pool()
+        try:
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    if len(in_flight) >= self.window:
+                        yield from self._collect(in_flight)
+                    in_flight.add(executor.submit(_assess_chunk, chunk))
+                    chunk = []
+            if chunk:
+                in_flight.add(executor.submit(_assess_chunk, chunk))
+            while in_flight:
+                yield from self._collect(in_flight)
+        except BrokenProcessPool:
+            self._discard_pool(executor)
+            raise
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    @staticmethod
+    def _collect(in_flight):
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            in_flight.discard(future)
+            yield from future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+# Uploaded policies keep their text in policy_text; generated ones in content
+ASSESSMENT_PROJECTION = {"policy_text": 1, **CONTENT_PROJECTION}
+
+
+def assess_collection(collection, assessor, query=None, batch_size=500, blobs=None):
+    """Score every matching document in a collection and store the results on it.
+
+    Policies referencing shared text need the blobs collection (see policy_blobs).
+    Returns the number of documents and text bytes assessed.
+    """
+    def texts():
+        policies = collection.find(query or {}, ASSESSMENT_PROJECTION)
+        for policy in attach_blobs(blobs, policies) if blobs is not None else policies:
+            text = policy.get('policy_text')
+            if text is None:
+                text = unpack_policy(policy).get('content')
+            if text is not None:
+                stats["bytes"] += len(text.encode('utf-8'))
+                yield policy['_id'], text
+
+    stats = {"documents": 0, "bytes": 0}
+    requests = []
+    now = datetime.utcnow()
+    for policy_id, result in assessor.map(texts()):
+        requests.append(UpdateOne({"_id": policy_id}, {"$set": {**result, "assessed_at": now}}))
+        stats["documents"] += 1
+        if len(requests) >= batch_size:
+            collection.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+    return stats
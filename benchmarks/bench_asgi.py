@@ -0,0 +1,196 @@
+"""Load test: requests/sec for the sync WSGI setup (gunicorn) vs. the ASGI mode
+(hypercorn + asgi.py) at many concurrent keep-alive connections.
+
+Both servers run as real processes against a throwaway database on --mongo-uri,
+seeded with one user and --policies policies. Each server gets the same mix of
+logged-in GETs (/dashboard, /my-policies, /policy/<id> by default) from
+--connections connections, spread over --client-processes load generator
+processes so the client isn't the bottleneck.
+    pip install --no-deps -r requirements-async.txt
+    python benchmarks/bench_asgi.py --mongo-uri mongodb://localhost:27017/ --connections 500
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from harness import ROOT, create_policy, drop_benchmark_db, load_app, logged_in_client
+
+PASSWORD = 'bench-asgi-password'
+
+
+async def _request(reader, writer, method, path, cookie='', body=b'', content_type=None):
+    headers = [f"{method} {path} HTTP/1.1", "Host: localhost", "Connection: keep-alive"]
+    if cookie:
+        headers.append(f"Cookie: {cookie}")
+    if body:
+        headers.append(f"Content-Type: {content_type}")
+        headers.append(f"Content-Length: {len(body)}")
+    writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("server closed the connection")
+    status = int(status_line.split()[1])
+    response_headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        response_headers.setdefault(name.strip().lower(), []).append(value.strip())
+
+    if 'content-length' in response_headers:
+        await reader.readexactly(int(response_headers['content-length'][0]))
+    elif response_headers.get('transfer-encoding', [''])[0].lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status, response_headers
+
+
+async def _login(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = urlencode({"username": "bench-asgi", "password": PASSWORD}).encode()
+    status, headers = await _request(
+        reader, writer, 'POST', '/login', body=body, content_type='application/x-www-form-urlencoded'
+    )
+    writer.close()
+    cookies = [value.split(';', 1)[0] for value in headers.get('set-cookie', [])]
+    if status != 302 or not cookies:
+        raise RuntimeError(f"login failed with status {status}")
+    return '; '.join(cookies)
+
+
+async def _load(port, cookie, paths, connections, seconds):
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    errors = 0
+
+    async def connection(offset):
+        nonlocal errors
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        i = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status, _ = await _request(reader, writer, 'GET', paths[i % len(paths)], cookie)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+                writer.close()
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                continue
+            if status != 200:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+            i += 1
+        writer.close()
+
+    await asyncio.gather(*(connection(i) for i in range(connections)))
+    return latencies, errors
+
+
+def _client_process(args):
+    port, cookie, paths, connections, seconds = args
+    return asyncio.run(_load(port, cookie, paths, connections, seconds))
+
+
+def _wait_for_port(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_server(name, command, env, paths, args):
+    port = _free_port()
+    command = [part.replace('{port}', str(port)) for part in command]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_port(port, process)
+        cookie = asyncio.run(_login(port))
+        # Warm caches and connection pools before measuring
+        _client_process((port, cookie, paths, min(args.connections, 20), 2))
+
+        per_process = [args.connections // args.client_processes] * args.client_processes
+        for i in range(args.connections % args.client_processes):
+            per_process[i] += 1
+        jobs = [(port, cookie, paths, count, args.seconds) for count in per_process if count]
+        with multiprocessing.get_context('spawn').Pool(len(jobs)) as pool:
+            results = pool.map(_client_process, jobs)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    if not latencies:
+        print(f"{name:<6} no successful requests ({errors} errors)")
+        return
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{name:<6} {len(latencies) / args.seconds:9.1f} req/s   p50 {p50:8.1f} ms   p99 {p99:8.1f} ms   "
+          f"errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', required=True, help="MongoDB server for both apps (a throwaway database is used)")
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=4, help="Server worker processes for both modes")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per gunicorn worker in sync mode")
+    parser.add_argument('--client-processes', type=int, default=4)
+    parser.add_argument('--policies', type=int, default=30)
+    parser.add_argument('--paths', help="Comma-separated paths to request instead of the default mix")
+    args = parser.parse_args()
+
+    # Seed through the app itself so documents look exactly like production ones
+    appmod = load_app(mongo_uri=args.mongo_uri)
+    client = logged_in_client(appmod, username='bench-asgi', password=PASSWORD)
+    policy_ids = [create_policy(client) for _ in range(args.policies)]
+    paths = args.paths.split(',') if args.paths else ['/dashboard', '/my-policies', f'/policy/{policy_ids[-1]}']
+
+    env = dict(
+        os.environ,
+        MONGO_URI=args.mongo_uri,
+        MONGO_DB_NAME=os.environ['MONGO_DB_NAME'],
+        SECRET_KEY=secrets.token_hex(24),
+    )
+    servers = (
+        ('wsgi', [sys.executable, '-m', 'gunicorn', 'app:app', '-b', '127.0.0.1:{port}',
+                  '-w', str(args.workers), '-k', 'gthread', '--threads', str(args.threads)]),
+        ('asgi', [sys.executable, '-m', 'hypercorn', 'asgi:application', '-b', '127.0.0.1:{port}',
+                  '-w', str(args.workers)]),
+    )
+    print(f"{args.connections} connections, {args.workers} workers, {args.seconds:.0f}s per server, paths {paths}")
+    try:
+        for name, command in servers:
+            run_server(name, command, env, paths, args)
+    finally:
+        drop_benchmark_db(appmod)
+
+
+if __name__ == '__main__':
+    main()
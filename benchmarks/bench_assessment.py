@@ -0,0 +1,76 @@
+"""Benchmark: assessment engine throughput in MB/sec and documents/sec.
+
+The corpus is --policies synthetic third-party policies (100k by default) drawn
+from --distinct generated texts, so memory stays small; nothing is cached
+between documents, so repeated texts cost the same as new ones. "inline" scores
+in this process, "pool" on Assessor's process pool. "regex" is the per-pattern
+loop the automaton replaces (one compiled regex per phrase), timed on a sample.
+    python benchmarks/bench_assessment.py --policies 100000 --workers 4
+"""
+import argparse
+import itertools
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assess_policies import synthetic_policies
+from assessment import CATEGORIES, Assessor, assess_text
+
+
+def corpus(texts, count):
+    return ((i, text) for i, text in zip(range(count), itertools.cycle(texts)))
+
+
+def regex_categories(patterns, text):
+    lowered = text.lower()
+    return {key for key, regexes in patterns for regex in regexes if regex.search(lowered)}
+
+
+def report(name, documents, size, seconds):
+    print(f"{name:<8} {documents:8d} docs {size / 1e6:8.1f} MB {seconds:8.2f} s   "
+          f"{size / 1e6 / seconds:7.1f} MB/s {documents / seconds:9.0f} docs/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--policies', type=int, default=100_000)
+    parser.add_argument('--distinct', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--regex-sample', type=int, default=2000)
+    args = parser.parse_args()
+
+    texts = [policy['policy_text'] for policy in synthetic_policies(args.distinct)]
+    sizes = [len(text.encode('utf-8')) for text in texts]
+    total_bytes = sum(size for size, _ in zip(itertools.cycle(sizes), range(args.policies)))
+    print(f"{args.policies} policies, mean {total_bytes / args.policies:.0f} bytes, {args.workers} workers")
+
+    started = time.perf_counter()
+    for _, text in corpus(texts, args.policies):
+        assess_text(text)
+    report('inline', args.policies, total_bytes, time.perf_counter() - started)
+
+    assessor = Assessor(workers=args.workers)
+    # Start the workers before timing, as a long batch run amortizes that anyway
+    list(assessor.map(corpus(texts, args.workers * assessor.chunk_size)))
+    started = time.perf_counter()
+    scored = sum(1 for _ in assessor.map(corpus(texts, args.policies)))
+    report('pool', scored, total_bytes, time.perf_counter() - started)
+    assessor.shutdown()
+
+    patterns = [
+        (key, [re.compile(r'\b' + re.escape(phrase) + r'\b') for phrase in phrases])
+        for key, _, _, phrases in CATEGORIES
+    ]
+    sample = min(args.regex_sample, args.policies)
+    sample_bytes = sum(size for size, _ in zip(itertools.cycle(sizes), range(sample)))
+    started = time.perf_counter()
+    for _, text in corpus(texts, sample):
+        regex_categories(patterns, text)
+    report('regex', sample, sample_bytes, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
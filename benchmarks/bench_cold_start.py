@@ -0,0 +1,191 @@
+"""Benchmark: worker cold start, i.e. the time and memory to import app.py in a fresh interpreter.
+
+Each sample runs `python -c "import app"` in a new process against MONGO_URI (a
+local mongod by default) and reports the median wall time, the RSS after the
+import, the RSS once reportlab and markdown are loaded too (what a worker holds
+after its first PDF download), and a `-X importtime` breakdown of the heaviest
+packages. --gunicorn also boots `gunicorn app:app` with --workers workers, with
+and without GUNICORN_PRELOAD, and reports per-worker RSS, PSS (RSS with shared
+pages split between the processes sharing them) and USS (pages private to the
+worker); it runs `flask init-db` on MONGO_URI first, as gunicorn refuses to
+start without the app's indexes. Pass --baseline-ref to measure an older commit
+side by side; it is exported with `git archive` into a temp directory.
+    python benchmarks/bench_cold_start.py --baseline-ref d003986 --gunicorn
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages reported in the -X importtime breakdown
+TRACKED = ('flask', 'pymongo', 'reportlab', 'markdown', 'jinja2', 'bson')
+
+# Appended to the timed code: print this process's resident set size in kB
+PRINT_RSS = "; print(open('/proc/self/status').read().split('VmRSS:')[1].split()[0])"
+
+
+def export_ref(ref, target):
+    archive = subprocess.run(['git', 'archive', ref], cwd=ROOT, check=True, capture_output=True).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(target)
+
+
+def time_import(directory, env, repeat, code):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=directory, env=env, capture_output=True)
+        samples.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            return None, result.stderr.decode().strip().splitlines()[-1]
+    return statistics.median(samples), None
+
+
+def rss_kb(directory, env, code):
+    result = subprocess.run([sys.executable, '-c', code + PRINT_RSS], cwd=directory, env=env, capture_output=True)
+    return int(result.stdout.split()[-1]) if result.returncode == 0 else None
+
+
+def import_breakdown(directory, env, code):
+    """Import time in ms of app and of each TRACKED package with its submodules, from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], cwd=directory, env=env, capture_output=True
+    )
+    times = dict.fromkeys(TRACKED, 0.0)
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith('import time:') or not line.split('|')[1].strip().isdigit():
+            continue
+        own, total, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if name == 'app':
+            times['app'] = int(total) / 1000
+        package = name.split('.')[0]
+        if package in times:
+            times[package] += int(own) / 1000
+    return times
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            if int(fields[1]) == pid:
+                children.append(int(entry))
+    return children
+
+
+def memory_kb(pid):
+    """(RSS, PSS, USS) of a process in kB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Rss'], values['Pss'], values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+
+
+def gunicorn_memory(directory, env, workers, preload, settle, timeout=60):
+    """Mean per-worker (RSS, PSS, USS) in kB once every worker has booted and imported the app"""
+    env = dict(env, GUNICORN_PRELOAD='1' if preload else '')
+    command = [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', str(workers),
+               '--bind', f'127.0.0.1:{_free_port()}']
+    if preload and not os.path.exists(os.path.join(directory, 'gunicorn.conf.py')):
+        # Trees without gunicorn.conf.py only know the command-line flag
+        command.append('--preload')
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        booted = 0
+        while booted < workers:
+            line = process.stderr.readline()
+            if not line or time.perf_counter() - started > timeout:
+                raise RuntimeError(f"gunicorn exited with {process.poll()}")
+            booted += b'Booting worker' in line
+        # Without preload, workers import the app after logging that they booted
+        time.sleep(settle)
+        samples = [memory_kb(pid) for pid in _children(process.pid)]
+    finally:
+        process.terminate()
+        process.wait()
+    return tuple(statistics.mean(column) for column in zip(*samples))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--baseline-ref', help="git ref to compare against")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--first-query', action='store_true', help="Also ping Mongo after the import")
+    parser.add_argument('--gunicorn', action='store_true', help="Also measure per-worker memory under gunicorn")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--settle', type=float, default=5.0, help="Seconds to let gunicorn workers finish booting")
+    args = parser.parse_args()
+
+    env = dict(os.environ, MONGO_URI=args.mongo_uri)
+    code = "import app"
+    if args.first_query:
+        code += "; app.users_collection.find_one({})"
+    # What a worker has loaded after its first PDF download and markdown render
+    loaded = ("import app, markdown, reportlab.platypus, pdf_markdown; "
+              "getattr(pdf_markdown, 'pdf_styles', lambda: None)()")
+
+    targets = [('current', ROOT)]
+    tmp = None
+    if args.baseline_ref:
+        tmp = tempfile.TemporaryDirectory()
+        export_ref(args.baseline_ref, tmp.name)
+        targets.insert(0, (args.baseline_ref, tmp.name))
+
+    for name, directory in targets:
+        median, error = time_import(directory, env, args.repeat, code)
+        if error:
+            print(f"{name:<12} failed: {error}")
+            continue
+        print(f"{name:<12} median cold start {median * 1000:8.1f} ms, RSS {rss_kb(directory, env, code) / 1024:6.1f} MB "
+              f"after import, {rss_kb(directory, env, loaded) / 1024:6.1f} MB with reportlab and markdown loaded")
+        breakdown = import_breakdown(directory, env, code)
+        print(f"{'':<12} -X importtime: " + ", ".join(
+            f"{module} {breakdown.get(module, 0.0):.1f} ms" for module in ('app', *TRACKED)
+        ))
+
+    if args.gunicorn:
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                       cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        print(f"{'tree':<12} {'preload':<8} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8}  per worker")
+        for name, directory in targets:
+            for preload in (False, True):
+                try:
+                    rss, pss, uss = gunicorn_memory(directory, env, args.workers, preload, args.settle)
+                except RuntimeError as e:
+                    print(f"{name:<12} {str(preload):<8} failed: {e}")
+                    continue
+                print(f"{name:<12} {str(preload):<8} {rss / 1024:>8.1f} {pss / 1024:>8.1f} {uss / 1024:>8.1f}")
+
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark: /create-policy with and without POLICY_DEDUP on an agency-style workload.
+
+--users accounts create --policies policies between them. --shared of the creates
+pick a site from a --catalog of sites that several accounts publish (an agency
+setting up the same sites for its clients), --retries repeat the account's
+previous create (a resubmitted form), and the rest are sites of their own. The
+same workload runs once inline and once deduplicated, and reports the dedup
+ratio, the bytes held by policies and blobs, and create latency. mongomock is
+the default, but it scans the whole collection for find_one_and_update, so its
+dedup latencies grow with the blob count; use --mongo-uri for latencies that
+mean something (the database is dropped afterwards).
+    python benchmarks/bench_dedup.py --policies 2000 --users 20
+"""
+import argparse
+import os
+import random
+
+import bson
+
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+from harness import create_policy, drop_benchmark_db, latency_ms, load_app, logged_in_client
+
+FLAGS = (
+    'gdpr_compliant', 'ccpa_compliant', 'lgpd_compliant', 'collects_personal_info',
+    'collects_cookies', 'collects_location', 'shares_data', 'uses_analytics',
+    'social_login', 'has_newsletter', 'user_accounts', 'processes_payments'
+)
+
+
+def site(rng, name):
+    form = dict(
+        website_name=f"{name} Store", website_url=f"https://www.{name.lower()}.example.com",
+        company_name=f"{name} Retail Ltd", contact_email=f"privacy@{name.lower()}.example.com",
+    )
+    form.update({flag: 'on' for flag in FLAGS if rng.random() < 0.5})
+    return form
+
+
+def workload(args):
+    """[(user index, form)] for one run; the same for both modes"""
+    rng = random.Random(args.seed)
+    catalog = [site(rng, f"Catalog{i}") for i in range(args.catalog)]
+    last = {}
+    creates = []
+    for i in range(args.policies):
+        user = rng.randrange(args.users)
+        roll = rng.random()
+        if roll < args.retries and user in last:
+            form = last[user]
+        elif roll < args.retries + args.shared:
+            form = rng.choice(catalog)
+        else:
+            form = site(rng, f"Own{i}")
+        last[user] = form
+        creates.append((user, form))
+    return creates
+
+
+def collection_bytes(collection):
+    return sum(len(bson.encode(document)) for document in collection.find())
+
+
+def run(appmod, clients, creates, dedup):
+    appmod.POLICY_DEDUP = dedup
+    db = appmod.get_db()
+    for name in ('policies', 'policy_blobs', 'user_stats'):
+        db[name].delete_many({})
+    it = iter(creates)
+
+    def create():
+        user, form = next(it)
+        create_policy(clients[user], **form)
+
+    p50, p99 = latency_ms(create, len(creates))
+    policies = collection_bytes(db['policies'])
+    blobs = collection_bytes(db['policy_blobs'])
+    count = db['policy_blobs'].count_documents({})
+    ratio = f"{db['policies'].count_documents({'blob_key': {'$exists': True}}) / count:5.2f}" if count else "  n/a"
+    print(f"{'dedup' if dedup else 'inline':<8} {p50:8.2f} {p99:8.2f}   {ratio:>6} {count:7d} "
+          f"{policies / 1024:10.1f} {blobs / 1024:10.1f} {(policies + blobs) / 1024:10.1f}")
+    return policies + blobs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', help="Benchmark against a throwaway database instead of mongomock")
+    parser.add_argument('--policies', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--catalog', type=int, default=50, help="Sites shared between accounts")
+    parser.add_argument('--shared', type=float, default=0.5, help="Fraction of creates using a catalog site")
+    parser.add_argument('--retries', type=float, default=0.05, help="Fraction of creates repeating the last one")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    appmod = load_app(mongo_uri=args.mongo_uri)
+    try:
+        clients = [logged_in_client(appmod, username=f'agency{i}') for i in range(args.users)]
+        creates = workload(args)
+        # One untimed create per mode loads templates, markdown and the connection pool
+        for dedup in (False, True):
+            appmod.POLICY_DEDUP = dedup
+            create_policy(clients[0])
+
+        print(f"{args.policies} creates by {args.users} users, {args.shared:.0%} from a catalog of "
+              f"{args.catalog} sites, {args.retries:.0%} retries")
+        print(f"{'mode':<8} {'p50 ms':>8} {'p99 ms':>8}   {'ratio':>6} {'blobs':>7} "
+              f"{'policy KiB':>10} {'blob KiB':>10} {'total KiB':>10}")
+        inline = run(appmod, clients, creates, False)
+        shared = run(appmod, clients, creates, True)
+        print(f"dedup stores {1 - shared / inline:.1%} fewer bytes")
+    finally:
+        drop_benchmark_db(appmod)
+
+
+if __name__ == '__main__':
+    main()
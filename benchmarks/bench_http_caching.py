@@ -0,0 +1,69 @@
+"""Benchmark: bytes transferred and latency for a first and a repeat visit to a policy.
+
+The client acts like a browser cache: a repeat visit skips resources whose
+Cache-Control still makes them fresh, revalidates the rest with the ETag from the
+first visit, and refetches anything without one. Each resource is reported with
+and without Accept-Encoding, so the numbers cover compression, 304s and
+fingerprinted static files.
+    python benchmarks/bench_http_caching.py --repeat 300
+"""
+import argparse
+import re
+
+from harness import create_policy, latency_ms, load_app, logged_in_client
+
+ENCODINGS = (('identity', {}), ('gzip, br', {'Accept-Encoding': 'gzip, deflate, br'}))
+
+
+def fresh(response):
+    """Whether a browser may reuse the response without asking the server"""
+    cache_control = response.cache_control
+    return bool(cache_control.max_age) and not cache_control.no_cache
+
+
+def visit(client, url, headers, first, repeat):
+    """Bytes and p50/p99 latency of a repeat request for url, given the first response"""
+    if fresh(first):
+        return 0, 0.0, 0.0, 'cached'
+    conditional = dict(headers)
+    if first.headers.get('ETag'):
+        conditional['If-None-Match'] = first.headers['ETag']
+    response = client.get(url, headers=conditional)
+    p50, p99 = latency_ms(lambda: client.get(url, headers=conditional), repeat)
+    return len(response.data), p50, p99, str(response.status_code)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args()
+
+    appmod = load_app()
+    client = logged_in_client(appmod)
+    policy_id = create_policy(client)
+    page = client.get(f'/policy/{policy_id}').get_data(as_text=True)
+    urls = [
+        ('view', f'/policy/{policy_id}'),
+        ('download', f'/policy/{policy_id}/download'),
+        ('style.css', re.search(r'href="(/static/css/style[^"]*)"', page).group(1)),
+        ('favicon', '/favicon.ico'),
+    ]
+
+    print(f"{'resource':<10} {'encoding':<9} {'first visit':>24}   {'repeat visit':>30}")
+    totals = {name: [0, 0] for name, _ in ENCODINGS}
+    for name, url in urls:
+        for encoding, headers in ENCODINGS:
+            first = client.get(url, headers=headers)
+            first_bytes = len(first.data)
+            p50, _ = latency_ms(lambda: client.get(url, headers=headers), args.repeat)
+            repeat_bytes, repeat_p50, _, outcome = visit(client, url, headers, first, args.repeat)
+            totals[encoding][0] += first_bytes
+            totals[encoding][1] += repeat_bytes
+            print(f"{name:<10} {encoding:<9} {first_bytes:9d} B {p50:8.3f} ms   "
+                  f"{repeat_bytes:9d} B {repeat_p50:8.3f} ms ({outcome})")
+    for encoding, (first_bytes, repeat_bytes) in totals.items():
+        print(f"total {encoding:<9} first visit {first_bytes} B, repeat visit {repeat_bytes} B")
+
+
+if __name__ == '__main__':
+    main()
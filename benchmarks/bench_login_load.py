@@ -0,0 +1,61 @@
+"""Load test: login throughput and non-auth route latency during a login surge.
+
+Many threads post to /login for a fixed time while a probe thread keeps
+requesting the landing page. Reports successful logins/sec, requests turned away
+by admission control (503) and probe latency.
+    python benchmarks/bench_login_load.py --threads 32 --seconds 10
+"""
+import argparse
+import threading
+import time
+
+from harness import latency_ms, load_app, logged_in_client
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    appmod = load_app()
+    logged_in_client(appmod, username='loadtest', password='load-test-password')
+    stop = threading.Event()
+    counts = {"ok": 0, "busy": 0, "other": 0}
+    lock = threading.Lock()
+
+    def login_worker():
+        client = appmod.app.test_client()
+        while not stop.is_set():
+            response = client.post('/login', data=dict(username='loadtest', password='load-test-password'))
+            key = "ok" if response.status_code == 302 else "busy" if response.status_code == 503 else "other"
+            with lock:
+                counts[key] += 1
+
+    probe_client = appmod.app.test_client()
+    idle_p50, idle_p99 = latency_ms(lambda: probe_client.get('/'), 200)
+
+    threads = [threading.Thread(target=login_worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    probe_samples = []
+    while time.perf_counter() - started < args.seconds:
+        probe_samples.append(latency_ms(lambda: probe_client.get('/'), 1)[0])
+        time.sleep(0.01)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    probe_samples.sort()
+    p50 = probe_samples[len(probe_samples) // 2]
+    p99 = probe_samples[min(len(probe_samples) - 1, int(len(probe_samples) * 0.99))]
+    print(f"hash method {appmod.password_hasher.method_prefix}, {args.threads} login threads, {elapsed:.1f}s")
+    print(f"logins/sec {counts['ok'] / elapsed:.1f}  rejected (503) {counts['busy']}  other {counts['other']}")
+    print(f"landing page idle    p50 {idle_p50:.2f} ms  p99 {idle_p99:.2f} ms")
+    print(f"landing page loaded  p50 {p50:.2f} ms  p99 {p99:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark: keyset-paginated policy listing vs. the original unbounded find().
+
+Seeds a user with a growing number of policies and times one listing page.
+Run against a local mongod (the database is dropped afterwards):
+    python benchmarks/bench_my_policies.py --mongo-uri mongodb://localhost:27017/
+--mongomock runs without a server, but mongomock has no indexes, so only a
+real mongod shows the flat latency curve.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import MongoClient
+
+from bulk_generate import synthetic_descriptors
+from harness import latency_ms
+from policy_store import POLICY_LIST_INDEX, list_policies, new_policy_document, policy_inputs
+
+SIZES = (10, 100, 1000, 10000, 100000)
+
+
+def seed(collection, user_id, count):
+    started = datetime.utcnow()
+    batch = []
+    for i, descriptor in enumerate(synthetic_descriptors(count)):
+        doc = new_policy_document(user_id, policy_inputs(descriptor))
+        doc['created_at'] = doc['last_updated'] = started - timedelta(seconds=i)
+        batch.append(doc)
+        if len(batch) == 1000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--mongomock', action='store_true')
+    parser.add_argument('--max-size', type=int, default=SIZES[-1])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.mongo_uri)
+    db = client['privacy_policy_benchmark']
+    collection = db['policies']
+    collection.create_index(POLICY_LIST_INDEX)
+
+    print(f"{'policies':>9} {'legacy find() ms':>17} {'first page ms':>14} {'page 5 ms':>10}")
+    try:
+        for size in (s for s in SIZES if s <= args.max_size):
+            user_id = f"bench-user-{size}"
+            seed(collection, user_id, size)
+
+            def legacy():
+                list(collection.find({"user_id": user_id}).sort("created_at", -1))
+
+            def first_page():
+                list_policies(collection, user_id)
+
+            cursor = None
+            for _ in range(4):
+                _, cursor = list_policies(collection, user_id, cursor)
+
+            def fifth_page():
+                list_policies(collection, user_id, cursor)
+
+            print(f"{size:>9} {latency_ms(legacy, 3)[0]:>17.2f} {latency_ms(first_page, args.repeat)[0]:>14.2f} "
+                  f"{latency_ms(fifth_page, args.repeat)[0] if cursor else float('nan'):>10.2f}")
+    finally:
+        client.drop_database('privacy_policy_benchmark')
+
+
+if __name__ == '__main__':
+    main()
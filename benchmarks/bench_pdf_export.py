@@ -0,0 +1,85 @@
+"""Benchmark: exporting many policies as one streamed ZIP vs. downloading them one by one.
+
+Both runs start with empty PDF caches. "sequential" requests /policy/<id>/download
+for every policy in turn; "zip export" streams /policies/export once, rendering on
+the export process pool. Peak traced memory in the web process is reported for the
+export to show it doesn't grow with the archive.
+    python benchmarks/bench_pdf_export.py --policies 500 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+from harness import load_app, logged_in_client
+
+
+def clear_caches(appmod):
+    from pdf_markdown import spec_cache
+    appmod.pdf_cache.memory.clear()
+    spec_cache.clear()
+
+
+def export(client):
+    """Stream /policies/export into a temp file; returns the file and the largest chunk size"""
+    archive = tempfile.TemporaryFile()
+    largest_chunk = 0
+    with client.get('/policies/export', buffered=False) as response:
+        for chunk in response.response:
+            largest_chunk = max(largest_chunk, len(chunk))
+            archive.write(chunk)
+    return archive, largest_chunk
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--policies', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    appmod = load_app()
+    from bulk_generate import synthetic_descriptors
+    from pdf_archive import PDFArchiver
+    appmod.pdf_archiver = PDFArchiver(pdf_cache=appmod.pdf_cache, workers=args.workers)
+    client = logged_in_client(appmod)
+    response = client.post('/api/policies/bulk', json=list(synthetic_descriptors(args.policies)))
+    assert response.status_code == 201, response.get_json()
+    policy_ids = [str(policy['_id']) for policy in appmod.policies_collection.find({}, {"_id": 1})]
+
+    clear_caches(appmod)
+    started = time.perf_counter()
+    sequential_bytes = 0
+    for policy_id in policy_ids:
+        sequential_bytes += len(client.get(f'/policy/{policy_id}/download').data)
+    sequential = time.perf_counter() - started
+
+    # Start the pool before timing, as a running server would have it already
+    list(appmod.pdf_archiver.stream([]))
+    appmod.pdf_archiver._pool().submit(int).result()
+
+    clear_caches(appmod)
+    started = time.perf_counter()
+    archive, largest_chunk = export(client)
+    exported = time.perf_counter() - started
+
+    # Second, traced run for memory; tracing slows the app down too much to time it
+    clear_caches(appmod)
+    tracemalloc.start()
+    export(client)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    archive_bytes = archive.tell()
+    names = zipfile.ZipFile(archive).namelist()
+    assert len(names) == len(policy_ids), (len(names), len(policy_ids))
+    print(f"{len(policy_ids)} policies, {args.workers} export workers")
+    print(f"sequential downloads {sequential:7.2f} s   {sequential_bytes / 1024 / 1024:6.1f} MiB")
+    print(f"zip export           {exported:7.2f} s   {archive_bytes / 1024 / 1024:6.1f} MiB   "
+          f"({sequential / exported:.1f}x faster)")
+    print(f"export peak app memory {peak / 1024 / 1024:.1f} MiB, largest chunk {largest_chunk / 1024:.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
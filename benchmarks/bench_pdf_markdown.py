@@ -0,0 +1,80 @@
+"""Benchmark: markdown-to-flowables conversion and total PDF build time by policy size.
+
+"legacy" is the original per-request loop from download_policy (stylesheet and
+ParagraphStyles rebuilt, one Paragraph per line); "parse" is pdf_markdown's
+tokenizer on a cold cache; "cached" reuses the specs cached by content hash.
+    python benchmarks/bench_pdf_markdown.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Spacer
+
+from pdf_markdown import parse_markdown, markdown_to_flowables, spec_cache, specs_to_flowables
+from policy_pdf import build_policy_pdf
+from policy_templates import generate_privacy_policy
+
+SIZES = (1, 5, 20, 50)
+
+
+def legacy_flowables(content):
+    styles = getSampleStyleSheet()
+    normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=10, spaceBefore=6)
+    heading1_style = ParagraphStyle('Heading1', parent=styles['Heading1'], fontSize=16, spaceBefore=12, spaceAfter=6)
+    heading2_style = ParagraphStyle('Heading2', parent=styles['Heading2'], fontSize=14, spaceBefore=10, spaceAfter=4)
+    heading3_style = ParagraphStyle('Heading3', parent=styles['Heading3'], fontSize=12, spaceBefore=8, spaceAfter=4)
+    elements = []
+    lines = content.split('\n')
+    for i, raw in enumerate(lines):
+        line = raw.strip()
+        if line.startswith('# '):
+            elements.append(Paragraph(line[2:], heading1_style))
+        elif line.startswith('## '):
+            elements.append(Paragraph(line[3:], heading2_style))
+        elif line.startswith('### '):
+            elements.append(Paragraph(line[4:], heading3_style))
+        elif line.startswith('- '):
+            elements.append(Paragraph("• " + line[2:], normal_style))
+        elif line:
+            elements.append(Paragraph(line.replace('**', ''), normal_style))
+        elif i > 0 and lines[i - 1].strip():
+            elements.append(Spacer(1, 0.1 * inch))
+    return elements
+
+
+def main():
+    base = generate_privacy_policy(
+        'Example Site', 'https://www.example.com', 'Example Inc.', 'privacy@example.com',
+        *([True] * 12)
+    )
+    print(f"{'size':>5} {'KiB':>6} {'legacy ms':>10} {'parse ms':>9} {'cached ms':>10} {'PDF build ms':>13}")
+    for size in SIZES:
+        content = base * size
+        number = max(1, 50 // size)
+        legacy = timeit.timeit(lambda: legacy_flowables(content), number=number) / number * 1000
+
+        def cold():
+            spec_cache.clear()
+            specs_to_flowables(parse_markdown(content))
+
+        parse = timeit.timeit(cold, number=number) / number * 1000
+        markdown_to_flowables(content)
+        cached = timeit.timeit(lambda: markdown_to_flowables(content), number=number) / number * 1000
+        policy = {
+            'website_name': 'Example Site', 'website_url': 'https://www.example.com',
+            'company_name': 'Example Inc.', 'last_updated': datetime.utcnow(), 'content': content,
+            'gdpr_compliant': True, 'ccpa_compliant': True, 'lgpd_compliant': True,
+        }
+        build_number = max(1, number // 5)
+        build = timeit.timeit(lambda: build_policy_pdf(policy), number=build_number) / build_number * 1000
+        print(f"{size:>5} {len(content) / 1024:>6.0f} {legacy:>10.2f} {parse:>9.2f} {cached:>10.2f} {build:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
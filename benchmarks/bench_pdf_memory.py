@@ -0,0 +1,76 @@
+"""Benchmark: per-request memory of concurrent PDF downloads, buffered vs. spooled.
+
+Runs 50 concurrent downloads of a large policy with the PDF cache disabled and
+reports the tracemalloc peak divided by the number of in-flight requests.
+"buffered" reproduces the original route (whole PDF in a BytesIO handed to
+send_file); "spooled" is the current route, which renders into a temp file that
+rolls over to disk past PDF_SPOOL_THRESHOLD, streams it in chunks and renders
+at most PDF_MAX_CONCURRENT_RENDERS documents at a time.
+    python benchmarks/bench_pdf_memory.py
+"""
+import argparse
+import io
+import threading
+import tracemalloc
+
+from harness import create_policy, load_app, logged_in_client
+
+
+def download_all(client, url, concurrency):
+    barrier = threading.Barrier(concurrency)
+    sizes = []
+
+    def worker():
+        barrier.wait()
+        response = client.get(url, buffered=False)
+        size = 0
+        for chunk in response.response:
+            size += len(chunk)
+        response.close()
+        sizes.append(size)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--repeat-content', type=int, default=5, help="Inflate the policy body this many times")
+    args = parser.parse_args()
+
+    appmod = load_app()
+    from policy_pdf import PDFCache, build_policy_pdf, pdf_cache_key
+    client = logged_in_client(appmod)
+    policy_id = create_policy(client)
+    policy = appmod.policies_collection.find_one({})
+    appmod.policies_collection.update_one(
+        {"_id": policy["_id"]}, {"$set": {"content": policy['content'] * args.repeat_content}}
+    )
+    url = f'/policy/{policy_id}/download'
+
+    class BufferedPDFs:
+        def open(self, policy):
+            data = build_policy_pdf(policy)
+            return pdf_cache_key(policy), io.BytesIO(data), len(data)
+
+    modes = (
+        ('buffered', BufferedPDFs()),
+        ('spooled', PDFCache(max_entries=0, max_item_bytes=0, spool_threshold=64 * 1024)),
+    )
+    for name, cache in modes:
+        appmod.pdf_cache = cache
+        tracemalloc.start()
+        sizes = download_all(client, url, args.concurrency)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:<9} {len(sizes)} downloads of {sizes[0] / 1024:.0f} KiB, "
+              f"peak {peak / 1024 / 1024:.1f} MiB, {peak / len(sizes) / 1024:.0f} KiB per request")
+
+
+if __name__ == '__main__':
+    main()
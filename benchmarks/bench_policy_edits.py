@@ -0,0 +1,75 @@
+"""Benchmark: single-option policy edits, incremental re-rendering with reverse deltas
+vs. regenerating the whole policy and keeping full copies of old versions.
+
+Each round flips one random option on a stored policy and saves it through
+policy_versions.edit_policy; the "full copy" column is what the same history would
+cost if every version stored its complete document.
+    python benchmarks/bench_policy_edits.py --edits 500
+"""
+import argparse
+import random
+import statistics
+import time
+
+import bson
+
+from harness import create_policy, load_app, logged_in_client
+
+FLAGS = (
+    'gdpr_compliant', 'ccpa_compliant', 'lgpd_compliant', 'collects_personal_info',
+    'collects_cookies', 'collects_location', 'shares_data', 'uses_analytics',
+    'social_login', 'has_newsletter', 'user_accounts', 'processes_payments'
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--edits', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    appmod = load_app()
+    from policy_templates import generate_privacy_policy
+    from policy_versions import edit_policy
+    client = logged_in_client(appmod)
+    policy_id = create_policy(client)
+    policies = appmod.policies_collection
+    versions = appmod.policy_versions_collection
+    full_copies = appmod.get_db()['bench_full_copies']
+    rng = random.Random(args.seed)
+
+    incremental = []
+    full = []
+    full_copy_bytes = 0
+    for _ in range(args.edits):
+        policy = policies.find_one({})
+        inputs = dict(policy['inputs'])
+        flag = rng.choice(FLAGS)
+        inputs[flag] = not inputs[flag]
+
+        # The straightforward alternative: regenerate everything and snapshot the old document
+        started = time.perf_counter()
+        content = generate_privacy_policy(**inputs)
+        snapshot = dict(policy, _id=bson.ObjectId(), policy_id=policy['_id'])
+        full_copies.insert_one(snapshot)
+        full_copies.update_one({"_id": snapshot['_id']}, {"$set": {"content": content}})
+        full.append((time.perf_counter() - started) * 1000)
+        full_copy_bytes += len(bson.encode(snapshot))
+
+        started = time.perf_counter()
+        edit_policy(policies, versions, policy, inputs)
+        incremental.append((time.perf_counter() - started) * 1000)
+
+    delta_bytes = sum(len(bson.encode(record)) for record in versions.find({}))
+    print(f"edits               {args.edits}")
+    print(f"full copy edit      mean {statistics.mean(full):7.3f} ms")
+    print(f"incremental edit    mean {statistics.mean(incremental):7.3f} ms")
+    print(f"full-copy history   {full_copy_bytes / 1024:9.1f} KiB")
+    print(f"delta history       {delta_bytes / 1024:9.1f} KiB ({delta_bytes / full_copy_bytes:.1%})")
+
+    response = client.get(f'/policy/{policy_id}/versions/1')
+    assert response.status_code == 200, response.status_code
+
+
+if __name__ == '__main__':
+    main()
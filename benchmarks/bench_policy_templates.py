@@ -0,0 +1,204 @@
+"""Micro-benchmark: section template engine vs. the original string-concatenation generator.
+
+Run from the repository root:
+    python benchmarks/bench_policy_templates.py
+"""
+import itertools
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from policy_templates import POLICY_FLAGS, generate_privacy_policy
+
+
+# Frozen copy of the original implementation from app.py, kept as the reference output
+def legacy_generate_privacy_policy(website_name, website_url, company_name, contact_email,
+                                 gdpr_compliant, ccpa_compliant, lgpd_compliant,
+                                 collects_personal_info, collects_cookies, collects_location,
+                                 shares_data, uses_analytics, social_login, has_newsletter,
+                                 user_accounts, processes_payments):
+    """Generate a privacy policy based on provided information"""
+    
+    # Base policy content
+    policy = f"""# Privacy Policy for {website_name}
+
+## Last Updated: {datetime.now().strftime('%B %d, %Y')}
+
+### Introduction
+
+Welcome to {website_name}. This Privacy Policy explains how {company_name} ("we", "us", or "our") collects, uses, and discloses your information when you use our website {website_url} (the "Service").
+
+We respect your privacy and are committed to protecting your personal data. Please read this Privacy Policy carefully to understand how we handle your information.
+
+### Information We Collect
+
+"""
+    
+    # Add sections based on collected information
+    if collects_personal_info:
+        policy += """We may collect personal information that you provide directly to us, such as:
+- Name
+- Email address
+- Phone number
+- Billing and shipping address
+- Payment information
+- Any other information you choose to provide
+
+"""
+    else:
+        policy += """We do not collect personally identifiable information unless you voluntarily provide it to us.
+
+"""
+    
+    if collects_cookies:
+        policy += """### Cookies and Tracking Technologies
+
+We use cookies and similar tracking technologies to track activity on our Service and hold certain information. Cookies are files with a small amount of data which may include an anonymous unique identifier.
+
+You can instruct your browser to refuse all cookies or to indicate when a cookie is being sent. However, if you do not accept cookies, you may not be able to use some portions of our Service.
+
+"""
+    
+    if collects_location:
+        policy += """### Location Data
+
+We may collect information about your location, such as through GPS, IP address, or other location-based technologies, to provide location-specific services or improve your experience.
+
+"""
+    
+    if uses_analytics:
+        policy += """### Analytics
+
+We may use third-party Service Providers to monitor and analyze the use of our Service, such as:
+- Google Analytics
+- Facebook Pixel
+- Other analytics services
+
+"""
+    
+    if social_login:
+        policy += """### Social Media Login
+
+We may offer login services through third-party social media platforms (e.g., Facebook, Google). When you use these services, we may collect information from your social media profile as permitted by your settings on those platforms.
+
+"""
+    
+    if has_newsletter:
+        policy += """### Email Newsletters
+
+If you subscribe to our newsletter, we may collect your email address and other relevant information to send you marketing communications. You may unsubscribe from these communications at any time.
+
+"""
+    
+    if user_accounts:
+        policy += """### User Accounts
+
+If you create an account with us, we collect information necessary to maintain your account, such as your username, password (encrypted), and any profile information you choose to provide.
+
+"""
+    
+    if processes_payments:
+        policy += """### Payment Processing
+
+We may collect payment information (e.g., credit card details) when you make purchases through our Service. This information is processed securely through third-party payment processors.
+
+"""
+    
+    if shares_data:
+        policy += """### Sharing Your Information
+
+We may share your personal information with:
+- Service providers who perform services on our behalf
+- Business partners with whom we jointly offer products or services
+- As required by law or to comply with legal process
+- To protect and defend our rights and property
+
+"""
+    
+    # Add compliance sections
+    if gdpr_compliant:
+        policy += f"""### GDPR Compliance
+
+For users in the European Union (EU) and European Economic Area (EEA), we process your data in accordance with the General Data Protection Regulation (GDPR). You have the following rights:
+- Right to access your personal data
+- Right to rectification if your data is inaccurate or incomplete
+- Right to erasure (right to be forgotten)
+- Right to restrict processing
+- Right to data portability
+- Right to object to processing
+- Rights in relation to automated decision making and profiling
+
+To exercise these rights, please contact us at {contact_email}.
+
+"""
+    
+    if ccpa_compliant:
+        policy += f"""### CCPA Compliance
+
+For California residents, the California Consumer Privacy Act (CCPA) provides you with specific rights regarding your personal information. You have the right to:
+- Know what personal information is being collected about you
+- Know whether your personal information is sold or disclosed and to whom
+- Opt out of the sale of your personal information
+- Access your personal information
+- Request deletion of your personal information
+- Not be discriminated against for exercising your CCPA rights
+
+To exercise these rights, please contact us at {contact_email}.
+
+"""
+    
+    if lgpd_compliant:
+        policy += f"""### LGPD Compliance
+
+For users in Brazil, we process your data in accordance with the Lei Geral de Proteção de Dados (LGPD). You have rights similar to those under GDPR, including:
+- Confirmation of the existence of data processing
+- Access to your personal data
+- Correction of incomplete, inaccurate, or outdated data
+- Anonymization, blocking, or deletion of unnecessary or non-compliant data
+- Data portability
+- Information about sharing of your data
+
+To exercise these rights, please contact us at {contact_email}.
+
+"""
+    
+    # Contact information
+    policy += f"""### Contact Us
+
+If you have any questions about this Privacy Policy, please contact us at:
+- Email: {contact_email}
+- Website: {website_url}
+- Company: {company_name}
+
+"""
+    
+    return policy
+
+
+def _args(flags):
+    return ('Example Site', 'https://www.example.com', 'Example Inc.', 'privacy@example.com') + flags
+
+
+def check_identical():
+    for flags in itertools.product((False, True), repeat=len(POLICY_FLAGS)):
+        expected = legacy_generate_privacy_policy(*_args(flags))
+        actual = generate_privacy_policy(*_args(flags))
+        if expected != actual:
+            raise SystemExit(f"Output differs for flags {flags}")
+    print(f"Output byte-identical for all {2 ** len(POLICY_FLAGS)} flag combinations")
+
+
+def main():
+    check_identical()
+    all_flags = list(itertools.product((False, True), repeat=len(POLICY_FLAGS)))
+    for name, func in (('legacy', legacy_generate_privacy_policy), ('templates', generate_privacy_policy)):
+        elapsed = timeit.timeit(lambda: [func(*_args(flags)) for flags in all_flags], number=5)
+        per_call = elapsed / (5 * len(all_flags)) * 1e6
+        print(f"{name:<10} {per_call:8.2f} us/policy")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Benchmark: policy search latency with --policies indexed policies (1M by default).
+
+The policies are spread over --users owners, and every query searches the first
+user's policies. The queries are terms matched through the text index, name and
+URL prefixes, flag filters, and a later page reached by cursor. "scan" is a
+case-insensitive regex over every field of the user's policies, the only way to
+search before the index existed. Run against a local mongod (the database is
+dropped afterwards):
+    python benchmarks/bench_search.py --mongo-uri mongodb://localhost:27017/
+mongomock has neither indexes nor $text, so --mongomock only checks that the
+prefix and flag queries work, on a smaller --policies.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import MongoClient
+
+from bulk_generate import synthetic_descriptors
+from harness import latency_ms
+from mongo import ensure_indexes
+from policy_search import search_policies
+from policy_store import new_policy_document, policy_inputs
+
+WORDS = (
+    "acme", "blue", "cedar", "delta", "ember", "falcon", "granite", "harbor", "iris", "juniper",
+    "kite", "lumen", "maple", "nova", "orbit", "pixel", "quartz", "river", "summit", "tidal",
+)
+
+QUERIES = (
+    ("terms: common clause", dict(terms="cookies")),
+    ("terms: site word", dict(terms="falcon")),
+    ("terms: two words", dict(terms="harbor analytics")),
+    ("terms + gdpr", dict(terms="cookies", flags={"gdpr_compliant": True})),
+    ("prefix: 1 char", dict(prefix="m")),
+    ("prefix: name", dict(prefix="maple river")),
+    ("prefix: url", dict(prefix="https://www.summit-1")),
+    ("flags: gdpr+ccpa", dict(flags={"gdpr_compliant": True, "ccpa_compliant": True})),
+)
+
+
+def descriptors(count):
+    for i, descriptor in enumerate(synthetic_descriptors(count)):
+        first, second = random.Random(i).sample(WORDS, 2)
+        descriptor.update(
+            website_name=f"{first.title()} {second.title()} {i}",
+            website_url=f"https://www.{first}-{i}.example.com",
+            company_name=f"{second.title()} Holdings {i}",
+        )
+        yield descriptor
+
+
+def seed(collection, users, count):
+    batch = []
+    for i, descriptor in enumerate(descriptors(count)):
+        batch.append(new_policy_document(f"bench-user-{i % users}", policy_inputs(descriptor)))
+        if len(batch) == 1000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+
+def scan(collection, user_id, term):
+    regex = {"$regex": term, "$options": "i"}
+    fields = ("website_name", "website_url", "company_name", "content")
+    return list(collection.find({"user_id": user_id, "$or": [{field: regex} for field in fields]}).limit(20))
+
+
+def _pages(collection, user_id, query, limit):
+    cursor = None
+    while True:
+        page, cursor = search_policies(collection, user_id, cursor=cursor, limit=limit, **query)
+        yield page
+        if cursor is None:
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--mongomock', action='store_true')
+    parser.add_argument('--policies', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.mongo_uri)
+    db = client['privacy_policy_benchmark']
+    collection = db['policies']
+    user_id = "bench-user-0"
+
+    try:
+        started = time.perf_counter()
+        ensure_indexes(db)
+        seed(collection, args.users, args.policies)
+        print(f"Indexed {args.policies} policies for {args.users} users in {time.perf_counter() - started:.1f}s; "
+              f"searching {collection.count_documents({'user_id': user_id})} of them")
+
+        print(f"{'query':<22} {'matches':>8} {'first page p50/p99 ms':>22} {'page 5 p50 ms':>14}")
+        for name, query in QUERIES:
+            if args.mongomock and 'terms' in query:
+                print(f"{name:<22} {'n/a (needs a mongod with $text)':>46}")
+                continue
+            matches = sum(len(page) for page in _pages(collection, user_id, query, limit=100))
+            first = latency_ms(lambda: search_policies(collection, user_id, limit=20, **query), args.repeat)
+            cursor = None
+            for _ in range(4):
+                _, cursor = search_policies(collection, user_id, cursor=cursor, limit=20, **query)
+                if cursor is None:
+                    break
+            page5 = (
+                latency_ms(lambda: search_policies(collection, user_id, cursor=cursor, limit=20, **query), args.repeat)[0]
+                if cursor else float('nan')
+            )
+            print(f"{name:<22} {matches:>8} {first[0]:>10.2f} / {first[1]:>9.2f} {page5:>14.2f}")
+
+        for term in ("falcon", "zzz-no-match"):
+            p50, p99 = latency_ms(lambda: scan(collection, user_id, term), max(3, args.repeat // 10))
+            print(f"{'scan: ' + term:<22} {'':>8} {p50:>10.2f} / {p99:>9.2f}")
+    finally:
+        client.drop_database('privacy_policy_benchmark')
+
+
+if __name__ == '__main__':
+    main()
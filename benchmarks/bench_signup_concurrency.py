@@ -0,0 +1,71 @@
+"""Concurrency check and benchmark for signup.
+
+Fires parallel signups that all reuse one username (and, separately, one email)
+and checks that exactly one of each wins, then reports signup latency.
+Use --mongo-uri for a real mongod; mongomock is not thread-safe, so only a real
+server proves the unique indexes hold under concurrency.
+    python benchmarks/bench_signup_concurrency.py --mongo-uri mongodb://localhost:27017/
+"""
+import argparse
+import os
+import threading
+import time
+
+# Keep the KDF cheap so the numbers reflect the database path
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+from harness import drop_benchmark_db, latency_ms, load_app
+
+
+def race(appmod, forms):
+    barrier = threading.Barrier(len(forms))
+    results = []
+
+    def worker(form):
+        client = appmod.app.test_client()
+        barrier.wait()
+        started = time.perf_counter()
+        response = client.post('/signup', data=form)
+        results.append((response.status_code == 302, (time.perf_counter() - started) * 1000))
+
+    threads = [threading.Thread(target=worker, args=(form,)) for form in forms]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri')
+    parser.add_argument('--parallel', type=int, default=32)
+    args = parser.parse_args()
+
+    appmod = load_app(mongo_uri=args.mongo_uri)
+    try:
+        base = dict(password='pw', confirm_password='pw', name='Racer')
+        same_username = [dict(base, username='racer', email=f'racer{i}@example.com') for i in range(args.parallel)]
+        same_email = [dict(base, username=f'racer{i}', email='shared@example.com') for i in range(args.parallel)]
+        for name, forms in (('same username', same_username), ('same email', same_email)):
+            results = race(appmod, forms)
+            winners = sum(1 for ok, _ in results if ok)
+            latencies = sorted(ms for _, ms in results)
+            print(f"{name:<14} {winners} of {len(results)} succeeded "
+                  f"({'OK' if winners == 1 else 'FAIL'}), max latency {latencies[-1]:.2f} ms")
+
+        client = appmod.app.test_client()
+        counter = iter(range(10 ** 9))
+
+        def signup():
+            i = next(counter)
+            client.post('/signup', data=dict(base, username=f'seq{i}', email=f'seq{i}@example.com'))
+
+        p50, p99 = latency_ms(signup, 200)
+        print(f"sequential signup p50 {p50:.2f} ms  p99 {p99:.2f} ms")
+    finally:
+        drop_benchmark_db(appmod)
+
+
+if __name__ == '__main__':
+    main()
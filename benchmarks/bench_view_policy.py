@@ -0,0 +1,47 @@
+"""Benchmark: /policy/<id> latency with markdown rendered per view vs. rendered once.
+
+"per view" clears the stored HTML and the render cache before every request, which
+is the work the route used to do on each hit.
+    python benchmarks/bench_view_policy.py
+"""
+import argparse
+import timeit
+
+import markdown
+
+from harness import create_policy, latency_ms, load_app, logged_in_client
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    appmod = load_app()
+    from policy_html import html_cache, render_policy_html
+    client = logged_in_client(appmod)
+    policy_id = create_policy(client)
+    url = f'/policy/{policy_id}'
+    policy = appmod.policies_collection.find_one({}, {"content": 1})
+
+    def per_view():
+        appmod.policies_collection.update_one({"_id": policy["_id"]}, {"$unset": {"content_html": ""}})
+        html_cache.clear()
+        client.get(url)
+
+    def render_once():
+        client.get(url)
+
+    for name, func in (('per view', per_view), ('render once', render_once)):
+        p50, p99 = latency_ms(func, args.repeat)
+        print(f"{name:<12} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+
+    md = markdown.Markdown()
+    fresh = timeit.timeit(lambda: markdown.markdown(policy['content']), number=200) / 200 * 1000
+    reused = timeit.timeit(lambda: md.reset().convert(policy['content']), number=200) / 200 * 1000
+    cached = timeit.timeit(lambda: render_policy_html(policy['content']), number=200) / 200 * 1000
+    print(f"markdown.markdown() {fresh:.3f} ms, reused Markdown {reused:.3f} ms, cached {cached:.4f} ms")
+
+
+if __name__ == '__main__':
+    main()
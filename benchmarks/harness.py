@@ -0,0 +1,68 @@
+"""Shared helpers for benchmarks that drive app.py through the Flask test client."""
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_app(use_mongomock=True, mongo_uri=None):
+    """Import app.py backed by mongomock, or by a throwaway database on mongo_uri"""
+    if mongo_uri:
+        os.environ['MONGO_URI'] = mongo_uri
+        os.environ['MONGO_DB_NAME'] = f'privacy_policy_benchmark_{os.getpid()}'
+    elif use_mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    app.app.testing = True
+    app.ensure_indexes(app.get_db())
+    return app
+
+
+def drop_benchmark_db(appmod):
+    if os.environ.get('MONGO_DB_NAME', '').startswith('privacy_policy_benchmark_'):
+        appmod.get_client().drop_database(os.environ['MONGO_DB_NAME'])
+
+
+def logged_in_client(appmod, username='bench', password='bench-password'):
+    client = appmod.app.test_client()
+    client.post('/signup', data=dict(
+        username=username, password=password, confirm_password=password,
+        name='Bench User', email=f'{username}@example.com'
+    ))
+    client.post('/login', data=dict(username=username, password=password))
+    return client
+
+
+def create_policy(client, **overrides):
+    form = dict(
+        website_name='Example Site', website_url='https://www.example.com',
+        company_name='Example Inc.', contact_email='privacy@example.com',
+        gdpr_compliant='on', ccpa_compliant='on', lgpd_compliant='on',
+        collects_personal_info='on', collects_cookies='on', collects_location='on',
+        shares_data='on', uses_analytics='on', social_login='on', has_newsletter='on',
+        user_accounts='on', processes_payments='on'
+    )
+    form.update(overrides)
+    response = client.post('/create-policy', data=form)
+    return response.location.rsplit('/', 1)[-1]
+
+
+def latency_ms(func, repeat):
+    """Run func repeat times and return (p50, p99) in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
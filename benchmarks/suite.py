@@ -0,0 +1,294 @@
+"""Performance suite: micro-benchmarks plus route load tests, with JSON output and
+regression checks against a stored baseline.
+
+Micro-benchmarks time generate_privacy_policy over all 4096 option combinations,
+a cold PDF build (what download_policy does on a cache miss) and the markdown
+filter with and without its render cache. Load tests drive /login, /dashboard,
+/my-policies, /policy/<id> and /policy/<id>/download through the Flask test
+client, against mongomock by default or a throwaway database with --mongo-uri.
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --runs 3 --baseline benchmarks/baseline.json --threshold 0.25
+    python benchmarks/suite.py --runs 3 --baseline benchmarks/baseline.json --update-baseline
+
+Exits with status 1 when any benchmark's p50 is more than --threshold slower than
+the baseline. Absolute numbers depend on the machine, so refresh the baseline with
+--update-baseline on the machine that runs the comparison.
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from harness import ROOT, create_policy, drop_benchmark_db, load_app, logged_in_client
+
+# generate_privacy_policy option names, in signature order after the text fields
+OPTIONS = (
+    'gdpr_compliant', 'ccpa_compliant', 'lgpd_compliant', 'collects_personal_info',
+    'collects_cookies', 'collects_location', 'shares_data', 'uses_analytics',
+    'social_login', 'has_newsletter', 'user_accounts', 'processes_payments'
+)
+
+LOGIN_PASSWORD = 'suite-password'
+
+# Policies owned by the load-test user, so /my-policies renders a full page
+POLICY_COUNT = 25
+
+
+def summarize(samples, concurrency=1):
+    """Latency summary in milliseconds for a list of per-operation timings in seconds"""
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "samples": len(samples),
+        "mean_ms": total / len(samples) * 1000,
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        "ops_per_sec": len(samples) * concurrency / total if total else 0.0,
+    }
+
+
+def time_calls(func, repeat, setup=None):
+    # Like timeit, keep the cyclic GC out of the measurements
+    samples = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+    return summarize(samples)
+
+
+def load_test(make_client, request, repeat, concurrency):
+    """Send repeat requests from each of concurrency threads, one test client per thread"""
+    if concurrency == 1:
+        client = make_client()
+        return time_calls(lambda: request(client), repeat)
+
+    samples = []
+    lock = threading.Lock()
+
+    def worker(client):
+        local = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            request(client)
+            local.append(time.perf_counter() - started)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(make_client(),)) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(samples, concurrency)
+
+
+def expect(status):
+    def check(response):
+        if response.status_code != status:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}, expected {status}")
+        return response
+    return check
+
+
+def micro_benchmarks(appmod, scale):
+    from pdf_markdown import spec_cache
+    from policy_html import html_cache
+    from policy_pdf import build_policy_pdf
+    from policy_templates import generate_privacy_policy
+
+    combinations = list(itertools.product((False, True), repeat=len(OPTIONS)))
+
+    def generate_all():
+        for flags in combinations:
+            generate_privacy_policy(
+                'Example Site', 'https://www.example.com', 'Example Inc.', 'privacy@example.com',
+                *flags
+            )
+
+    all_on = dict.fromkeys(OPTIONS, True)
+    content = generate_privacy_policy(
+        'Example Site', 'https://www.example.com', 'Example Inc.', 'privacy@example.com', **all_on
+    )
+    policy = {
+        "website_name": 'Example Site', "website_url": 'https://www.example.com',
+        "company_name": 'Example Inc.', "content": content, "last_updated": datetime.utcnow(),
+        "gdpr_compliant": True, "ccpa_compliant": True, "lgpd_compliant": True,
+    }
+
+    results = {}
+    stats = time_calls(generate_all, max(1, 5 * scale))
+    stats["per_policy_us"] = stats["p50_ms"] * 1000 / len(combinations)
+    results["generate_privacy_policy[4096 combinations]"] = stats
+    results["pdf_build[cold]"] = time_calls(lambda: build_policy_pdf(policy), max(3, 10 * scale), spec_cache.clear)
+    results["render_markdown[cold]"] = time_calls(
+        lambda: appmod.render_markdown(content), max(10, 100 * scale), html_cache.clear
+    )
+    results["render_markdown[cached]"] = time_calls(lambda: appmod.render_markdown(content), max(10, 1000 * scale))
+    return results
+
+
+def route_load_tests(appmod, scale, concurrency):
+    owner = logged_in_client(appmod, username='suite', password=LOGIN_PASSWORD)
+    for _ in range(POLICY_COUNT):
+        policy_id = create_policy(owner)
+    appmod.dashboard_stats_cache.clear()
+
+    def logged_in():
+        return logged_in_client(appmod, username='suite', password=LOGIN_PASSWORD)
+
+    routes = (
+        # Login cost is dominated by the password KDF, so it gets fewer samples
+        ("POST /login", appmod.app.test_client, lambda c: expect(302)(
+            c.post('/login', data=dict(username='suite', password=LOGIN_PASSWORD))), max(3, 10 * scale)),
+        ("GET /dashboard", logged_in, lambda c: expect(200)(c.get('/dashboard')), 200 * scale),
+        ("GET /my-policies", logged_in, lambda c: expect(200)(c.get('/my-policies')), 200 * scale),
+        ("GET /policy/<id>", logged_in, lambda c: expect(200)(c.get(f'/policy/{policy_id}')), 200 * scale),
+        ("GET /policy/<id>/download", logged_in,
+         lambda c: expect(200)(c.get(f'/policy/{policy_id}/download')), 100 * scale),
+    )
+    results = {}
+    for name, make_client, request, repeat in routes:
+        results[name] = load_test(make_client, request, max(1, repeat), concurrency)
+        results[name]["concurrency"] = concurrency
+    return results
+
+
+def median_run(runs):
+    """For each benchmark, keep the run whose p50 is the median across runs"""
+    results = {}
+    for name in runs[0]:
+        ordered = sorted((run[name] for run in runs), key=lambda stats: stats["p50_ms"])
+        results[name] = dict(ordered[len(ordered) // 2], runs=len(runs))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Return (rows, regressions) comparing each benchmark's p50 with the baseline.
+
+    Slowdowns smaller than min_delta_ms are never regressions, so sub-millisecond
+    benchmarks don't fail on timer noise.
+    """
+    rows = []
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            rows.append((name, stats["p50_ms"], None, None))
+            continue
+        change = stats["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        rows.append((name, stats["p50_ms"], base["p50_ms"], change))
+        if change > threshold and stats["p50_ms"] - base["p50_ms"] > min_delta_ms:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mongo-uri', help="Run against a throwaway database on this server instead of mongomock")
+    parser.add_argument('--scale', type=int, default=1, help="Multiply the number of samples per benchmark")
+    parser.add_argument('--runs', type=int, default=1,
+                        help="Repeat the suite and report each benchmark's median run, to damp noise")
+    parser.add_argument('--concurrency', type=int, default=1, help="Client threads per route load test")
+    parser.add_argument('--only', choices=('micro', 'routes'), help="Run one half of the suite")
+    parser.add_argument('--output', help="Write results JSON here (default: stdout)")
+    parser.add_argument('--baseline', help="Baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed p50 slowdown as a fraction of the baseline (default 0.25)")
+    parser.add_argument('--min-delta-ms', type=float, default=0.05,
+                        help="Ignore p50 slowdowns smaller than this many milliseconds")
+    parser.add_argument('--update-baseline', action='store_true', help="Write these results to --baseline")
+    args = parser.parse_args()
+
+    appmod = load_app(mongo_uri=args.mongo_uri)
+    runs = []
+    try:
+        for _ in range(args.runs):
+            run = {}
+            if args.only in (None, 'micro'):
+                run.update(micro_benchmarks(appmod, args.scale))
+            if args.only in (None, 'routes'):
+                run.update(route_load_tests(appmod, args.scale, args.concurrency))
+            runs.append(run)
+    finally:
+        drop_benchmark_db(appmod)
+    results = median_run(runs)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "mongod" if args.mongo_uri else "mongomock",
+            "password_hash": appmod.password_hasher.method_prefix,
+            "scale": args.scale,
+            "runs": args.runs,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    encoded = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(encoded + '\n')
+    else:
+        print(encoded)
+
+    if not args.baseline:
+        return 0
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(encoded + '\n')
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline first", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    for key in ("database", "concurrency", "scale", "runs", "password_hash"):
+        if baseline["meta"].get(key) != report["meta"][key]:
+            print(f"warning: baseline {key} is {baseline['meta'].get(key)!r}, this run used {report['meta'][key]!r}",
+                  file=sys.stderr)
+    rows, regressions = compare(results, baseline["results"], args.threshold, args.min_delta_ms)
+    for name, p50, base, change in rows:
+        if base is None:
+            print(f"{name:<45} {p50:10.3f} ms   (new)", file=sys.stderr)
+        else:
+            flag = "  REGRESSION" if name in regressions else ""
+            print(f"{name:<45} {p50:10.3f} ms   baseline {base:10.3f} ms   {change:+7.1%}{flag}", file=sys.stderr)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import argparse
+import json
+import sys
+
+from pymongo import MongoClient
+
+from policy_blobs import POLICY_DEDUP
+from policy_store import bulk_create_policies, ndjson_descriptors
+
+
+def read_descriptors(stream):
+    """Yield site descriptors from a JSON list or an NDJSON stream.
+
+    Malformed NDJSON lines come through as None and are reported per item, as
+    the bulk API does; a malformed JSON list raises ValueError.
+    """
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        yield from json.loads(first + stream.read())
+        return
+    yield from ndjson_descriptors((first + stream.readline(), *stream))
+
+
+def synthetic_descriptors(count):
+    """Reproducible site descriptors for throughput runs"""
+    for i in range(count):
+        yield {
+            "website_name": f"Client Site {i}",
+            "website_url": f"https://client{i}.example.com",
+            "company_name": f"Client {i} LLC",
+            "contact_email": f"privacy@client{i}.example.com",
+            "gdpr_compliant": i % 2 == 0,
+            "ccpa_compliant": i % 3 == 0,
+            "lgpd_compliant": i % 5 == 0,
+            "collects_personal_info": True,
+            "collects_cookies": i % 4 != 0,
+            "uses_analytics": i % 2 == 1,
+            "user_accounts": True,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and store privacy policies in bulk")
+    parser.add_argument('input', nargs='?', help="JSON list or NDJSON file of site descriptors (default: stdin)")
+    parser.add_argument('--user-id', required=True, help="Owner of the generated policies")
+    parser.add_argument('--mongo-uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--synthetic', type=int, metavar='N', help="Generate N synthetic sites instead of reading input")
+    parser.add_argument('--mongomock', action='store_true', help="Write to an in-memory mongomock database")
+    args = parser.parse_args(argv)
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.mongo_uri)
+    db = client['privacy_policy_generator']
+    policies_collection = db['policies']
+    user_stats_collection = db['user_stats']
+    # Same storage as the app, so CLI-created policies share blobs with web-created ones
+    policy_blobs_collection = db['policy_blobs'] if POLICY_DEDUP else None
+
+    try:
+        if args.synthetic:
+            summary = bulk_create_policies(
+                policies_collection, args.user_id, synthetic_descriptors(args.synthetic), args.batch_size, user_stats_collection,
+                blobs=policy_blobs_collection
+            )
+        elif args.input:
+            with open(args.input, encoding='utf-8') as f:
+                summary = bulk_create_policies(
+                    policies_collection, args.user_id, read_descriptors(f), args.batch_size, user_stats_collection,
+                    blobs=policy_blobs_collection
+                )
+        else:
+            summary = bulk_create_policies(
+                policies_collection, args.user_id, read_descriptors(sys.stdin), args.batch_size, user_stats_collection,
+                blobs=policy_blobs_collection
+            )
+    except json.JSONDecodeError as e:
+        # Only a JSON list is parsed whole; NDJSON lines are reported one by one
+        print(f"Invalid JSON list: {e}", file=sys.stderr)
+        return 2
+
+    for item in summary['results']:
+        if 'error' in item:
+            print(f"#{item['index']}: {item['error']}", file=sys.stderr)
+    print(f"Inserted {summary['inserted']} policies, {summary['failed']} failed, "
+          f"in {summary['elapsed_seconds']}s ({summary['policies_per_second']} policies/sec)")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
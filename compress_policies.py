@@ -0,0 +1,134 @@
+import argparse
+import statistics
+import sys
+
+import bson
+from pymongo import MongoClient, UpdateOne
+
+from policy_storage import (
+    DICTIONARY_VERSION, STORAGE_FORMATS, build_dictionary, dictionary_path, stored_format, storage_update,
+    unpack_policy
+)
+
+
+def _apply(policy, update):
+    """A policy as it will be stored after a $set/$unset update"""
+    after = {key: value for key, value in policy.items() if key not in update["$unset"]}
+    after.update(update["$set"])
+    return after
+
+
+def repack_policies(collection, storage, batch_size=500, dry_run=False, query=None):
+    """Rewrite every policy's text in the `storage` format and return BSON sizes before and after.
+
+    Each update is conditional on last_updated, so a policy edited while the
+    migration runs keeps its edit (in whatever format the app wrote it). Policies
+    referencing a blob have no text of their own and are left out; repack the
+    blobs collection itself to convert theirs (blobs are never edited).
+    """
+    before, after, formats = [], [], {}
+    requests = []
+    skipped = 0
+
+    def flush():
+        nonlocal skipped
+        if requests and not dry_run:
+            result = collection.bulk_write(requests, ordered=False)
+            skipped += len(requests) - result.matched_count
+        requests.clear()
+
+    for policy in collection.find({**(query or {}), "blob_key": {"$exists": False}}):
+        size = len(bson.encode(policy))
+        stored = dict(policy)
+        unpack_policy(policy)
+        fields = {field: policy[field] for field in ('content', 'content_html', 'inputs', 'content_date') if field in policy}
+        update = storage_update(fields, storage)
+        # Only what actually changes is written
+        update["$set"] = {key: value for key, value in update["$set"].items() if stored.get(key) != value}
+        update["$unset"] = {key: "" for key in update.get("$unset", {}) if key in stored}
+
+        repacked = _apply(stored, update)
+        target = stored_format(repacked)[0]
+        before.append(size)
+        after.append(len(bson.encode(repacked)))
+        formats[target] = formats.get(target, 0) + 1
+        if update["$set"] or update["$unset"]:
+            requests.append(UpdateOne(
+                {"_id": policy["_id"], "last_updated": policy.get("last_updated")},
+                {op: values for op, values in update.items() if values}
+            ))
+            if len(requests) >= batch_size:
+                flush()
+    flush()
+    return {"before": before, "after": after, "formats": formats, "skipped": skipped}
+
+
+def _describe(sizes):
+    if not sizes:
+        return "no policies"
+    return (f"total {sum(sizes) / 1024:10.1f} KiB   mean {statistics.mean(sizes):8.0f} B   "
+            f"median {statistics.median(sizes):8.0f} B   max {max(sizes):8d} B")
+
+
+def print_report(result, storage, dry_run):
+    before, after = result["before"], result["after"]
+    print(f"{len(before)} policies, target format {storage}{' (dry run)' if dry_run else ''}")
+    print(f"before  {_describe(before)}")
+    print(f"after   {_describe(after)}")
+    if before:
+        print(f"saved {1 - sum(after) / sum(before):.1%} of document bytes")
+    print("formats written: " + ", ".join(f"{fmt} {count}" for fmt, count in sorted(result["formats"].items())))
+    if result["skipped"]:
+        print(f"{result['skipped']} policies changed during the migration and were left as they are")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert stored policies to another POLICY_STORAGE format and report bytes per policy"
+    )
+    parser.add_argument('--format', choices=STORAGE_FORMATS, help="Storage format to convert to")
+    parser.add_argument('--mongo-uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--db-name', default='privacy_policy_generator')
+    parser.add_argument('--user-id', help="Only convert this user's policies")
+    parser.add_argument('--blobs', action='store_true', help="Convert the text shared by deduplicated policies")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help="Report sizes without writing anything")
+    parser.add_argument('--synthetic', type=int, metavar='N', help="Seed N synthetic policies first (with --mongomock)")
+    parser.add_argument('--mongomock', action='store_true', help="Use an in-memory mongomock database")
+    parser.add_argument('--build-dictionary', action='store_true',
+                        help=f"Write a compression dictionary for the current templates as version {DICTIONARY_VERSION + 1}")
+    args = parser.parse_args(argv)
+
+    if args.build_dictionary:
+        path = dictionary_path(DICTIONARY_VERSION + 1)
+        with open(path, 'wb') as f:
+            f.write(build_dictionary())
+        print(f"Wrote {path}; bump DICTIONARY_VERSION in policy_storage.py to use it for new writes")
+        return 0
+    if not args.format:
+        parser.error("--format is required")
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.mongo_uri)
+    policies_collection = client[args.db_name]['policies']
+
+    if args.synthetic:
+        from bulk_generate import synthetic_descriptors
+        from policy_store import bulk_create_policies
+        bulk_create_policies(policies_collection, args.user_id or 'synthetic', synthetic_descriptors(args.synthetic))
+
+    if args.blobs:
+        result = repack_policies(client[args.db_name]['policy_blobs'], args.format, args.batch_size, args.dry_run)
+        print_report(result, args.format, args.dry_run)
+        return 0
+    query = {"user_id": args.user_id} if args.user_id else None
+    result = repack_policies(policies_collection, args.format, args.batch_size, args.dry_run, query)
+    print_report(result, args.format, args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
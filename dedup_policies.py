@@ -0,0 +1,153 @@
+"""Move stored policies' text into blobs shared by identical policies (see policy_blobs.py).
+
+Only text the current templates render as-is from the policy's inputs can be
+shared; older or hand-edited text stays on its policy. Reports the dedup ratio
+and the bytes held by policies and blobs before and after.
+    python dedup_policies.py --dry-run
+    python dedup_policies.py --mongomock --synthetic 2000
+"""
+import argparse
+import sys
+
+import bson
+from pymongo import MongoClient, UpdateOne
+
+from policy_blobs import BLOB_TEXT_FIELDS, acquire_blobs, blob_document, blob_key, release_blob
+from policy_storage import rerenders, unpack_policy
+from policy_store import policy_text
+
+
+def _collection_bytes(collection):
+    return sum(len(bson.encode(document)) for document in collection.find())
+
+
+def dedup_policies(policies, blobs, batch_size=500, dry_run=False, query=None):
+    """Point every shareable policy at the blob for its inputs and return counts and byte totals.
+
+    Each update is conditional on last_updated, so a policy edited while the
+    migration runs keeps its edit, and the reference taken for it is released.
+    """
+    stats = {
+        "policies": 0, "shared": 0, "inline": 0, "skipped": 0, "new_blobs": 0, "keys": set(),
+        "policies_before": 0, "policies_after": 0,
+        "blobs_before": _collection_bytes(blobs), "blobs_added": 0,
+    }
+    texts = {}
+    requests = []
+    references = {}
+
+    def flush():
+        if requests and not dry_run:
+            acquire_blobs(blobs, texts)
+            result = policies.bulk_write(requests, ordered=False)
+            if result.matched_count < len(requests):
+                for policy in policies.find({"_id": {"$in": list(references)}, "blob_key": {"$exists": False}}, {"_id": 1}):
+                    # Edited in the meantime: drop the reference taken for its old text
+                    release_blob(blobs, references[policy['_id']])
+                    stats["skipped"] += 1
+        texts.clear()
+        requests.clear()
+        references.clear()
+
+    for policy in policies.find({**(query or {}), "blob_key": {"$exists": False}}):
+        stats["policies"] += 1
+        size = len(bson.encode(policy))
+        stats["policies_before"] += size
+        stored = dict(policy)
+        unpack_policy(policy)
+        if not rerenders(policy):
+            stats["inline"] += 1
+            stats["policies_after"] += size
+            continue
+
+        key = blob_key(policy['inputs'], policy['content_date'])
+        text = {**policy_text(policy['inputs'], policy['content_date']),
+                "inputs": policy['inputs'], "content_date": policy['content_date']}
+        if 'content_html' in policy:
+            text['content_html'] = policy['content_html']
+        if key in texts:
+            texts[key][0] += 1
+        else:
+            texts[key] = [1, text]
+        if key not in stats["keys"] and blobs.count_documents({"_id": key}, limit=1) == 0:
+            stats["new_blobs"] += 1
+            stats["blobs_added"] += len(bson.encode(blob_document(key, text)))
+        stats["shared"] += 1
+        stats["keys"].add(key)
+
+        to_set = {"blob_key": key, "section_lengths": text['section_lengths']}
+        to_unset = {field: "" for field in BLOB_TEXT_FIELDS if field in stored}
+        after = {field: value for field, value in stored.items() if field not in to_unset}
+        after.update(to_set)
+        stats["policies_after"] += len(bson.encode(after))
+        references[policy['_id']] = key
+        requests.append(UpdateOne(
+            {"_id": policy['_id'], "last_updated": policy.get('last_updated')},
+            {"$set": to_set, "$unset": to_unset} if to_unset else {"$set": to_set}
+        ))
+        if len(requests) >= batch_size:
+            flush()
+    flush()
+    return stats
+
+
+def _kib(size):
+    return f"{size / 1024:10.1f} KiB"
+
+
+def print_report(stats, dry_run):
+    print(f"{stats['policies']} policies{' (dry run)' if dry_run else ''}: {stats['shared']} shared, "
+          f"{stats['inline']} kept inline (text not rendered by the current templates)")
+    if stats["keys"]:
+        print(f"{len(stats['keys'])} distinct texts, dedup ratio {stats['shared'] / len(stats['keys']):.2f} "
+              f"policies per text; {stats['new_blobs']} new blobs")
+    before = stats["policies_before"] + stats["blobs_before"]
+    after = stats["policies_after"] + stats["blobs_before"] + stats["blobs_added"]
+    print(f"before  policies {_kib(stats['policies_before'])}   blobs {_kib(stats['blobs_before'])}   "
+          f"total {_kib(before)}")
+    print(f"after   policies {_kib(stats['policies_after'])}   blobs "
+          f"{_kib(stats['blobs_before'] + stats['blobs_added'])}   total {_kib(after)}")
+    if before:
+        print(f"saved {1 - after / before:.1%} of policy and blob bytes")
+    if stats["skipped"]:
+        print(f"{stats['skipped']} policies changed during the migration and were left as they are")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share identical policy texts through policy_blobs and report the savings")
+    parser.add_argument('--mongo-uri', default="mongodb://localhost:27017/")
+    parser.add_argument('--db-name', default='privacy_policy_generator')
+    parser.add_argument('--user-id', help="Only move this user's policies")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help="Report sizes without writing anything")
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help="Seed N synthetic policies over 10 users, half of them the same sites, first (with --mongomock)")
+    parser.add_argument('--mongomock', action='store_true', help="Use an in-memory mongomock database")
+    args = parser.parse_args(argv)
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = MongoClient(args.mongo_uri)
+    db = client[args.db_name]
+
+    if args.synthetic:
+        from bulk_generate import synthetic_descriptors
+        from policy_store import bulk_create_policies
+        per_user = args.synthetic // 20
+        for user in range(10):
+            # Every user gets the same first per_user sites, plus sites of their own
+            descriptors = list(synthetic_descriptors(per_user * 2))
+            for descriptor in descriptors[per_user:]:
+                descriptor['website_name'] += f" ({user})"
+            bulk_create_policies(db['policies'], f"synthetic-{user}", descriptors)
+
+    query = {"user_id": args.user_id} if args.user_id else None
+    stats = dedup_policies(db['policies'], db['policy_blobs'], args.batch_size, args.dry_run, query)
+    print_report(stats, args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
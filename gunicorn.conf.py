@@ -0,0 +1,32 @@
+"""gunicorn settings, picked up automatically when gunicorn is started from this directory.
+
+Workers import the app on their own by default, and reportlab and markdown are
+only loaded when a worker first renders a PDF or markdown. With GUNICORN_PRELOAD=1
+the master imports the app, warms those up and freezes the heap before forking,
+so every worker shares one copy of them copy-on-write. Preloading means code
+changes need a full restart rather than a HUP.
+
+The master refuses to start against a database without the indexes created by
+'flask init-db', since signup, search and policy edits depend on them.
+"""
+import gc
+import os
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "").lower() in ("1", "true", "yes")
+
+
+def on_starting(server):
+    from pymongo import MongoClient
+    from mongo import DB_NAME, check_indexes, client_options
+    # A client of its own, closed before forking; workers create theirs in mongo.get_client
+    with MongoClient(os.environ.get("MONGO_URI"), **client_options()) as client:
+        check_indexes(client[DB_NAME])
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import warm_up
+        warm_up()
+        # Keep the collector from writing to inherited objects, which would copy their pages
+        gc.collect()
+        gc.freeze()
@@ -0,0 +1,178 @@
+"""Conditional GET, static asset fingerprinting, HTML compression and download headers shared by the WSGI and ASGI apps"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from urllib.parse import quote
+
+from werkzeug.http import dump_options_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# One year, for URLs that change whenever their content does
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Responses smaller than this aren't worth a Content-Encoding
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+COMPRESSIBLE_MIMETYPES = frozenset({'text/html'})
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+# Preferred first; brotli is optional (pip install brotli)
+CONTENT_CODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+_FINGERPRINTED = re.compile(r'^(?P<base>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+
+
+def policy_etag(policy, *extra):
+    """Strong ETag for a response rendered from a stored policy.
+
+    Every edit bumps last_updated and version, so the ETag changes exactly when
+    the policy does; `extra` covers anything else the response depends on.
+    """
+    digest = hashlib.sha256()
+    for value in (policy['_id'], policy['last_updated'].isoformat(), policy.get('version'), *extra):
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()[:32]
+
+
+def matching_etag(etag, if_none_match):
+    """The variant of `etag` (identity or compressed) the client already holds, or None"""
+    for variant in (etag, *(f"{etag}-{coding}" for coding in CONTENT_CODINGS)):
+        if variant in if_none_match:
+            return variant
+    return None
+
+
+def attachment(download_name):
+    """Content-Disposition for a download, encoded exactly as flask.send_file does.
+
+    Non-ASCII names get an ASCII fallback plus an RFC 5987 filename* parameter.
+    """
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+-.^_`|~")
+        names = {"filename": simple, "filename*": f"UTF-8''{quoted}"}
+    else:
+        names = {"filename": download_name}
+    return dump_options_header('attachment', names)
+
+
+def immutable(response):
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+def revalidate(response):
+    """Private responses the browser may keep but must check with the ETag before reusing"""
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+class StaticAssets:
+    """Content fingerprints for files in a static folder.
+
+    url_for('static', filename='css/style.css') becomes css/style.<digest>.css, so
+    fingerprinted URLs can be cached forever; a deploy that changes the file
+    changes its URL.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def digest(self, filename):
+        """Content digest of a static file, or None if it doesn't exist"""
+        path = os.path.join(self.folder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self._digests.get(filename)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._digests[filename] = ((stat.st_mtime_ns, stat.st_size), digest)
+        return digest
+
+    def url_filename(self, filename):
+        digest = self.digest(filename)
+        if digest is None:
+            return filename
+        base, ext = os.path.splitext(filename)
+        return f"{base}.{digest}{ext}"
+
+    def resolve(self, filename):
+        """(file to serve, whether the request URL pins its current content)"""
+        match = _FINGERPRINTED.match(filename)
+        if match is None:
+            return filename, False
+        original = match['base'] + match['ext']
+        current = self.digest(original)
+        if current is None:
+            return filename, False
+        # An old fingerprint after a deploy still gets the file, just not cached for good
+        return original, current == match['digest']
+
+    def url_defaults(self, endpoint, values):
+        """url_defaults hook that fingerprints static URLs"""
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.url_filename(values['filename'])
+
+    def build_id(self, *folders):
+        """Digest of every file in the given folders and the static folder, for ETags of rendered pages"""
+        digest = hashlib.sha256()
+        for folder in (*folders, self.folder):
+            for root, dirs, files in os.walk(folder):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, folder).encode('utf-8'))
+                    with open(path, 'rb') as f:
+                        digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()[:12]
+
+
+def response_coding(response, accept_encodings):
+    """Content-coding to compress a response with, or None to send it as is"""
+    # Streamed bodies have no Content-Length and are left alone
+    if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers or getattr(response, 'direct_passthrough', False)
+            or (response.content_length or 0) < COMPRESS_MIN_BYTES):
+        return None
+    for coding in CONTENT_CODINGS:
+        if accept_encodings.quality(coding) > 0:
+            return coding
+    return None
+
+
+def compress(data, coding):
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+def set_compressed(response, data, coding):
+    """Swap in a compressed body; a strong ETag gets a per-coding suffix since the bytes differ"""
+    response.set_data(data)
+    response.headers['Content-Encoding'] = coding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{coding}")
+    return response
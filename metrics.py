@@ -0,0 +1,241 @@
+import threading
+import time
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+# Default latency buckets in seconds, as used by the Prometheus client libraries
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+BYTES_BUCKETS = tuple(2 ** power for power in range(12, 25))  # 4 KiB .. 16 MiB
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, in Prometheus' layout"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts plus an overflow slot for +Inf, then the sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def collect(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        lines = []
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _label_text(self.labelnames, labels, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """Metric whose samples are read from a callback at scrape time.
+
+    The callback returns a dict of label-value tuples to numbers. Used to expose
+    counters that other objects already keep, such as cache hit counts.
+    """
+
+    def __init__(self, name, documentation, labelnames, callback, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def collect(self):
+        return [
+            f"{self.name}{_label_text(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.callback().items())
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Request latency by Flask endpoint', ('endpoint', 'method')
+))
+REQUESTS = REGISTRY.register(Counter(
+    'http_requests_total', 'Requests by Flask endpoint and status code', ('endpoint', 'method', 'status')
+))
+REQUEST_QUERIES = REGISTRY.register(Histogram(
+    'http_request_mongo_queries', 'MongoDB commands issued per request', ('endpoint',), COUNT_BUCKETS
+))
+QUERY_LATENCY = REGISTRY.register(Histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency by the endpoint that issued it',
+    ('endpoint', 'command', 'collection'), QUERY_BUCKETS
+))
+QUERY_FAILURES = REGISTRY.register(Counter(
+    'mongo_command_failures_total', 'Failed MongoDB commands', ('endpoint', 'command')
+))
+PDF_RENDER_LATENCY = REGISTRY.register(Histogram(
+    'pdf_render_duration_seconds', 'Time to render a policy PDF', ('mode',)
+))
+PDF_RENDER_BYTES = REGISTRY.register(Histogram(
+    'pdf_render_bytes', 'Size of rendered policy PDFs', ('mode',), BYTES_BUCKETS
+))
+
+# Label for commands issued outside a request (CLI commands, background threads)
+NO_ENDPOINT = 'none'
+
+
+class RequestQueries(threading.local):
+    """The current thread's request: its endpoint label and the commands it has run"""
+
+    endpoint = NO_ENDPOINT
+    queries = None
+    pending = None
+
+    def start(self, endpoint):
+        self.endpoint = endpoint
+        self.queries = []
+        self.pending = {}
+
+    def finish(self):
+        queries = self.queries or []
+        self.endpoint = NO_ENDPOINT
+        self.queries = None
+        return queries
+
+
+current_request = RequestQueries()
+
+
+class QueryTracker(monitoring.CommandListener):
+    """Attributes every MongoDB command to the endpoint of the request that ran it.
+
+    pymongo calls listeners synchronously on the thread that issued the command, so
+    the thread-local current_request identifies the request.
+    """
+
+    def started(self, event):
+        if current_request.pending is None:
+            current_request.pending = {}
+        collection = event.command.get(event.command_name)
+        current_request.pending[event.request_id] = collection if isinstance(collection, str) else ''
+
+    def _finished(self, event, failed):
+        collection = (current_request.pending or {}).pop(event.request_id, '')
+        seconds = event.duration_micros / 1e6
+        endpoint = current_request.endpoint
+        QUERY_LATENCY.observe(seconds, endpoint, event.command_name, collection)
+        if failed:
+            QUERY_FAILURES.inc(endpoint, event.command_name)
+        if current_request.queries is not None:
+            current_request.queries.append((event.command_name, collection, seconds))
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+
+query_tracker = QueryTracker()
+
+
+def observe_pdf_render(mode, seconds, size):
+    PDF_RENDER_LATENCY.observe(seconds, mode)
+    PDF_RENDER_BYTES.observe(size, mode)
+
+
+class timed:
+    """Context manager that stores the elapsed wall time in .seconds"""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+
+
+def query_breakdown(queries):
+    """One-line summary of a request's commands, grouped by command and collection"""
+    grouped = {}
+    for command, collection, seconds in queries:
+        count, total = grouped.get((command, collection), (0, 0.0))
+        grouped[(command, collection)] = (count + 1, total + seconds)
+    return ', '.join(
+        f"{command} {collection or '-'} x{count} {total * 1000:.1f} ms"
+        for (command, collection), (count, total) in sorted(grouped.items(), key=lambda item: -item[1][1])
+    )
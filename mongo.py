@@ -0,0 +1,175 @@
+import os
+import threading
+
+from pymongo import IndexModel, MongoClient, monitoring
+
+from metrics import query_tracker
+from policy_search import (
+    POLICY_HOST_INDEX, POLICY_NAME_INDEX, POLICY_SEARCH_INDEX, POLICY_SEARCH_INDEX_OPTIONS, REPLACED_SEARCH_INDEXES
+)
+from policy_store import POLICY_LIST_INDEX
+from policy_versions import POLICY_VERSIONS_INDEX
+
+DB_NAME = os.environ.get("MONGO_DB_NAME", 'privacy_policy_generator')
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters for /healthz"""
+
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+        self.pools_cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def snapshot(self):
+        return {
+            "open_connections": self.created - self.closed,
+            "in_use": self.checked_out,
+            "created": self.created,
+            "closed": self.closed,
+            "checkout_failures": self.checkout_failures,
+            "pools_cleared": self.pools_cleared,
+        }
+
+
+pool_stats = PoolStats()
+
+
+# Environment variables mapped onto MongoClient options; unset ones fall back to
+# whatever MONGO_URI specifies, then to pymongo's defaults
+_ENV_OPTIONS = (
+    ("MONGO_MAX_POOL_SIZE", "maxPoolSize", int),
+    ("MONGO_MIN_POOL_SIZE", "minPoolSize", int),
+    ("MONGO_MAX_IDLE_TIME_MS", "maxIdleTimeMS", int),
+    ("MONGO_WAIT_QUEUE_TIMEOUT_MS", "waitQueueTimeoutMS", int),
+    ("MONGO_CONNECT_TIMEOUT_MS", "connectTimeoutMS", int),
+    ("MONGO_SOCKET_TIMEOUT_MS", "socketTimeoutMS", int),
+    ("MONGO_SERVER_SELECTION_TIMEOUT_MS", "serverSelectionTimeoutMS", int),
+    ("MONGO_READ_PREFERENCE", "readPreference", str),
+)
+
+
+def client_options():
+    """MongoClient keyword arguments from the environment"""
+    options = {"event_listeners": [pool_stats, query_tracker]}
+    for env_name, option, convert in _ENV_OPTIONS:
+        value = os.environ.get(env_name)
+        if value:
+            options[option] = convert(value)
+    return options
+
+
+def get_client():
+    """Return this process's MongoClient, creating it on first use.
+
+    Clients must not be shared across fork(), so a gunicorn worker that inherits a
+    client from the master builds its own the first time it touches the database.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = MongoClient(os.environ.get("MONGO_URI"), **client_options())
+                _client_pid = os.getpid()
+    return _client
+
+
+def get_db():
+    return get_client()[DB_NAME]
+
+
+class LazyCollection:
+    """Stand-in for a pymongo Collection that resolves against get_client() on each use"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+# Every index the app relies on, by collection. Signup only catches duplicate
+# accounts through the unique user indexes, q= search needs the text index, and
+# concurrent policy edits are rejected by the unique version index.
+INDEXES = {
+    'users': [IndexModel("username", unique=True), IndexModel("email", unique=True)],
+    'policies': [
+        IndexModel(POLICY_LIST_INDEX),
+        IndexModel(POLICY_SEARCH_INDEX, **POLICY_SEARCH_INDEX_OPTIONS),
+        IndexModel(POLICY_NAME_INDEX),
+        IndexModel(POLICY_HOST_INDEX),
+    ],
+    'policy_versions': [IndexModel(POLICY_VERSIONS_INDEX, unique=True)],
+}
+
+
+def ensure_indexes(db):
+    """Create every index the app relies on; run once per deploy via 'flask init-db'"""
+    existing = db['policies'].index_information()
+    for name in REPLACED_SEARCH_INDEXES:
+        if name in existing:
+            db['policies'].drop_index(name)
+    for collection, indexes in INDEXES.items():
+        db[collection].create_indexes(indexes)
+
+
+def missing_indexes(db):
+    """'collection.index' names from INDEXES that db lacks, or has without their unique constraint"""
+    missing = []
+    for collection, indexes in INDEXES.items():
+        existing = db[collection].index_information()
+        for index in indexes:
+            spec = index.document
+            found = existing.get(spec['name'])
+            if found is None or (spec.get('unique') and not found.get('unique')):
+                missing.append(f"{collection}.{spec['name']}")
+    return missing
+
+
+def check_indexes(db):
+    """Refuse to serve from a database 'flask init-db' hasn't been run against"""
+    missing = missing_indexes(db)
+    if missing:
+        raise RuntimeError(f"MongoDB indexes missing: {', '.join(missing)}; run 'flask init-db' before starting the app")
@@ -0,0 +1,61 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Werkzeug method string for new hashes, e.g. "pbkdf2:sha256:600000" or "scrypt:32768:8:1"
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "pbkdf2")
+
+
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already queued"""
+
+
+def normalize_method(method):
+    """Expand a werkzeug method string to the full prefix it writes into stored hashes"""
+    name, *params = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = params[0] if params else 'sha256'
+        iterations = params[1] if len(params) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    if name == 'scrypt':
+        n, r, p = (params + ['32768', '8', '1'][len(params):])[:3]
+        return f"scrypt:{n}:{r}:{p}"
+    return method
+
+
+class PasswordHasher:
+    """Runs the password KDF on a small bounded thread pool.
+
+    hashlib's pbkdf2 and scrypt release the GIL, so hashes run in parallel with page
+    serving, but never on more than `workers` cores. At most workers + queue_size
+    hashes are admitted at once; further callers wait up to admission_timeout seconds
+    for a slot and then get HashingBusy instead of piling up behind the pool.
+    """
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=2, queue_size=16, admission_timeout=1.0):
+        self.method = method
+        self.method_prefix = normalize_method(method)
+        self.admission_timeout = admission_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self.rejected = 0
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.admission_timeout):
+            self.rejected += 1
+            raise HashingBusy()
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        """Check a password and report whether the stored hash uses outdated parameters"""
+        ok = self._run(check_password_hash, stored_hash, password)
+        needs_rehash = ok and stored_hash.split('$', 1)[0] != self.method_prefix
+        return ok, needs_rehash
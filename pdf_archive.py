@@ -0,0 +1,149 @@
+import io
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import observe_pdf_render, timed
+from policy_pdf import pdf_cache_key, write_policy_pdf
+from policy_storage import CONTENT_PROJECTION
+
+# Fields write_policy_pdf reads, in whichever storage format; everything else stays in Mongo
+PDF_PROJECTION = {
+    **CONTENT_PROJECTION, "website_name": 1, "website_url": 1, "company_name": 1, "last_updated": 1,
+    "gdpr_compliant": 1, "ccpa_compliant": 1, "lgpd_compliant": 1,
+}
+
+_UNSAFE_FILENAME = re.compile(r'[^\w.\- ]+')
+
+
+def _render(policy):
+    """Runs in a pool process; the timing is observed by the web worker, as for PDF jobs"""
+    buffer = io.BytesIO()
+    with timed() as timer:
+        write_policy_pdf(policy, buffer)
+    return timer.seconds, buffer.getvalue()
+
+
+class _ZipStream:
+    """Write-only, non-seekable file that hands out whatever zipfile has written so far"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_name(policy, used):
+    """Unique, filesystem-safe name for a policy's PDF inside the archive"""
+    base = _UNSAFE_FILENAME.sub('_', policy['website_name']).strip() or 'policy'
+    name = f"{base}_Privacy_Policy.pdf"
+    count = used.get(name, 0) + 1
+    used[name] = count
+    return name if count == 1 else f"{base}_Privacy_Policy_{count}.pdf"
+
+
+class PDFArchiver:
+    """Streams a ZIP of policy PDFs, rendering them in parallel on a process pool.
+
+    At most `window` renders are in flight and each finished PDF is written to the
+    archive and yielded straight away, in completion order, so memory stays bounded
+    by the window no matter how many policies are exported. PDFs already in the
+    PDF cache are used as they are; misses are not added to it, so one large export
+    doesn't evict everyone else's cached downloads.
+    """
+
+    def __init__(self, pdf_cache=None, workers=2, window=None):
+        self.pdf_cache = pdf_cache
+        self.workers = workers
+        self.window = window or self.workers * 2
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                # Spawned rather than forked, like the PDF job pool
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _discard_pool(self, executor):
+        """Forget a pool that lost a process (OOM kill, segfault) so the next export starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def stream(self, policies):
+        """Yield the bytes of a ZIP archive holding one PDF per policy in `policies`"""
+        in_flight = {}
+        executor = self._pool()
+        try:
+            yield from self._stream(policies, in_flight, executor)
+        except BrokenProcessPool:
+            self._discard_pool(executor)
+            raise
+        finally:
+            # The client went away mid-download; don't render PDFs nobody will receive
+            for future in in_flight:
+                future.cancel()
+
+    def _stream(self, policies, in_flight, executor):
+        out = _ZipStream()
+        used_names = {}
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED) as archive:
+
+            def add(policy, data):
+                info = zipfile.ZipInfo(archive_name(policy, used_names), time.localtime()[:6])
+                archive.writestr(info, data)
+
+            def collect(block):
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED, timeout=None if block else 0)
+                for future in done:
+                    seconds, data = future.result()
+                    observe_pdf_render('archive', seconds, len(data))
+                    add(in_flight.pop(future), data)
+
+            for policy in policies:
+                cached = self.pdf_cache.get(pdf_cache_key(policy)) if self.pdf_cache else None
+                if cached is not None:
+                    add(policy, cached)
+                else:
+                    if len(in_flight) >= self.window:
+                        collect(block=True)
+                    in_flight[executor.submit(_render, policy)] = policy
+                    collect(block=False)
+                chunk = out.drain()
+                if chunk:
+                    yield chunk
+
+            while in_flight:
+                collect(block=True)
+                yield out.drain()
+        # Central directory
+        yield out.drain()
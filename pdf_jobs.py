@@ -0,0 +1,264 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from metrics import observe_pdf_render, timed
+from policy_pdf import pdf_cache_key, write_policy_pdf
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdf_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    policy_id TEXT NOT NULL,
+    cache_key TEXT NOT NULL,
+    download_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    path TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+"""
+
+# At most one live (not failed) job per user and PDF, so concurrent enqueues in
+# different workers share one render instead of racing to queue two
+_LIVE_INDEX = f"""
+DROP INDEX IF EXISTS pdf_jobs_dedup;
+UPDATE pdf_jobs SET status = '{FAILED}', error = 'Superseded'
+    WHERE status != '{FAILED}' AND rowid NOT IN (
+        SELECT MAX(rowid) FROM pdf_jobs WHERE status != '{FAILED}' GROUP BY user_id, cache_key
+    );
+CREATE UNIQUE INDEX IF NOT EXISTS pdf_jobs_live ON pdf_jobs (user_id, cache_key) WHERE status != '{FAILED}';
+"""
+
+
+def job_status(job, url_for):
+    """JSON body describing a job, with URLs built by the calling app's url_for"""
+    status = {
+        "job_id": job['id'],
+        "policy_id": job['policy_id'],
+        "status": job['status'],
+        "status_url": url_for('pdf_job_status', job_id=job['id'])
+    }
+    if job['status'] == DONE:
+        status['artifact_url'] = url_for('pdf_job_artifact', job_id=job['id'])
+    if job['error']:
+        status['error'] = job['error']
+    return status
+
+
+def _render_job(policy, path):
+    """Runs in a pool process: render the PDF next to its final path, then move it into place"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with timed() as timer:
+            with open(tmp_path, 'wb') as f:
+                write_policy_pdf(policy, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    # Metrics live in the web worker, so the timing is reported back with the result
+    return timer.seconds, os.path.getsize(path)
+
+
+class PDFJobQueue:
+    """Background PDF rendering on a process pool, tracked in a SQLite table.
+
+    SQLite stands in for a broker: every gunicorn worker sees the same job table and
+    artifact directory, so a client can poll any worker. The pool itself is created
+    lazily in the process that first enqueues, which keeps it fork-safe.
+
+    Jobs only live in the pool of the worker that queued them, so that worker
+    bumps heartbeat_at on its unfinished jobs every heartbeat_seconds. A job
+    whose heartbeat is older than stale_seconds lost its worker and is marked
+    failed, letting the next download queue a fresh render.
+    """
+
+    def __init__(self, db_path, artifact_dir, workers=2, ttl_seconds=3600, heartbeat_seconds=5, stale_seconds=30):
+        self.db_path = db_path
+        self.artifact_dir = artifact_dir
+        self.workers = workers
+        self.ttl_seconds = ttl_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._heartbeat = None
+        os.makedirs(artifact_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(pdf_jobs)")}
+            if 'heartbeat_at' not in columns:
+                # Tables created before heartbeats existed
+                conn.execute("ALTER TABLE pdf_jobs ADD COLUMN heartbeat_at REAL")
+            conn.executescript(_LIVE_INDEX)
+
+    @contextmanager
+    def _connect(self):
+        """A connection in a transaction, committed (or rolled back) and closed on exit"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                # Spawned rather than forked: the parent holds MongoClient threads and sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _discard_pool(self, executor):
+        """Forget a pool that lost a process (OOM kill, segfault) so the next job starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def enqueue(self, policy, user_id, download_name):
+        """Queue a render for a policy and return the job row; reuses a live job for the same PDF"""
+        self.purge_expired()
+        key = pdf_cache_key(policy)
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.artifact_dir, f"{job_id}.pdf")
+        now = time.time()
+        with self._connect() as conn:
+            self._fail_stale(conn)
+            existing = conn.execute(
+                "SELECT * FROM pdf_jobs WHERE user_id = ? AND cache_key = ? AND status != ?", (user_id, key, FAILED)
+            ).fetchone()
+            if existing and existing['status'] == DONE and not os.path.exists(existing['path']):
+                # The artifact is gone, so the job can't be served; let a new render replace it
+                conn.execute(
+                    "UPDATE pdf_jobs SET status = ?, error = ? WHERE id = ?", (FAILED, "Artifact missing", existing['id'])
+                )
+            elif existing:
+                return dict(existing)
+            # The partial unique index makes this a no-op when another worker queued the same PDF first
+            inserted = conn.execute(
+                "INSERT INTO pdf_jobs "
+                "(id, user_id, policy_id, cache_key, download_name, status, path, created_at, heartbeat_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                f"ON CONFLICT (user_id, cache_key) WHERE status != '{FAILED}' DO NOTHING",
+                (job_id, user_id, str(policy['_id']), key, download_name, QUEUED, path, now, now)
+            ).rowcount
+            if not inserted:
+                return dict(conn.execute(
+                    "SELECT * FROM pdf_jobs WHERE user_id = ? AND cache_key = ? AND status != ?", (user_id, key, FAILED)
+                ).fetchone())
+
+        self._track(job_id)
+        executor = self._pool()
+        try:
+            future = executor.submit(_render_job, policy, path)
+        except Exception as error:
+            # Left queued, the job would keep its heartbeat and block this PDF until the TTL purge
+            if isinstance(error, BrokenProcessPool):
+                self._discard_pool(executor)
+            self._untrack(job_id)
+            self._set_status(job_id, FAILED, error=str(error) or type(error).__name__)
+            return self.get(job_id)
+        self._set_status(job_id, RUNNING)
+        future.add_done_callback(lambda f: self._finish(job_id, f, executor))
+        return self.get(job_id)
+
+    def _track(self, job_id):
+        """Heartbeat this worker's job until it finishes"""
+        with self._lock:
+            self._in_flight.add(job_id)
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._beat, name='pdf-job-heartbeat', daemon=True)
+                self._heartbeat.start()
+
+    def _untrack(self, job_id):
+        with self._lock:
+            self._in_flight.discard(job_id)
+
+    def _beat(self):
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._lock:
+                job_ids = list(self._in_flight)
+                if not job_ids:
+                    self._heartbeat = None
+                    return
+            with self._connect() as conn:
+                conn.executemany(
+                    "UPDATE pdf_jobs SET heartbeat_at = ? WHERE id = ? AND status IN (?, ?)",
+                    [(time.time(), job_id, QUEUED, RUNNING) for job_id in job_ids]
+                )
+
+    def _fail_stale(self, conn):
+        """Fail unfinished jobs whose worker stopped heartbeating, e.g. because it was killed"""
+        conn.execute(
+            "UPDATE pdf_jobs SET status = ?, error = ?, finished_at = ? "
+            "WHERE status IN (?, ?) AND COALESCE(heartbeat_at, created_at) < ?",
+            (FAILED, "Worker stopped before the render finished", time.time(), QUEUED, RUNNING,
+             time.time() - self.stale_seconds)
+        )
+
+    def _set_status(self, job_id, status, error=None):
+        finished_at = time.time() if status in (DONE, FAILED) else None
+        with self._connect() as conn:
+            # Never move a finished job back to running if the render beat us to it
+            conn.execute(
+                "UPDATE pdf_jobs SET status = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND status NOT IN (?, ?)",
+                (status, error, finished_at, job_id, DONE, FAILED)
+            )
+
+    def _finish(self, job_id, future, executor):
+        self._untrack(job_id)
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            self._discard_pool(executor)
+        if error is None:
+            observe_pdf_render('job', *future.result())
+            self._set_status(job_id, DONE)
+        else:
+            self._set_status(job_id, FAILED, error=str(error) or type(error).__name__)
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            self._fail_stale(conn)
+            row = conn.execute("SELECT * FROM pdf_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def purge_expired(self):
+        """Drop jobs (and their artifacts) older than the TTL"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._connect() as conn:
+            expired = conn.execute(
+                "SELECT id, path FROM pdf_jobs WHERE COALESCE(finished_at, created_at) < ?", (cutoff,)
+            ).fetchall()
+            for row in expired:
+                if row['path'] and os.path.exists(row['path']):
+                    os.remove(row['path'])
+            conn.executemany("DELETE FROM pdf_jobs WHERE id = ?", [(row['id'],) for row in expired])
+        return len(expired)
+
+
+def default_job_dir():
+    return os.path.join(tempfile.gettempdir(), 'privacy_policy_pdf_jobs')
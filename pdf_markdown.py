@@ -0,0 +1,155 @@
+import hashlib
+import re
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from caching import LRUCache
+
+# Bullet nesting levels with their own indentation
+BULLET_LEVELS = 6
+
+
+@lru_cache(maxsize=None)
+def pdf_styles():
+    """Stylesheet for policy PDFs, built on first use.
+
+    reportlab is imported here and in the render functions rather than at module
+    level, so workers that never render a PDF never load it (see app.warm_up).
+    """
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    base = getSampleStyleSheet()
+    styles = {
+        'title': ParagraphStyle('Title', parent=base['Title'], fontSize=18, spaceAfter=12),
+        'normal': ParagraphStyle('Normal', parent=base['Normal'], fontSize=10, spaceBefore=6),
+        'h1': ParagraphStyle('Heading1', parent=base['Heading1'], fontSize=16, spaceBefore=12, spaceAfter=6),
+        'h2': ParagraphStyle('Heading2', parent=base['Heading2'], fontSize=14, spaceBefore=10, spaceAfter=4),
+        'h3': ParagraphStyle('Heading3', parent=base['Heading3'], fontSize=12, spaceBefore=8, spaceAfter=4),
+    }
+    # One bullet style per nesting level
+    styles['bullets'] = [
+        ParagraphStyle(
+            f'Bullet{level}', parent=styles['normal'],
+            leftIndent=12 + 18 * level, bulletIndent=18 * level, spaceBefore=3
+        )
+        for level in range(BULLET_LEVELS)
+    ]
+    return styles
+
+
+# Markers available in the standard Helvetica encoding
+_BULLET_CHARS = ('•', '–', '·')
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*$')
+_LIST_ITEM = re.compile(r'^(\s*)(?:[-*+]|(\d+)[.)])\s+(.*)$')
+_INLINE = (
+    (re.compile(r'`([^`]+)`'), r'<font face="Courier">\1</font>'),
+    (re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1'), r'<b>\2</b>'),
+    (re.compile(r'(?<![*\w])([*_])(?=\S)(.+?)(?<=\S)\1(?![*\w])'), r'<i>\2</i>'),
+)
+
+# Parsed specs keyed by a hash of the markdown source
+spec_cache = LRUCache(max_entries=1024)
+
+
+def inline_markup(text):
+    """Escape text for reportlab's paragraph markup and convert bold, italics and code spans"""
+    markup = escape(text)
+    for pattern, replacement in _INLINE:
+        markup = pattern.sub(replacement, markup)
+    return markup
+
+
+def _indent_width(whitespace):
+    return len(whitespace.replace('\t', '    '))
+
+
+def parse_markdown(text):
+    """Tokenize policy markdown into a list of plain-tuple flowable specs.
+
+    Specs are ('heading', level, markup), ('paragraph', markup),
+    ('bullet', depth, marker, markup) and ('spacer',); they are picklable and cheap
+    to cache, and specs_to_flowables turns them into reportlab flowables.
+    """
+    specs = []
+    paragraph = []
+    list_indents = []
+
+    def flush_paragraph():
+        if paragraph:
+            specs.append(('paragraph', inline_markup(' '.join(paragraph))))
+            paragraph.clear()
+
+    previous_blank = True
+    for raw_line in text.split('\n'):
+        line = raw_line.rstrip()
+        if not line.strip():
+            flush_paragraph()
+            # A small spacer keeps paragraph breaks, as the original layout did
+            if not previous_blank:
+                specs.append(('spacer',))
+            previous_blank = True
+            continue
+
+        heading = _HEADING.match(line.strip())
+        item = _LIST_ITEM.match(line)
+        if heading:
+            flush_paragraph()
+            list_indents.clear()
+            level = min(len(heading.group(1)), 3)
+            specs.append(('heading', level, inline_markup(heading.group(2))))
+        elif item:
+            flush_paragraph()
+            indent = _indent_width(item.group(1))
+            while list_indents and indent < list_indents[-1]:
+                list_indents.pop()
+            if not list_indents or indent > list_indents[-1]:
+                list_indents.append(indent)
+            depth = min(len(list_indents) - 1, BULLET_LEVELS - 1)
+            marker = f"{item.group(2)}." if item.group(2) else _BULLET_CHARS[depth % len(_BULLET_CHARS)]
+            specs.append(('bullet', depth, marker, inline_markup(item.group(3))))
+        elif list_indents and raw_line[:1].isspace() and specs and specs[-1][0] == 'bullet':
+            # Continuation line of the previous list item
+            kind, depth, marker, markup = specs[-1]
+            specs[-1] = (kind, depth, marker, f"{markup} {inline_markup(line.strip())}")
+        else:
+            list_indents.clear()
+            paragraph.append(line.strip())
+        previous_blank = False
+
+    flush_paragraph()
+    return specs
+
+
+def flowable_specs(text):
+    """parse_markdown, cached by content hash"""
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    specs = spec_cache.get(key)
+    if specs is None:
+        specs = parse_markdown(text)
+        spec_cache.set(key, specs)
+    return specs
+
+
+def specs_to_flowables(specs):
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer
+
+    styles = pdf_styles()
+    flowables = []
+    for spec in specs:
+        kind = spec[0]
+        if kind == 'heading':
+            flowables.append(Paragraph(spec[2], styles[f'h{spec[1]}']))
+        elif kind == 'paragraph':
+            flowables.append(Paragraph(spec[1], styles['normal']))
+        elif kind == 'bullet':
+            _, depth, marker, markup = spec
+            flowables.append(Paragraph(markup, styles['bullets'][depth], bulletText=marker))
+        elif kind == 'spacer':
+            flowables.append(Spacer(1, 0.1 * inch))
+    return flowables
+
+
+def markdown_to_flowables(text):
+    return specs_to_flowables(flowable_specs(text))
@@ -0,0 +1,144 @@
+"""Policy text shared between policies generated from the same inputs.
+
+generate_privacy_policy output depends only on the generation inputs, the
+content date and the clause templates, so an agency creating the same site for
+several accounts, or a retried form post, produces byte-identical text. With
+POLICY_DEDUP=1 that text is stored once in the policy_blobs collection under a
+hash of those inputs, and each policy document holds only `blob_key`:
+
+    {_id: key, content, content_html, section_lengths, inputs, content_date,
+     refs, created_at}
+
+The text fields use the POLICY_STORAGE format like a policy's own. `refs`
+counts the policies referencing the blob, which is deleted when the last one
+lets go. Loaders call attach_blob() or attach_blobs() before unpack_policy().
+Rendered HTML is cached on the blob, and PDFs are cached under the blob key (see
+policy_pdf.pdf_cache_key), so identical policies share both. dedup_policies.py
+moves existing policies into blobs and reports the savings.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from policy_storage import TEXT_FIELDS, pack_policy
+from policy_templates import TEMPLATE_VERSION
+
+POLICY_DEDUP = os.environ.get("POLICY_DEDUP", "").lower() in ("1", "true", "yes")
+
+# Fields a blob contributes to the policies that reference it; a policy with a blob_key has none of its own
+BLOB_TEXT_FIELDS = ('content_format', *(field for pair in TEXT_FIELDS for field in pair))
+BLOB_TEXT_PROJECTION = dict.fromkeys(BLOB_TEXT_FIELDS, 1)
+
+
+class MissingBlob(Exception):
+    """Raised when a policy references a blob that doesn't exist"""
+
+
+def blob_key(inputs, content_date):
+    """Content address of the text generated from these inputs on this date with the current templates"""
+    payload = json.dumps([TEMPLATE_VERSION, content_date, inputs], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def blob_document(key, text):
+    """New blob for `text` (content and section_lengths, optionally content_html, inputs and content_date)"""
+    blob = pack_policy(text)
+    blob.update(_id=key, refs=1, created_at=datetime.utcnow())
+    return blob
+
+
+def acquire_blob(blobs, key, make_text):
+    """Add a reference to blob `key`, storing make_text() as the blob if it doesn't exist yet.
+
+    The text is only generated when no policy shares it, so a duplicate create
+    costs one small update. Returns the blob's section_lengths.
+    """
+    text = None
+    while True:
+        blob = blobs.find_one_and_update(
+            {"_id": key}, {"$inc": {"refs": 1}}, {"section_lengths": 1}, return_document=ReturnDocument.AFTER
+        )
+        if blob is not None:
+            return blob['section_lengths']
+        if text is None:
+            text = make_text()
+        try:
+            blobs.insert_one(blob_document(key, text))
+            return text['section_lengths']
+        except DuplicateKeyError:
+            # Another request stored the same text first; reference theirs
+            continue
+
+
+def acquire_blobs(blobs, texts):
+    """Batch form of acquire_blob for {key: (references, text)}: one upserting bulk_write"""
+    if texts:
+        blobs.bulk_write([
+            UpdateOne(
+                {"_id": key},
+                {"$inc": {"refs": refs}, "$setOnInsert": {
+                    field: value for field, value in blob_document(key, text).items() if field not in ("_id", "refs")
+                }},
+                upsert=True
+            )
+            for key, (refs, text) in texts.items()
+        ], ordered=False)
+
+
+def release_blob(blobs, key, count=1):
+    """Drop references to a blob and delete it once nothing references it"""
+    blob = blobs.find_one_and_update(
+        {"_id": key}, {"$inc": {"refs": -count}}, {"refs": 1}, return_document=ReturnDocument.AFTER
+    )
+    if blob is not None and blob['refs'] <= 0:
+        # Conditional, so a policy that took a reference in the meantime keeps the blob
+        blobs.delete_one({"_id": key, "refs": {"$lte": 0}})
+
+
+def _merge(policy, blob):
+    if blob is None:
+        raise MissingBlob(f"Policy {policy.get('_id')} references missing blob {policy['blob_key']}")
+    for field in BLOB_TEXT_FIELDS:
+        if field in blob:
+            policy[field] = blob[field]
+        else:
+            policy.pop(field, None)
+    return policy
+
+
+def attach_blob(blobs, policy):
+    """Copy the shared text onto a policy that references a blob; other policies are returned as they are"""
+    if 'blob_key' in policy:
+        _merge(policy, blobs.find_one({"_id": policy['blob_key']}, BLOB_TEXT_PROJECTION))
+    return policy
+
+
+async def attach_blob_async(blobs, policy):
+    """attach_blob for an async (Motor) collection"""
+    if 'blob_key' in policy:
+        _merge(policy, await blobs.find_one({"_id": policy['blob_key']}, BLOB_TEXT_PROJECTION))
+    return policy
+
+
+def attach_blobs(blobs, policies, batch_size=100):
+    """attach_blob over an iterable of policies, fetching the blobs of each batch with one query"""
+    batch = []
+    for policy in policies:
+        batch.append(policy)
+        if len(batch) >= batch_size:
+            yield from _attach_batch(blobs, batch)
+            batch = []
+    yield from _attach_batch(blobs, batch)
+
+
+def _attach_batch(blobs, batch):
+    keys = list({policy['blob_key'] for policy in batch if 'blob_key' in policy})
+    found = {blob['_id']: blob for blob in blobs.find({"_id": {"$in": keys}}, BLOB_TEXT_PROJECTION)} if keys else {}
+    for policy in batch:
+        if 'blob_key' in policy:
+            _merge(policy, found.get(policy['blob_key']))
+        yield policy
@@ -0,0 +1,35 @@
+import hashlib
+import threading
+
+from caching import LRUCache
+
+# Rendered HTML keyed by a hash of the markdown source
+html_cache = LRUCache(max_entries=512, max_bytes=32 * 1024 * 1024)
+
+# markdown.Markdown instances are not thread-safe, so each thread keeps its own
+_local = threading.local()
+
+
+def _converter():
+    md = getattr(_local, 'md', None)
+    if md is None:
+        # Imported on first use so workers that only serve stored HTML never load markdown
+        import markdown
+        md = _local.md = markdown.Markdown()
+    return md
+
+
+def preload():
+    """Import markdown now instead of on the first render"""
+    import markdown
+
+
+def render_policy_html(text):
+    """Convert policy markdown to HTML, reusing one parser per thread and caching by content hash"""
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    html = html_cache.get(key)
+    if html is None:
+        md = _converter()
+        html = md.reset().convert(text)
+        html_cache.set(key, html, size=len(html))
+    return html
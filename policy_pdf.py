@@ -0,0 +1,252 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+from xml.sax.saxutils import escape
+
+from caching import LRUCache
+from metrics import observe_pdf_render, timed
+from pdf_markdown import markdown_to_flowables, pdf_styles
+
+
+# Bump when the PDF layout changes so cached PDFs from older layouts are not served
+PDF_LAYOUT_VERSION = 2
+
+# Characters a header value can't carry, dropped from download names
+_CONTROL_CHARS = re.compile(r'[\x00-\x1f\x7f]')
+
+
+def pdf_download_name(policy):
+    """File name a policy's PDF is downloaded as"""
+    return _CONTROL_CHARS.sub('', f"{policy['website_name']}_Privacy_Policy.pdf")
+
+
+def pdf_cache_key(policy):
+    """Hash of everything that ends up in the rendered PDF.
+
+    Policies sharing a blob (see policy_blobs) are keyed by it and by the date as
+    printed, so identical policies created on the same day share one PDF.
+    """
+    digest = hashlib.sha256(f"layout-{PDF_LAYOUT_VERSION}\x00".encode('utf-8'))
+    shared = 'blob_key' in policy
+    for value in (
+        f"blob:{policy['blob_key']}" if shared else policy['content'],
+        policy['website_name'],
+        policy['website_url'],
+        policy['company_name'],
+        policy['last_updated'].strftime('%B %d, %Y') if shared else policy['last_updated'].isoformat(),
+        policy['gdpr_compliant'],
+        policy['ccpa_compliant'],
+        policy['lgpd_compliant'],
+    ):
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def preload():
+    """Import reportlab and build the PDF styles now instead of on the first render"""
+    import reportlab.platypus
+    pdf_styles()
+
+
+def _add_border(canvas, doc):
+    from reportlab.lib import colors
+
+    canvas.saveState()
+    canvas.setStrokeColor(colors.black)
+    canvas.setLineWidth(2)
+    canvas.rect(
+        doc.leftMargin - 10,
+        doc.bottomMargin - 10,
+        doc.width + 20,
+        doc.height + 20,
+        stroke=1,
+        fill=0
+    )
+    canvas.restoreState()
+
+
+def write_policy_pdf(policy, fileobj):
+    """Render a stored policy document as PDF into a binary file object"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    # Create a SimpleDocTemplate with 2px border
+    doc = SimpleDocTemplate(
+        fileobj,
+        pagesize=letter,
+        leftMargin=inch,
+        rightMargin=inch,
+        topMargin=inch,
+        bottomMargin=inch
+    )
+
+    # Prepare document elements
+    elements = []
+
+    # Add main title
+    elements.append(Paragraph(f"{escape(policy['website_name'])} Privacy Policy", pdf_styles()['title']))
+    elements.append(Spacer(1, 0.2 * inch))
+
+    # Add metadata
+    info_data = [
+        ["Website:", policy['website_url']],
+        ["Company:", policy['company_name']],
+        ["Last Updated:", policy['last_updated'].strftime('%B %d, %Y')]
+    ]
+
+    # Add compliance badges
+    compliance = []
+    if policy['gdpr_compliant']:
+        compliance.append("GDPR Compliant")
+    if policy['ccpa_compliant']:
+        compliance.append("CCPA Compliant")
+    if policy['lgpd_compliant']:
+        compliance.append("LGPD Compliant")
+
+    if compliance:
+        info_data.append(["Compliance:", ", ".join(compliance)])
+
+    # Create table with metadata
+    info_table = Table(info_data, colWidths=[2*inch, 4*inch])
+    info_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ]))
+
+    elements.append(info_table)
+    elements.append(Spacer(1, 0.3 * inch))
+
+    # Policy body: headings, paragraphs with inline bold/italics and nested lists
+    elements.extend(markdown_to_flowables(policy['content']))
+
+    # Build the PDF with a border
+    doc.build(elements, onFirstPage=_add_border, onLaterPages=_add_border)
+
+
+def build_policy_pdf(policy):
+    """Render a stored policy document to PDF bytes"""
+    buffer = io.BytesIO()
+    with timed() as timer:
+        write_policy_pdf(policy, buffer)
+    data = buffer.getvalue()
+    observe_pdf_render('sync', timer.seconds, len(data))
+    return data
+
+
+def spool_policy_pdf(policy, spool_threshold):
+    """Render a policy into a temp file that stays in memory only up to spool_threshold bytes.
+
+    Returns the file rewound to the start and its size.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+    with timed() as timer:
+        write_policy_pdf(policy, spool)
+    size = spool.tell()
+    observe_pdf_render('sync', timer.seconds, size)
+    spool.seek(0)
+    return spool, size
+
+
+class PDFCache:
+    """Two-tier cache of rendered PDFs: bounded in-memory LRU plus optional disk directory.
+
+    Only PDFs up to max_item_bytes are held in memory; larger ones are spooled to a
+    temp file while rendering and then served from disk, so a big multi-regulation
+    policy never sits whole in a worker's memory. reportlab keeps every flowable of a
+    document in memory while building it, so at most max_concurrent_renders PDFs are
+    rendered at once and further downloads wait for a slot.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 max_item_bytes=1024 * 1024, spool_threshold=256 * 1024, max_concurrent_renders=4):
+        self.memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.disk_dir = disk_dir
+        self.max_item_bytes = max_item_bytes
+        self.spool_threshold = spool_threshold
+        self.render_slots = threading.BoundedSemaphore(max_concurrent_renders)
+        self.disk_hits = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pdf")
+
+    def _write_disk(self, key, fileobj):
+        # Write to a temp file first so readers never see a partial PDF
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(tmp_path, self._disk_path(key))
+
+    def get(self, key):
+        data = self.memory.get(key)
+        if data is not None or not self.disk_dir:
+            return data
+        try:
+            if os.path.getsize(self._disk_path(key)) > self.max_item_bytes:
+                return None
+            with open(self._disk_path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self.disk_hits += 1
+        self.memory.set(key, data, size=len(data))
+        return data
+
+    def set(self, key, data):
+        if len(data) <= self.max_item_bytes:
+            self.memory.set(key, data, size=len(data))
+        if self.disk_dir:
+            self._write_disk(key, io.BytesIO(data))
+
+    def get_or_build(self, policy):
+        key = pdf_cache_key(policy)
+        data = self.get(key)
+        if data is None:
+            with self.render_slots:
+                data = build_policy_pdf(policy)
+            self.set(key, data)
+        return key, data
+
+    def open(self, policy):
+        """Return (key, readable binary file, size) for a policy's PDF, rendering it on a miss"""
+        key = pdf_cache_key(policy)
+        data = self.memory.get(key)
+        if data is not None:
+            return key, io.BytesIO(data), len(data)
+
+        if self.disk_dir:
+            try:
+                fileobj = open(self._disk_path(key), 'rb')
+            except FileNotFoundError:
+                pass
+            else:
+                self.disk_hits += 1
+                return key, fileobj, os.fstat(fileobj.fileno()).st_size
+
+        with self.render_slots:
+            spool, size = spool_policy_pdf(policy, self.spool_threshold)
+        if size <= self.max_item_bytes:
+            data = spool.read()
+            spool.close()
+            self.set(key, data)
+            return key, io.BytesIO(data), size
+        if self.disk_dir:
+            self._write_disk(key, spool)
+            spool.close()
+            return key, open(self._disk_path(key), 'rb'), size
+        return key, spool, size
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        return stats
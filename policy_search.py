@@ -0,0 +1,184 @@
+"""Search over a user's policies: full-text terms, site name/URL prefixes and compliance flags.
+
+Terms are matched by a MongoDB text index over the site name, company, URL and
+clause_terms, scoped to one user by its user_id prefix key. clause_terms holds
+the words of the clauses a policy includes (see policy_templates.clause_terms)
+and is stored on every policy, so clause search works whatever the
+POLICY_STORAGE format and with POLICY_DEDUP. Prefixes are range scans of
+lowercased name_key/host_key fields stored on every policy. Results are ranked
+and paged with keyset cursors on (score, _id); searches with only flags have
+nothing to rank and page through list_policies on (created_at, _id).
+"""
+import base64
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import DESCENDING, UpdateOne
+
+from policy_store import (
+    POLICY_LIST_PROJECTION, host_key, list_policies, list_policies_async, name_key, search_keys
+)
+
+POLICY_SEARCH_INDEX = [
+    ("user_id", 1),
+    ("website_name", "text"), ("company_name", "text"), ("website_url", "text"), ("clause_terms", "text")
+]
+POLICY_SEARCH_INDEX_OPTIONS = {
+    "name": "policy_clause_search",
+    "weights": {"website_name": 10, "company_name": 5, "website_url": 5, "clause_terms": 1},
+    "default_language": "english",
+}
+# Earlier text indexes on policies, dropped by ensure_indexes (a collection holds one text index)
+REPLACED_SEARCH_INDEXES = ("policy_search",)
+POLICY_NAME_INDEX = [("user_id", 1), ("name_key", 1)]
+POLICY_HOST_INDEX = [("user_id", 1), ("host_key", 1)]
+
+# Query-string names of the flag filters and the fields they match
+FLAG_FILTERS = {"gdpr": "gdpr_compliant", "ccpa": "ccpa_compliant", "lgpd": "lgpd_compliant"}
+_TRUE = frozenset({"1", "true", "yes", "on"})
+_FALSE = frozenset({"0", "false", "no", "off"})
+
+# Prefix matches on the site name rank above matches on the URL alone
+EXACT_NAME_SCORE = 3.0
+NAME_PREFIX_SCORE = 2.0
+HOST_PREFIX_SCORE = 1.0
+
+SEARCH_PROJECTION = {**POLICY_LIST_PROJECTION, "score": 1}
+
+
+def backfill_search_keys(collection, batch_size=1000):
+    """Add search keys to policies stored before search or clause_terms existed; returns how many were updated"""
+    updated = 0
+    batch = []
+    missing = {"$or": [{"name_key": {"$exists": False}}, {"clause_terms": {"$exists": False}}]}
+    projection = {"website_name": 1, "website_url": 1, "inputs": 1, **dict.fromkeys(FLAG_FILTERS.values(), 1)}
+    for policy in collection.find(missing, projection):
+        # Policies stored before inputs were kept only know their compliance flags
+        batch.append(UpdateOne({"_id": policy['_id']}, {"$set": search_keys(policy.get('inputs') or policy)}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+
+def flag_filters(args):
+    """{field: bool} from gdpr/ccpa/lgpd query arguments; raises ValueError on anything but a boolean"""
+    flags = {}
+    for name, field in FLAG_FILTERS.items():
+        value = (args.get(name) or "").strip().lower()
+        if value in _TRUE:
+            flags[field] = True
+        elif value in _FALSE:
+            flags[field] = False
+        elif value:
+            raise ValueError(f"{name} must be true or false")
+    return flags
+
+
+def encode_cursor(policy):
+    """Opaque keyset cursor pointing just past the given search result"""
+    raw = f"{float(policy['score']).hex()}|{policy['_id']}"
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        score, policy_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+        return float.fromhex(score), ObjectId(policy_id)
+    except (ValueError, InvalidId, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _prefix_range(prefix):
+    """Bounds matching every string that starts with prefix, so the index scan is exactly the matches"""
+    last = ord(prefix[-1])
+    if last == 0x10FFFF:
+        return {"$gte": prefix}
+    return {"$gte": prefix, "$lt": prefix[:-1] + chr(last + 1)}
+
+
+def _in_range(field, bounds):
+    """Aggregation expression form of a _prefix_range query"""
+    return {"$and": [{op: [field, value]} for op, value in bounds.items()]}
+
+
+def search_pipeline(user_id, terms=None, prefix=None, flags=None, cursor=None, limit=20):
+    """Aggregation pipeline returning one ranked page of matches, plus one row to detect a next page.
+
+    With terms, results are ranked by text score; with only a prefix, an exact
+    name beats a name prefix, which beats a URL prefix. Otherwise every match
+    scores 0 and results come newest first, though search_policies pages those
+    through list_policies instead, which needs no in-memory sort.
+    """
+    match = {"user_id": user_id}
+    terms = (terms or "").strip()
+    if terms:
+        match["$text"] = {"$search": terms}
+    score = {"$meta": "textScore"} if terms else 0.0
+
+    name = name_key(prefix)
+    host = host_key(prefix)
+    if name or host:
+        clauses = []
+        if name:
+            clauses.append({"name_key": _prefix_range(name)})
+        if host:
+            clauses.append({"host_key": _prefix_range(host)})
+        match["$or"] = clauses
+        if not terms:
+            score = HOST_PREFIX_SCORE
+            if name:
+                score = {"$switch": {"branches": [
+                    {"case": {"$eq": ["$name_key", name]}, "then": EXACT_NAME_SCORE},
+                    {"case": _in_range("$name_key", _prefix_range(name)), "then": NAME_PREFIX_SCORE},
+                ], "default": HOST_PREFIX_SCORE}}
+    match.update(flags or {})
+
+    pipeline = [{"$match": match}, {"$addFields": {"score": score}}]
+    if cursor:
+        last_score, last_id = decode_cursor(cursor)
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": last_score}},
+            {"score": last_score, "_id": {"$lt": last_id}}
+        ]}})
+    pipeline += [
+        {"$sort": {"score": DESCENDING, "_id": DESCENDING}},
+        {"$limit": limit + 1},
+        {"$project": SEARCH_PROJECTION},
+    ]
+    return pipeline
+
+
+def _ranked(terms, prefix):
+    return bool((terms or "").strip() or name_key(prefix) or host_key(prefix))
+
+
+def _unranked(policies, next_cursor):
+    # Same shape as ranked results, where nothing to rank on scores 0
+    for policy in policies:
+        policy['score'] = 0.0
+    return policies, next_cursor
+
+
+def search_policies(collection, user_id, terms=None, prefix=None, flags=None, cursor=None, limit=20):
+    """Return one page of a user's matching policies, best first, and the cursor for the next page"""
+    if not _ranked(terms, prefix):
+        return _unranked(*list_policies(collection, user_id, cursor, limit, flags))
+    policies = list(collection.aggregate(search_pipeline(user_id, terms, prefix, flags, cursor, limit)))
+    return _page(policies, limit)
+
+
+async def search_policies_async(collection, user_id, terms=None, prefix=None, flags=None, cursor=None, limit=20):
+    """search_policies for an async (Motor) collection"""
+    if not _ranked(terms, prefix):
+        return _unranked(*await list_policies_async(collection, user_id, cursor, limit, flags))
+    pipeline = search_pipeline(user_id, terms, prefix, flags, cursor, limit)
+    policies = await collection.aggregate(pipeline).to_list(limit + 1)
+    return _page(policies, limit)
+
+
+def _page(policies, limit):
+    next_cursor = encode_cursor(policies[limit - 1]) if len(policies) > limit else None
+    return policies[:limit], next_cursor
@@ -0,0 +1,195 @@
+"""How a policy's text is kept in its MongoDB document.
+
+POLICY_STORAGE picks the format used when a policy is created or edited:
+
+    plain   `content` (markdown) and `content_html` as strings; the default
+    zlib    both compressed with zlib against a preset dictionary of clause text
+    zstd    the same dictionary with zstandard (pip install zstandard)
+    inputs  only the generation inputs and date; the text is re-rendered on read
+
+Each document records its format in `content_format` (absent means plain), so
+documents in every format can be read whatever POLICY_STORAGE is set to.
+unpack_policy() puts `content` and `content_html` back after a policy is loaded;
+compress_policies.py converts existing documents and reports their sizes.
+"""
+import os
+import zlib
+from functools import lru_cache
+
+from bson.binary import Binary
+
+from policy_templates import POLICY_FLAGS, TEMPLATE_VERSION, inputs_mask, inputs_values, render_policy
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PLAIN = 'plain'
+INPUTS = 'inputs'
+COMPRESSED_FORMATS = ('zlib', 'zstd')
+STORAGE_FORMATS = (PLAIN, *COMPRESSED_FORMATS, INPUTS)
+
+POLICY_STORAGE = os.environ.get("POLICY_STORAGE", PLAIN)
+if POLICY_STORAGE not in STORAGE_FORMATS:
+    raise ValueError(f"POLICY_STORAGE must be one of {', '.join(STORAGE_FORMATS)}")
+if POLICY_STORAGE == 'zstd' and zstandard is None:
+    raise ValueError("POLICY_STORAGE=zstd needs the zstandard package")
+
+# Dictionaries are frozen once written: compressed documents name the version they
+# were written with. Build a new one with compress_policies.py --build-dictionary
+# and bump this to use it for new writes.
+DICTIONARY_VERSION = 1
+DICTIONARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'storage_dicts')
+
+# Text fields and where their compressed form is kept
+TEXT_FIELDS = (('content', 'content_z'), ('content_html', 'content_html_z'))
+
+# Every field that can hold a policy's markdown; project these to unpack `content`
+CONTENT_PROJECTION = {
+    "content": 1, "content_z": 1, "content_format": 1, "inputs": 1, "content_date": 1, "blob_key": 1
+}
+
+_ZSTD_LEVEL = 9
+
+
+class TemplateVersionMismatch(Exception):
+    """Raised when a policy stored as inputs was written for clause text that has since changed"""
+
+
+def dictionary_path(version):
+    return os.path.join(DICTIONARY_DIR, f"clauses-{version}.dict")
+
+
+@lru_cache(maxsize=None)
+def _dictionary(version):
+    with open(dictionary_path(version), 'rb') as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def _zstd_dictionary(version):
+    # The same raw clause text serves as a zstd content dictionary; precomputing its
+    # tables keeps per-policy compressors cheap to create
+    dictionary = zstandard.ZstdCompressionDict(_dictionary(version), dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    dictionary.precompute_compress(level=_ZSTD_LEVEL)
+    return dictionary
+
+
+def build_dictionary():
+    """Preset dictionary for the current templates: every clause, as markdown and HTML.
+
+    zlib only looks back 32 KiB, so the text most policies contain goes last.
+    """
+    from policy_html import render_policy_html
+    values = inputs_values(
+        {"website_name": "", "website_url": "https://www.", "company_name": "", "contact_email": "privacy@"}, ""
+    )
+    all_flags = (1 << len(POLICY_FLAGS)) - 1
+    samples = (
+        render_policy_html(render_policy(0, values)),
+        render_policy(0, values),
+        render_policy_html(render_policy(all_flags, values)),
+        render_policy(all_flags, values),
+    )
+    data = '\n'.join(samples).encode('utf-8')
+    return data[-32 * 1024:]
+
+
+def _compress(fmt, version, text):
+    data = text.encode('utf-8')
+    if fmt == 'zstd':
+        return Binary(zstandard.ZstdCompressor(level=_ZSTD_LEVEL, dict_data=_zstd_dictionary(version)).compress(data))
+    compressor = zlib.compressobj(9, zdict=_dictionary(version))
+    return Binary(compressor.compress(data) + compressor.flush())
+
+
+def _decompress(fmt, version, data):
+    if fmt == 'zstd':
+        if zstandard is None:
+            raise ValueError("Reading zstd-compressed policies needs the zstandard package")
+        data = zstandard.ZstdDecompressor(dict_data=_zstd_dictionary(version)).decompress(data)
+    else:
+        decompressor = zlib.decompressobj(zdict=_dictionary(version))
+        data = decompressor.decompress(data) + decompressor.flush()
+    return data.decode('utf-8')
+
+
+def stored_format(policy):
+    """(format, dictionary or template version) of a stored policy"""
+    fmt, _, version = policy.get('content_format', PLAIN).partition(':')
+    return fmt, int(version) if version else None
+
+
+def _rendered_content(policy):
+    return render_policy(inputs_mask(policy['inputs']), inputs_values(policy['inputs'], policy['content_date']))
+
+
+def rerenders(fields):
+    """Whether `content` is exactly what the current templates render from the stored inputs and date"""
+    # Older policies have no inputs, and their text may predate the current templates
+    return bool(fields.get('inputs')) and 'content_date' in fields and _rendered_content(fields) == fields['content']
+
+
+def _pack(fields, storage):
+    """Fields to write for `fields` in the `storage` format, and stale fields to remove"""
+    packed = dict(fields)
+    html_given = 'content_html' in fields
+    if storage == INPUTS:
+        if rerenders(fields):
+            packed.pop('content')
+            packed.pop('content_html', None)
+            packed['content_format'] = f"{INPUTS}:{TEMPLATE_VERSION}"
+            return packed, ('content', 'content_html', 'content_z', 'content_html_z')
+        storage = 'zlib'
+
+    if storage == PLAIN:
+        # New content without new HTML leaves the HTML to be re-rendered on the next view
+        return packed, ('content_format', 'content_z', 'content_html_z') + (() if html_given else ('content_html',))
+
+    for field, compressed_field in TEXT_FIELDS:
+        if field in packed:
+            packed[compressed_field] = _compress(storage, DICTIONARY_VERSION, packed.pop(field))
+    packed['content_format'] = f"{storage}:{DICTIONARY_VERSION}"
+    return packed, ('content', 'content_html') + (() if html_given else ('content_html_z',))
+
+
+def pack_policy(policy, storage=None):
+    """Copy of a new policy document with its text in the `storage` format (default POLICY_STORAGE)"""
+    return _pack(policy, storage or POLICY_STORAGE)[0]
+
+
+def storage_update(fields, storage=None):
+    """update_one document setting `fields`, including new `content`, in the `storage` format"""
+    to_set, to_unset = _pack(fields, storage or POLICY_STORAGE)
+    update = {"$set": to_set}
+    if to_unset:
+        update["$unset"] = dict.fromkeys(to_unset, "")
+    return update
+
+
+def html_update(policy, html):
+    """$set fields caching rendered HTML on a stored policy, or None if its format re-renders it"""
+    fmt, version = stored_format(policy)
+    if fmt == INPUTS:
+        return None
+    if fmt in COMPRESSED_FORMATS:
+        return {"content_html_z": _compress(fmt, version, html)}
+    return {"content_html": html}
+
+
+def unpack_policy(policy):
+    """Fill in `content` (and `content_html` where it is kept) on a policy loaded in any format"""
+    fmt, version = stored_format(policy)
+    if fmt in COMPRESSED_FORMATS:
+        for field, compressed_field in TEXT_FIELDS:
+            if compressed_field in policy:
+                policy[field] = _decompress(fmt, version, policy.pop(compressed_field))
+    elif fmt == INPUTS and 'inputs' in policy:
+        if version != TEMPLATE_VERSION:
+            raise TemplateVersionMismatch(
+                f"Policy {policy.get('_id')} was stored for template version {version}, "
+                f"not {TEMPLATE_VERSION}"
+            )
+        policy['content'] = _rendered_content(policy)
+    return policy
@@ -0,0 +1,283 @@
+import base64
+import json
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError
+
+from policy_templates import (
+    POLICY_FLAGS, SECTION_KEYS, clause_terms, inputs_mask, inputs_values, policy_date, render_sections
+)
+from policy_blobs import acquire_blob, acquire_blobs, blob_key, release_blob
+from policy_storage import pack_policy
+from user_stats import record_new_policies
+
+# Fields rendered on the policy listing cards; the markdown content is only needed on the detail page
+POLICY_LIST_PROJECTION = {
+    "website_name": 1, "website_url": 1, "company_name": 1, "created_at": 1, "last_updated": 1,
+    "gdpr_compliant": 1, "ccpa_compliant": 1, "lgpd_compliant": 1
+}
+
+# Backs the per-user listing and its keyset pagination
+POLICY_LIST_INDEX = [("user_id", 1), ("created_at", DESCENDING), ("_id", DESCENDING)]
+
+# Text inputs every policy needs, in generate_privacy_policy argument order
+POLICY_TEXT_FIELDS = ('website_name', 'website_url', 'company_name', 'contact_email')
+
+
+def policy_inputs(data, checkboxes=False):
+    """Pull generation inputs out of a form or JSON mapping.
+
+    HTML checkboxes arrive as 'on' when ticked; JSON descriptors use real booleans.
+    """
+    inputs = {field: data.get(field) for field in POLICY_TEXT_FIELDS}
+    for flag in POLICY_FLAGS:
+        value = data.get(flag)
+        inputs[flag] = value == 'on' if checkboxes else bool(value)
+    return inputs
+
+
+def missing_fields(inputs):
+    return [field for field in POLICY_TEXT_FIELDS if not inputs.get(field)]
+
+
+def name_key(name):
+    return " ".join((name or "").casefold().split())
+
+
+def host_key(url):
+    """Lowercased host and path of a URL without its scheme or a leading www."""
+    url = (url or "").strip().lower()
+    parts = urlsplit(url if "://" in url else "//" + url)
+    key = parts.netloc + parts.path
+    return key[4:] if key.startswith("www.") else key
+
+
+def search_keys(inputs):
+    """Lowercased site name and URL for prefix search, and clause words for term search (see policy_search)"""
+    return {
+        "name_key": name_key(inputs['website_name']),
+        "host_key": host_key(inputs['website_url']).rstrip('/'),
+        "clause_terms": clause_terms(inputs_mask(inputs)),
+    }
+
+
+def policy_text(inputs, content_date):
+    """Generated markdown for the inputs and the length of each of its sections"""
+    sections = render_sections(inputs_mask(inputs), inputs_values(inputs, content_date))
+    return {
+        "content": ''.join(sections[key] for key in SECTION_KEYS),
+        "section_lengths": [len(sections[key]) for key in SECTION_KEYS],
+    }
+
+
+def new_policy_document(user_id, inputs, content_date=None, text=None):
+    """Build the document stored in policies_collection, generating its text unless `text` is given.
+
+    The generation inputs and per-section lengths are kept so edits can re-render
+    individual sections (see policy_versions.edit_policy). `text` is the output
+    of policy_text, or a blob_key and section_lengths for shared text.
+    """
+    if content_date is None:
+        content_date = policy_date()
+    if text is None:
+        text = policy_text(inputs, content_date)
+    now = datetime.utcnow()
+    return {
+        "user_id": user_id,
+        "website_name": inputs['website_name'],
+        "website_url": inputs['website_url'],
+        "company_name": inputs['company_name'],
+        **text,
+        "created_at": now,
+        "last_updated": now,
+        "gdpr_compliant": inputs['gdpr_compliant'],
+        "ccpa_compliant": inputs['ccpa_compliant'],
+        "lgpd_compliant": inputs['lgpd_compliant'],
+        "inputs": inputs,
+        "content_date": content_date,
+        "version": 1,
+        **search_keys(inputs)
+    }
+
+
+def new_shared_policy_document(blobs, user_id, inputs, render_html=None):
+    """new_policy_document whose text is kept in a blob shared by identical policies (see policy_blobs).
+
+    The text, and its HTML with render_html, is only generated when no blob holds it yet.
+    """
+    content_date = policy_date()
+    key = blob_key(inputs, content_date)
+
+    def make_text():
+        text = {**policy_text(inputs, content_date), "inputs": inputs, "content_date": content_date}
+        if render_html:
+            text["content_html"] = render_html(text["content"])
+        return text
+
+    section_lengths = acquire_blob(blobs, key, make_text)
+    return new_policy_document(user_id, inputs, content_date, {"blob_key": key, "section_lengths": section_lengths})
+
+
+def ndjson_descriptors(lines):
+    """Parse NDJSON lines, yielding None for a malformed one so the rest still go through"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Keep the item's position so errors can be matched to input lines
+            yield None
+
+
+def _batch_shared_document(user_id, inputs, texts):
+    """A policy referencing shared text, counted in `texts` ({key: [references, text]}) for acquire_blobs"""
+    content_date = policy_date()
+    key = blob_key(inputs, content_date)
+    if key in texts:
+        texts[key][0] += 1
+    else:
+        texts[key] = [1, {**policy_text(inputs, content_date), "inputs": inputs, "content_date": content_date}]
+    text = {"blob_key": key, "section_lengths": texts[key][1]["section_lengths"]}
+    return new_policy_document(user_id, inputs, content_date, text)
+
+
+def _flush(collection, batch, results, blobs=None, texts=None):
+    """Insert one batch unordered, record an id or error for every item and return the stored documents"""
+    if texts:
+        # Blobs first, so no stored policy ever references a missing one
+        acquire_blobs(blobs, texts)
+        texts.clear()
+    failed = {}
+    try:
+        collection.insert_many([doc for _, doc in batch], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get('writeErrors', []):
+            failed[error['index']] = error.get('errmsg', 'Write failed')
+    inserted = []
+    for position, (index, doc) in enumerate(batch):
+        if position in failed:
+            results.append({"index": index, "error": failed[position]})
+            if 'blob_key' in doc:
+                release_blob(blobs, doc['blob_key'])
+        else:
+            results.append({"index": index, "id": str(doc['_id'])})
+            inserted.append(doc)
+    batch.clear()
+    return inserted
+
+
+def _record(stats_collection, user_id, inserted):
+    if stats_collection is not None:
+        record_new_policies(stats_collection, user_id, inserted)
+
+
+def bulk_create_policies(collection, user_id, descriptors, batch_size=500, stats_collection=None, blobs=None):
+    """Generate and store policies for an iterable of site descriptors.
+
+    Descriptors are consumed lazily, so NDJSON streams never have to be held in
+    memory; documents are written with unordered insert_many batches of batch_size.
+    When stats_collection is given, the user's counters are bumped once per batch.
+    With blobs, identical texts are stored once there and referenced (see policy_blobs).
+    """
+    started = time.perf_counter()
+    results = []
+    batch = []
+    texts = {}
+    for index, descriptor in enumerate(descriptors):
+        if descriptor is None:
+            results.append({"index": index, "error": "Invalid JSON"})
+            continue
+        if not isinstance(descriptor, dict):
+            results.append({"index": index, "error": "Descriptor must be a JSON object"})
+            continue
+        inputs = policy_inputs(descriptor)
+        missing = missing_fields(inputs)
+        if missing:
+            results.append({"index": index, "error": f"Missing fields: {', '.join(missing)}"})
+            continue
+        if blobs is None:
+            batch.append((index, pack_policy(new_policy_document(user_id, inputs))))
+        else:
+            batch.append((index, _batch_shared_document(user_id, inputs, texts)))
+        if len(batch) >= batch_size:
+            _record(stats_collection, user_id, _flush(collection, batch, results, blobs, texts))
+    if batch:
+        _record(stats_collection, user_id, _flush(collection, batch, results, blobs, texts))
+
+    elapsed = time.perf_counter() - started
+    results.sort(key=lambda item: item["index"])
+    inserted = sum(1 for item in results if "id" in item)
+    return {
+        "results": results,
+        "inserted": inserted,
+        "failed": len(results) - inserted,
+        "elapsed_seconds": round(elapsed, 4),
+        "policies_per_second": round(inserted / elapsed, 1) if elapsed else None
+    }
+
+
+def encode_cursor(policy):
+    """Opaque keyset cursor pointing just past the given policy"""
+    raw = f"{policy['created_at'].isoformat()}|{policy['_id']}"
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, policy_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+        return datetime.fromisoformat(created_at), ObjectId(policy_id)
+    except (ValueError, InvalidId, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def list_policies(collection, user_id, cursor=None, limit=20, filters=None):
+    """Return one page of a user's policies, newest first, and the cursor for the next page.
+
+    Pages are keyed on (created_at, _id) rather than skip/offset so every page is a
+    bounded walk of POLICY_LIST_INDEX no matter how many policies the user has.
+    `filters` are extra equality conditions, such as compliance flags.
+    """
+    policies = list(_page_cursor(collection, user_id, cursor, limit, filters))
+    return _page(policies, limit)
+
+
+async def list_policies_async(collection, user_id, cursor=None, limit=20, filters=None):
+    """list_policies for an async (Motor) collection"""
+    policies = await _page_cursor(collection, user_id, cursor, limit, filters).to_list(limit + 1)
+    return _page(policies, limit)
+
+
+def _page_cursor(collection, user_id, cursor, limit, filters=None):
+    # One extra row tells us whether there is a next page
+    query = {**(filters or {}), "user_id": user_id}
+    if cursor:
+        created_at, policy_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": policy_id}}
+        ]
+    return (
+        collection.find(query, POLICY_LIST_PROJECTION)
+        .sort([("created_at", DESCENDING), ("_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+
+
+def policy_list_item(policy):
+    """JSON-ready form of a policy from list_policies"""
+    policy['id'] = str(policy.pop('_id'))
+    policy['created_at'] = policy['created_at'].isoformat()
+    policy['last_updated'] = policy['last_updated'].isoformat()
+    return policy
+
+
+def _page(policies, limit):
+    next_cursor = encode_cursor(policies[limit - 1]) if len(policies) > limit else None
+    return policies[:limit], next_cursor
@@ -0,0 +1,303 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+from string import Formatter
+
+# Order of the boolean options in the flag bitmask (bit 0 is gdpr_compliant)
+POLICY_FLAGS = (
+    'gdpr_compliant', 'ccpa_compliant', 'lgpd_compliant',
+    'collects_personal_info', 'collects_cookies', 'collects_location',
+    'shares_data', 'uses_analytics', 'social_login', 'has_newsletter',
+    'user_accounts', 'processes_payments',
+)
+
+# Fields substituted into the clause text
+POLICY_FIELDS = ('website_name', 'website_url', 'company_name', 'contact_email', 'last_updated')
+
+# Bump whenever clause text changes. Policies stored as inputs only (see policy_storage)
+# are re-rendered from these templates, so migrate them to another format first.
+TEMPLATE_VERSION = 1
+
+# Section registry: (key, flag that enables it, text when enabled, text when disabled).
+# Sections are emitted in this order; a flag of None means the section is always present.
+SECTIONS = (
+    ('introduction', None, """# Privacy Policy for {website_name}
+
+## Last Updated: {last_updated}
+
+### Introduction
+
+Welcome to {website_name}. This Privacy Policy explains how {company_name} ("we", "us", or "our") collects, uses, and discloses your information when you use our website {website_url} (the "Service").
+
+We respect your privacy and are committed to protecting your personal data. Please read this Privacy Policy carefully to understand how we handle your information.
+
+### Information We Collect
+
+""", ''),
+    ('personal_info', 'collects_personal_info', """We may collect personal information that you provide directly to us, such as:
+- Name
+- Email address
+- Phone number
+- Billing and shipping address
+- Payment information
+- Any other information you choose to provide
+
+""", """We do not collect personally identifiable information unless you voluntarily provide it to us.
+
+"""),
+    ('cookies', 'collects_cookies', """### Cookies and Tracking Technologies
+
+We use cookies and similar tracking technologies to track activity on our Service and hold certain information. Cookies are files with a small amount of data which may include an anonymous unique identifier.
+
+You can instruct your browser to refuse all cookies or to indicate when a cookie is being sent. However, if you do not accept cookies, you may not be able to use some portions of our Service.
+
+""", ''),
+    ('location', 'collects_location', """### Location Data
+
+We may collect information about your location, such as through GPS, IP address, or other location-based technologies, to provide location-specific services or improve your experience.
+
+""", ''),
+    ('analytics', 'uses_analytics', """### Analytics
+
+We may use third-party Service Providers to monitor and analyze the use of our Service, such as:
+- Google Analytics
+- Facebook Pixel
+- Other analytics services
+
+""", ''),
+    ('social_login', 'social_login', """### Social Media Login
+
+We may offer login services through third-party social media platforms (e.g., Facebook, Google). When you use these services, we may collect information from your social media profile as permitted by your settings on those platforms.
+
+""", ''),
+    ('newsletter', 'has_newsletter', """### Email Newsletters
+
+If you subscribe to our newsletter, we may collect your email address and other relevant information to send you marketing communications. You may unsubscribe from these communications at any time.
+
+""", ''),
+    ('user_accounts', 'user_accounts', """### User Accounts
+
+If you create an account with us, we collect information necessary to maintain your account, such as your username, password (encrypted), and any profile information you choose to provide.
+
+""", ''),
+    ('payments', 'processes_payments', """### Payment Processing
+
+We may collect payment information (e.g., credit card details) when you make purchases through our Service. This information is processed securely through third-party payment processors.
+
+""", ''),
+    ('sharing', 'shares_data', """### Sharing Your Information
+
+We may share your personal information with:
+- Service providers who perform services on our behalf
+- Business partners with whom we jointly offer products or services
+- As required by law or to comply with legal process
+- To protect and defend our rights and property
+
+""", ''),
+    ('gdpr', 'gdpr_compliant', """### GDPR Compliance
+
+For users in the European Union (EU) and European Economic Area (EEA), we process your data in accordance with the General Data Protection Regulation (GDPR). You have the following rights:
+- Right to access your personal data
+- Right to rectification if your data is inaccurate or incomplete
+- Right to erasure (right to be forgotten)
+- Right to restrict processing
+- Right to data portability
+- Right to object to processing
+- Rights in relation to automated decision making and profiling
+
+To exercise these rights, please contact us at {contact_email}.
+
+""", ''),
+    ('ccpa', 'ccpa_compliant', """### CCPA Compliance
+
+For California residents, the California Consumer Privacy Act (CCPA) provides you with specific rights regarding your personal information. You have the right to:
+- Know what personal information is being collected about you
+- Know whether your personal information is sold or disclosed and to whom
+- Opt out of the sale of your personal information
+- Access your personal information
+- Request deletion of your personal information
+- Not be discriminated against for exercising your CCPA rights
+
+To exercise these rights, please contact us at {contact_email}.
+
+""", ''),
+    ('lgpd', 'lgpd_compliant', """### LGPD Compliance
+
+For users in Brazil, we process your data in accordance with the Lei Geral de Proteção de Dados (LGPD). You have rights similar to those under GDPR, including:
+- Confirmation of the existence of data processing
+- Access to your personal data
+- Correction of incomplete, inaccurate, or outdated data
+- Anonymization, blocking, or deletion of unnecessary or non-compliant data
+- Data portability
+- Information about sharing of your data
+
+To exercise these rights, please contact us at {contact_email}.
+
+""", ''),
+    ('contact', None, """### Contact Us
+
+If you have any questions about this Privacy Policy, please contact us at:
+- Email: {contact_email}
+- Website: {website_url}
+- Company: {company_name}
+
+""", ''),
+)
+
+SECTION_KEYS = tuple(key for key, _, _, _ in SECTIONS)
+
+_FLAG_BITS = {name: 1 << bit for bit, name in enumerate(POLICY_FLAGS)}
+_FIELD_INDEX = {name: index for index, name in enumerate(POLICY_FIELDS)}
+
+
+def _split(text):
+    """Pre-split a clause into alternating static text and field names"""
+    parts = []
+    for literal, field, _, _ in Formatter().parse(text):
+        if literal:
+            parts.append((False, literal))
+        if field is not None:
+            parts.append((True, field))
+    return tuple(parts)
+
+
+# Clause text is split once at import time: key -> (flag bit, parts when on, parts when off)
+_COMPILED_SECTIONS = tuple(
+    (key, _FLAG_BITS[flag] if flag else 0, _split(on_text), _split(off_text))
+    for key, flag, on_text, off_text in SECTIONS
+)
+
+
+def policy_flags_mask(**flags):
+    """Pack the boolean policy options into a bitmask"""
+    mask = 0
+    for name, value in flags.items():
+        if value:
+            mask |= _FLAG_BITS[name]
+    return mask
+
+
+def _section_parts(bit, on_parts, off_parts, mask):
+    return on_parts if not bit or mask & bit else off_parts
+
+
+@lru_cache(maxsize=1 << len(POLICY_FLAGS))
+def policy_skeleton(mask):
+    """Flag-dependent skeleton: a list of static strings plus the (index, field) slots to fill"""
+    pieces = []
+    slots = []
+    for _, bit, on_parts, off_parts in _COMPILED_SECTIONS:
+        for is_field, value in _section_parts(bit, on_parts, off_parts, mask):
+            if is_field:
+                slots.append((len(pieces), _FIELD_INDEX[value]))
+                pieces.append(None)
+            elif pieces and pieces[-1] is not None:
+                # Merge adjacent static text across section boundaries
+                pieces[-1] += value
+            else:
+                pieces.append(value)
+    return tuple(pieces), tuple(slots)
+
+
+_WORD = re.compile(r'[a-z]{3,}')
+
+
+@lru_cache(maxsize=1 << len(POLICY_FLAGS))
+def clause_terms(mask):
+    """Distinct words of the clause text a policy with these flags contains, fields left out.
+
+    Stored on every policy for full-text search, since its content may be packed
+    or shared (see policy_storage and policy_blobs).
+    """
+    words = {}
+    for piece in policy_skeleton(mask)[0]:
+        if piece:
+            words.update(dict.fromkeys(_WORD.findall(piece.lower())))
+    return ' '.join(words)
+
+
+def _field_values(website_name, website_url, company_name, contact_email, last_updated):
+    return (
+        f"{website_name}", f"{website_url}", f"{company_name}", f"{contact_email}", last_updated
+    )
+
+
+@lru_cache(maxsize=8)
+def _format_date(day):
+    return day.strftime('%B %d, %Y')
+
+
+def render_policy(mask, values):
+    """Assemble a policy for a flag bitmask and a tuple of POLICY_FIELDS values with a single join"""
+    pieces, slots = policy_skeleton(mask)
+    out = list(pieces)
+    for index, field in slots:
+        out[index] = values[field]
+    return ''.join(out)
+
+
+def _render_parts(parts, values):
+    return ''.join(values[_FIELD_INDEX[value]] if is_field else value for is_field, value in parts)
+
+
+def render_sections(mask, values):
+    """Render each registered section separately, keyed by section name"""
+    return {
+        key: _render_parts(_section_parts(bit, on_parts, off_parts, mask), values)
+        for key, bit, on_parts, off_parts in _COMPILED_SECTIONS
+    }
+
+
+def render_changed_sections(old_mask, old_values, new_mask, new_values):
+    """Re-render only the sections whose flag or substituted fields differ between two inputs"""
+    changed = {}
+    for key, bit, on_parts, off_parts in _COMPILED_SECTIONS:
+        old_parts = _section_parts(bit, on_parts, off_parts, old_mask)
+        new_parts = _section_parts(bit, on_parts, off_parts, new_mask)
+        if old_parts is new_parts and all(
+            old_values[_FIELD_INDEX[value]] == new_values[_FIELD_INDEX[value]]
+            for is_field, value in new_parts if is_field
+        ):
+            continue
+        changed[key] = _render_parts(new_parts, new_values)
+    return changed
+
+
+def inputs_mask(inputs):
+    """Flag bitmask for a dict of generation inputs"""
+    return policy_flags_mask(**{flag: inputs.get(flag) for flag in POLICY_FLAGS})
+
+
+def inputs_values(inputs, content_date):
+    """POLICY_FIELDS values for a dict of generation inputs and the date printed in the policy"""
+    return _field_values(
+        inputs['website_name'], inputs['website_url'], inputs['company_name'], inputs['contact_email'],
+        content_date
+    )
+
+
+def policy_date(day=None):
+    """The 'Last Updated' date as printed in a policy"""
+    return _format_date(day or datetime.now().date())
+
+
+def generate_privacy_policy(website_name, website_url, company_name, contact_email,
+                          gdpr_compliant, ccpa_compliant, lgpd_compliant,
+                          collects_personal_info, collects_cookies, collects_location,
+                          shares_data, uses_analytics, social_login, has_newsletter,
+                          user_accounts, processes_payments):
+    """Generate a privacy policy based on provided information"""
+    mask = 0
+    for bit, value in enumerate((
+        gdpr_compliant, ccpa_compliant, lgpd_compliant,
+        collects_personal_info, collects_cookies, collects_location,
+        shares_data, uses_analytics, social_login, has_newsletter,
+        user_accounts, processes_payments
+    )):
+        if value:
+            mask |= 1 << bit
+    values = _field_values(
+        website_name, website_url, company_name, contact_email,
+        _format_date(datetime.now().date())
+    )
+    return render_policy(mask, values)
@@ -0,0 +1,164 @@
+from datetime import datetime
+
+from policy_blobs import BLOB_TEXT_FIELDS, acquire_blob, blob_key, release_blob
+from policy_storage import rerenders, storage_update
+from policy_store import search_keys
+from policy_templates import (
+    SECTION_KEYS, inputs_mask, inputs_values, policy_date,
+    render_changed_sections, render_sections
+)
+
+# Metadata copied into each version record so older versions can be shown as they were
+_VERSIONED_FIELDS = (
+    'website_name', 'website_url', 'company_name', 'last_updated', 'content_date', 'inputs',
+    'gdpr_compliant', 'ccpa_compliant', 'lgpd_compliant'
+)
+
+# Backs version lookups and rejects two concurrent edits of the same version
+POLICY_VERSIONS_INDEX = [("policy_id", 1), ("version", -1)]
+
+
+class EditConflict(Exception):
+    """Raised when a policy changed between loading it and saving an edit"""
+
+
+def section_lengths(sections):
+    return [len(sections[key]) for key in SECTION_KEYS]
+
+
+def split_sections(policy):
+    """Slice a stored policy's content back into its sections using section_lengths"""
+    sections = {}
+    offset = 0
+    for key, length in zip(SECTION_KEYS, policy['section_lengths']):
+        sections[key] = policy['content'][offset:offset + length]
+        offset += length
+    return sections
+
+
+def _shared_update(blobs, update):
+    """Move the edited text into the blob for the new inputs; returns the write and the acquired key"""
+    key = blob_key(update['inputs'], update['content_date'])
+    text = {field: update[field] for field in ('content', 'content_html', 'section_lengths', 'inputs', 'content_date')
+            if field in update}
+    acquire_blob(blobs, key, lambda: text)
+    fields = {field: value for field, value in update.items() if field not in ('content', 'content_html')}
+    return {"$set": {**fields, "blob_key": key}, "$unset": dict.fromkeys(BLOB_TEXT_FIELDS, "")}, key
+
+
+def edit_policy(policies_collection, versions_collection, policy, new_inputs, render_html=None,
+                blobs=None, dedup=False):
+    """Apply new generation inputs to a stored policy.
+
+    Only sections whose flag or substituted fields changed are re-rendered. The
+    previous version is kept as a reverse delta holding just the old text of those
+    sections, so storage grows with the size of each edit rather than the policy.
+    `policy` must be unpacked (see policy_storage); with render_html, the HTML is
+    stored in the same write. With dedup, text the templates render as-is moves
+    to the shared blob for the new inputs; a policy leaving a blob releases it, so
+    blobs is needed whenever the policy may have a blob_key. Returns the fields
+    that were updated, or None when the inputs are unchanged; a form resubmitted
+    on a later day would otherwise save a version differing only in its date.
+    """
+    if policy.get('inputs') == new_inputs:
+        return None
+
+    now = datetime.utcnow()
+    content_date = policy_date()
+    new_mask = inputs_mask(new_inputs)
+    new_values = inputs_values(new_inputs, content_date)
+
+    if 'section_lengths' in policy and policy.get('inputs'):
+        old_sections = split_sections(policy)
+        old_values = inputs_values(policy['inputs'], policy['content_date'])
+        rendered = render_changed_sections(inputs_mask(policy['inputs']), old_values, new_mask, new_values)
+        changed = {key: text for key, text in rendered.items() if text != old_sections[key]}
+        sections = {**old_sections, **changed}
+        delta = {"sections": {key: old_sections[key] for key in changed}}
+    else:
+        # Policies stored before section tracking keep their old content as one snapshot
+        sections = render_sections(new_mask, new_values)
+        delta = {"content": policy['content']}
+
+    version = policy.get('version', 1)
+    record = {field: policy.get(field) for field in _VERSIONED_FIELDS}
+    record.update(delta, policy_id=policy['_id'], version=version, replaced_at=now)
+    # The unique (policy_id, version) index turns a concurrent edit into a DuplicateKeyError
+    versions_collection.insert_one(record)
+
+    update = {
+        "content": ''.join(sections[key] for key in SECTION_KEYS),
+        "section_lengths": section_lengths(sections),
+        "inputs": new_inputs,
+        "content_date": content_date,
+        "last_updated": now,
+        "website_name": new_inputs['website_name'],
+        "website_url": new_inputs['website_url'],
+        "company_name": new_inputs['company_name'],
+        "gdpr_compliant": new_inputs['gdpr_compliant'],
+        "ccpa_compliant": new_inputs['ccpa_compliant'],
+        "lgpd_compliant": new_inputs['lgpd_compliant'],
+        "version": version + 1,
+        **search_keys(new_inputs)
+    }
+    if render_html:
+        update["content_html"] = render_html(update["content"])
+    acquired = None
+    if dedup and blobs is not None and rerenders(update):
+        write, acquired = _shared_update(blobs, update)
+    else:
+        write = storage_update(update)
+        if 'blob_key' in policy:
+            write.setdefault("$unset", {})["blob_key"] = ""
+    result = policies_collection.update_one({"_id": policy['_id'], "version": policy.get('version')}, write)
+    if not result.matched_count:
+        versions_collection.delete_one({"_id": record['_id']})
+        if acquired:
+            release_blob(blobs, acquired)
+        raise EditConflict()
+    if 'blob_key' in policy:
+        release_blob(blobs, policy['blob_key'])
+    return update
+
+
+def list_versions(policy, versions_collection):
+    """Version numbers and timestamps, newest first"""
+    versions = [{"version": policy.get('version', 1), "last_updated": policy['last_updated'], "current": True}]
+    for record in versions_collection.find(
+        {"policy_id": policy['_id']}, {"version": 1, "last_updated": 1}
+    ).sort("version", -1):
+        versions.append({"version": record['version'], "last_updated": record['last_updated'], "current": False})
+    return versions
+
+
+def policy_version(policy, versions_collection, version):
+    """Rebuild a past version of a policy as a policy-shaped document, or None if it doesn't exist"""
+    current = policy.get('version', 1)
+    if version == current:
+        return policy
+    if not 1 <= version < current:
+        return None
+
+    sections = split_sections(policy)
+    content = None
+    record = None
+    # Walk the reverse deltas from the newest back to the requested version
+    for record in versions_collection.find(
+        {"policy_id": policy['_id'], "version": {"$gte": version}}
+    ).sort("version", -1):
+        if 'content' in record:
+            content = record['content']
+        else:
+            sections.update(record['sections'])
+    if record is None or record['version'] != version:
+        return None
+
+    rebuilt = {field: record.get(field) for field in _VERSIONED_FIELDS}
+    rebuilt.update(
+        _id=policy['_id'],
+        user_id=policy['user_id'],
+        version=version,
+        content=content if content is not None else ''.join(sections[key] for key in SECTION_KEYS)
+    )
+    return rebuilt
+
@@ -0,0 +1,108 @@
+# Per-user counters kept in the user_stats collection, keyed by the session user id string.
+# Every write bumps `version`, so a rebuild can tell whether a counter moved under it.
+from pymongo.errors import DuplicateKeyError
+
+STATS_PROJECTION = {
+    "policy_count": 1, "gdpr_count": 1, "ccpa_count": 1, "lgpd_count": 1, "last_created_at": 1
+}
+
+EMPTY_STATS = {"policy_count": 0, "gdpr_count": 0, "ccpa_count": 0, "lgpd_count": 0, "last_created_at": None}
+
+
+def _increments(policies):
+    inc = {"policy_count": 0, "gdpr_count": 0, "ccpa_count": 0, "lgpd_count": 0}
+    last_created_at = None
+    for policy in policies:
+        inc["policy_count"] += 1
+        inc["gdpr_count"] += bool(policy.get("gdpr_compliant"))
+        inc["ccpa_count"] += bool(policy.get("ccpa_compliant"))
+        inc["lgpd_count"] += bool(policy.get("lgpd_compliant"))
+        if last_created_at is None or policy["created_at"] > last_created_at:
+            last_created_at = policy["created_at"]
+    return inc, last_created_at
+
+
+def record_new_policies(stats_collection, user_id, policies):
+    """Atomically add newly stored policies to a user's counters.
+
+    Users without a counter document yet are left alone: their older policies
+    aren't counted anywhere, so the dashboard builds the document from the
+    policies on its first visit instead.
+    """
+    inc, last_created_at = _increments(policies)
+    if not inc["policy_count"]:
+        return
+    stats_collection.update_one(
+        {"_id": user_id},
+        {"$inc": {**inc, "version": 1}, "$max": {"last_created_at": last_created_at}}
+    )
+
+
+def record_flag_changes(stats_collection, user_id, old_policy, new_policy):
+    """Adjust the compliance counters after a policy's flags were edited"""
+    inc = {}
+    for flag in ('gdpr', 'ccpa', 'lgpd'):
+        diff = int(bool(new_policy.get(f"{flag}_compliant"))) - int(bool(old_policy.get(f"{flag}_compliant")))
+        if diff:
+            inc[f"{flag}_count"] = diff
+    if inc:
+        stats_collection.update_one({"_id": user_id}, {"$inc": {**inc, "version": 1}})
+
+
+def _count_pipeline(match):
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": "$user_id",
+            "policy_count": {"$sum": 1},
+            "gdpr_count": {"$sum": {"$cond": ["$gdpr_compliant", 1, 0]}},
+            "ccpa_count": {"$sum": {"$cond": ["$ccpa_compliant", 1, 0]}},
+            "lgpd_count": {"$sum": {"$cond": ["$lgpd_compliant", 1, 0]}},
+            "last_created_at": {"$max": "$created_at"}
+        }}
+    ]
+
+
+def _write_counts(stats_collection, user_id, counts, version):
+    """$set a user's counters unless the document changed since `version` was read"""
+    try:
+        result = stats_collection.update_one(
+            {"_id": user_id, "version": version},
+            {"$set": {**counts, "version": (version or 0) + 1}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The document exists at another version: an $inc landed after the read
+        return False
+    return bool(result.matched_count or result.upserted_id is not None)
+
+
+def rebuild_stats(policies_collection, stats_collection, user_id=None, attempts=5):
+    """Recompute counters from the policies themselves, for one user or everyone.
+
+    A user with no policies gets a zeroed document. Versions are read before
+    counting, and a user whose counters were bumped while the count ran is
+    counted again, so a concurrent record_new_policies is never overwritten.
+    Returns the number of users whose counters were rewritten.
+    """
+    match = {"user_id": user_id} if user_id is not None else {}
+    stale = {"_id": user_id} if user_id is not None else {}
+    versions = {stats["_id"]: stats.get("version") for stats in stats_collection.find(stale, {"version": 1})}
+    counts = {user_id: dict(EMPTY_STATS)} if user_id is not None else {}
+    # Users whose policies are all gone keep an empty counter document
+    counts.update((stats_id, dict(EMPTY_STATS)) for stats_id in versions)
+    for stats in policies_collection.aggregate(_count_pipeline(match)):
+        counts[stats.pop("_id")] = stats
+
+    rewritten = 0
+    for stats_id, stats in counts.items():
+        version = versions.get(stats_id)
+        for _ in range(attempts):
+            if _write_counts(stats_collection, stats_id, stats, version):
+                rewritten += 1
+                break
+            current = stats_collection.find_one({"_id": stats_id}, {"version": 1})
+            version = current.get("version") if current else None
+            stats = next(policies_collection.aggregate(_count_pipeline({"user_id": stats_id})), None) or dict(EMPTY_STATS)
+            stats.pop("_id", None)
+    return rewritten